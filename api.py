@@ -0,0 +1,190 @@
+"""`/api/recommendations` 的分頁、欄位選取與串流輸出，只讀取現成的快照；
+`/api/changes` 的版本化變動紀錄。
+
+同步（Flask，app.py）與非同步（aiohttp，async_app.py）入口共用這裡的邏輯。
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+
+from details import DETAIL_FIELDS
+from formulas import FORMULAS
+from similar import book_id
+from table import FIELDS
+
+DEFAULT_LIMIT = 20
+# 超過這個數量改以 NDJSON 串流輸出，不在記憶體中組出整份回應
+STREAM_THRESHOLD = 200
+MAX_LIMIT = 100_000
+# 串流時每次轉換的列數
+STREAM_CHUNK = 500
+ALL_FIELDS = FIELDS + ('score',)
+# 只在 fields 指定時輸出：/similar/<id> 用的書籍 id、商品頁網址、合併多家書店時各店的名次與
+# details.py 補上的細節（還沒抓到時為 null；isbn 沒抓到時改用排行榜上的 ISBN）
+EXTRA_FIELDS = ('id', 'url', 'stores') + DETAIL_FIELDS
+# /api/changes 最多等待新版本的秒數
+MAX_WAIT = 30
+
+
+class ApiError(Exception):
+    """請求參數錯誤，status 為要回傳的 HTTP 狀態碼。"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def dumps(obj):
+    """JSON 回應的內容，格式與 app.py 的 jsonify 相同（排序鍵、ASCII 跳脫、緊湊、結尾換行）。"""
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n'
+
+
+def encode_cursor(digest, offset):
+    raw = f'{digest}:{offset}'.encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, digest):
+    """解出游標中的 offset；游標屬於舊快照時回傳 410。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        cursor_digest, offset = raw.rsplit(':', 1)
+        offset = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ApiError(400, 'invalid cursor') from None
+    if offset < 0:
+        raise ApiError(400, 'invalid cursor')
+    if cursor_digest != digest:
+        raise ApiError(410, 'snapshot changed, restart from the first page')
+    return offset
+
+
+class Query:
+    """解析並驗證後的 API 參數；details 為提供 get(url) 與 version 的 details.Enricher。"""
+
+    def __init__(self, snapshot, args, details=None):
+        self.snapshot = snapshot
+        self.details = details
+        self.formula = args.get('formula') or 'default'
+        if self.formula not in FORMULAS:
+            raise ApiError(400, f'unknown formula: {self.formula}')
+        try:
+            self.limit = int(args.get('limit') or DEFAULT_LIMIT)
+            self.offset = int(args.get('offset') or 0)
+        except ValueError:
+            raise ApiError(400, 'limit and offset must be integers') from None
+        if not 1 <= self.limit <= MAX_LIMIT or self.offset < 0:
+            raise ApiError(400, f'limit must be 1..{MAX_LIMIT} and offset >= 0')
+        if args.get('cursor'):
+            self.offset = decode_cursor(args['cursor'], snapshot.digest)
+        fields = args.get('fields')
+        self.fields = tuple(f for f in fields.split(',') if f) if fields else ALL_FIELDS
+        unknown = set(self.fields) - set(ALL_FIELDS + EXTRA_FIELDS)
+        if unknown:
+            raise ApiError(400, f'unknown fields: {", ".join(sorted(unknown))}')
+        self.stream = self.limit > STREAM_THRESHOLD or \
+            args.get('format') == 'ndjson'
+
+    @property
+    def total(self):
+        return len(self.snapshot.table)
+
+    @property
+    def end(self):
+        return min(self.offset + self.limit, self.total)
+
+    @property
+    def next_cursor(self):
+        if self.end >= self.total:
+            return None
+        return encode_cursor(self.snapshot.digest, self.end)
+
+    @property
+    def etag(self):
+        """由快照內容版本與查詢參數組成的強 ETag。"""
+        parts = [self.snapshot.digest, self.formula, str(self.offset),
+                 str(self.limit), ','.join(self.fields),
+                 'ndjson' if self.stream else 'json']
+        if self.details is not None and set(self.fields) & set(DETAIL_FIELDS):
+            parts.append(str(self.details.version))
+        key = '|'.join(parts)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def items(self, start, stop):
+        scores, order = self.snapshot.ranked(self.formula)
+        table = self.snapshot.table
+        indices = order[start:stop]
+        books = table.rows(indices, scores)
+        if not set(self.fields) & set(DETAIL_FIELDS + ('id', 'stores')):
+            return [book.to_dict(self.fields) for book in books]
+        rows = []
+        for i, book in zip(indices.tolist(), books):
+            detail = (self.details and self.details.get(book.url)) or {}
+            row = {}
+            for f in self.fields:
+                if f == 'isbn':
+                    row[f] = detail.get(f) or book.isbn
+                elif f in DETAIL_FIELDS:
+                    row[f] = detail.get(f)
+                elif f == 'stores':
+                    row[f] = table.store_ranks(i)
+                elif f == 'id':
+                    row[f] = book_id(book.title, book.author)
+                else:
+                    row[f] = getattr(book, f)
+            rows.append(row)
+        return rows
+
+    def page(self):
+        """回傳一般 JSON 回應的內容。"""
+        return {
+            'version': self.snapshot.digest,
+            # 之後以 /api/changes?since=<snapshot> 取得這份清單之後的變動
+            'snapshot': self.snapshot.version,
+            'formula': self.formula,
+            'offset': self.offset,
+            'limit': self.limit,
+            'total': self.total,
+            'items': self.items(self.offset, self.end),
+            'next_cursor': self.next_cursor,
+        }
+
+    def iter_ndjson(self):
+        """逐塊產生 NDJSON：每本書一行，最後一行為分頁資訊。"""
+        for start in range(self.offset, self.end, STREAM_CHUNK):
+            rows = self.items(start, min(start + STREAM_CHUNK, self.end))
+            yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        yield json.dumps({'next_cursor': self.next_cursor, 'total': self.total}) + '\n'
+
+
+def changes_args(feed, args):
+    """解析 /api/changes 的參數，回傳 (since, wait)；since 預設為目前版本。"""
+    try:
+        since = int(args['since']) if args.get('since') else feed.version
+        wait = float(args.get('wait') or 0)
+    except ValueError:
+        raise ApiError(400, 'since must be an integer and wait a number') from None
+    if since < 0 or not 0 <= wait <= MAX_WAIT:
+        raise ApiError(400, f'since must be >= 0 and wait 0..{MAX_WAIT}')
+    return since, wait
+
+
+def changes_since(feed, args):
+    """回傳 since 版本之後的各次變動；wait 秒內沒有新版本時回傳空列表。"""
+    since, wait = changes_args(feed, args)
+    return changes_page(feed, since, wait)
+
+
+def changes_page(feed, since, wait=0):
+    """回傳 since 之後的變動；wait 大於 0 時在這個執行緒等待新版本。"""
+    entries = feed.since(since, wait)
+    if entries is None:
+        raise ApiError(410, 'changes are no longer available, reload /api/recommendations')
+    return {
+        'since': since,
+        'version': entries[-1]['version'] if entries else since,
+        'changes': entries,
+    }
@@ -1,29 +1,299 @@
-from flask import Flask, request, render_template_string
-from recommend import recommend
+import atexit
+import os
+import time
+
+import requests
+from flask import Flask, Response, abort, g, jsonify, request, url_for
+
+import metrics
+from api import ApiError, Query, changes_since
+from pages import cached_page, prerender
+from details import DEFAULT_ROOT as DETAILS_ROOT, DetailCache, Enricher
+from formulas import FORMULAS
+import recommend
+from recommend import CACHE_TTL, get_history, load_table, upstream_stats
+from scheduler import RefreshScheduler
+from search import MappedSearchIndex, SearchIndex, publish_index
+from shared import SharedSnapshotScheduler
+from stores import table_loader
+from upstream import UpstreamError
+from similar import DEFAULT_PATH as SIMILAR_PATH, SimilarIndex, book_id
 
 app = Flask(__name__)
+# 與 async_app.py 的 api.dumps 輸出相同的 JSON（jsonify 預設已排序鍵並跳脫為 ASCII），除錯模式下也不縮排
+app.json.compact = True
+# 設為 False 可停用背景更新（例如測試時自行呼叫 scheduler.refresh()）
+app.config.setdefault("REFRESH_IN_BACKGROUND", True)
+# 多 worker 部署時設定 BOOKS_SNAPSHOT_DIR，所有 worker 共用同一份 mmap 快照，
+# 每個更新週期只有一個 worker 會向上游抓取
+SNAPSHOT_DIR = os.environ.get("BOOKS_SNAPSHOT_DIR")
+# 搜尋索引累積所有看過的書；啟動時先載入歷史資料庫，之後每份新快照增量加入
+search_index = SearchIndex()
+_search_seeded = False
+
+def index_snapshot(snapshot):
+    global _search_seeded
+    if not _search_seeded:
+        _search_seeded = True
+        if recommend.HISTORY_DB:
+            try:
+                search_index.add_books(get_history().latest_books())
+            except Exception as e:
+                app.logger.warning("載入搜尋歷史失敗: %s", e)
+    search_index.add_table(snapshot.table)
+
+# 每份新快照在背景補上商品頁細節，只抓沒看過或過期的；設 BOOKS_DETAILS_DIR= 可停用。
+# 共用快照模式下只由發布快照的 worker 抓取，其他 worker 從快取檔案讀取
+DETAILS_DIR = os.environ.get("BOOKS_DETAILS_DIR", DETAILS_ROOT)
+enricher = Enricher(DetailCache(DETAILS_DIR), shared=bool(SNAPSHOT_DIR)) if DETAILS_DIR else None
+if enricher is not None:
+    atexit.register(enricher.close)
+
+def publish_search(table, version):
+    """共用快照模式下只在發布快照的 worker 執行：把新快照的書加入上一版的搜尋索引檔。"""
+    try:
+        previous = MappedSearchIndex(scheduler.file_path("search", version - 1))
+        books = table.rows(range(len(table)))
+    except (OSError, ValueError):
+        # 第一次發布或上一版不見了，從歷史資料庫重建
+        previous, books = None, list(table.rows(range(len(table))))
+        if recommend.HISTORY_DB:
+            try:
+                books = list(get_history().latest_books()) + books
+            except Exception as e:
+                app.logger.warning("載入搜尋歷史失敗: %s", e)
+    publish_index(scheduler.file_path("search", version), books, previous)
+
+def on_publish(table, version):
+    """共用快照模式下只在發布快照的 worker 執行的工作。"""
+    if enricher is not None:
+        enricher.submit(table.url)
+    publish_search(table, version)
+
+_mapped_search = None
+
+def current_search_index():
+    """目前快照對應的搜尋索引；共用快照模式下以 mmap 開啟發布的索引檔，不存在時為 None。"""
+    global _mapped_search
+    snapshot = current_snapshot()
+    if not SNAPSHOT_DIR:
+        return search_index
+    index = _mapped_search
+    if index is None or index.version != snapshot.version:
+        try:
+            index = MappedSearchIndex(scheduler.file_path("search", snapshot.version))
+        except FileNotFoundError:
+            return None
+        index.version = snapshot.version
+        _mapped_search = index
+    return index
+
+def on_refresh(snapshot):
+    prerender(snapshot)
+    # 共用快照模式下搜尋索引與商品頁細節由發布的 worker 處理（on_publish），各 worker 不再各自進行
+    if not SNAPSHOT_DIR:
+        index_snapshot(snapshot)
+        if enricher is not None:
+            enricher.submit(snapshot.table.url)
+
+# similar.py 離線建立的相似書索引；換上新檔後下一個請求會改讀新檔
+SIMILAR_INDEX = os.environ.get("BOOKS_SIMILAR_INDEX", SIMILAR_PATH)
+_similar_index = None
+
+def similar_index():
+    """回傳以 mmap 開啟的相似書索引；還沒建立時為 None。"""
+    global _similar_index
+    try:
+        mtime = os.stat(SIMILAR_INDEX).st_mtime_ns
+    except OSError:
+        return None
+    index = _similar_index
+    if index is None or index.mtime != mtime:
+        index = SimilarIndex(SIMILAR_INDEX)
+        index.mtime = mtime
+        _similar_index = index
+    return index
+
+# 設定 BOOKS_STORES=books,<書店>,... 時合併多家書店的暢銷榜（見 stores.py）
+STORES = os.environ.get("BOOKS_STORES")
+loader = table_loader(STORES.split(",")) if STORES else load_table
+
+if SNAPSHOT_DIR:
+    scheduler = SharedSnapshotScheduler(SNAPSHOT_DIR, loader, interval=CACHE_TTL,
+                                        on_refresh=on_refresh, on_publish=on_publish)
+else:
+    scheduler = RefreshScheduler(loader, interval=CACHE_TTL, on_refresh=on_refresh)
+atexit.register(scheduler.stop)
 
-HTML_TEMPLATE = """
-<!doctype html>
-<title>Book Recommendations</title>
-<h1>Top Book Recommendations</h1>
-<form action="" method="get">
-  <label for="num">Number of recommendations:</label>
-  <input type="number" id="num" name="num" value="{{ num }}" min="1" max="20">
-  <input type="submit" value="Get Recommendations">
-</form>
-<ul>
-{% for b in books %}
-  <li>{{ loop.index }}. {{ b.title }} ({{ b.author }}) - Rank {{ b.rank }} | {{ b.discount }}折 {{ b.price }}元</li>
-{% endfor %}
-</ul>
-"""
+@app.before_request
+def ensure_scheduler():
+    # 延到第一個請求才啟動，pre-fork 的 WSGI 伺服器中每個 worker 各自啟動
+    if app.config["REFRESH_IN_BACKGROUND"]:
+        scheduler.ensure_running()
+
+@app.before_request
+def start_timing():
+    if metrics.ENABLED:
+        g.metrics_token = metrics.begin_request()
+        g.started = time.perf_counter()
+
+@app.after_request
+def add_server_timing(resp):
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        metrics.REQUEST_SECONDS.observe(request.endpoint or "unknown",
+                                        time.perf_counter() - g.started)
+        server_timing = metrics.end_request(token)
+        if server_timing:
+            resp.headers["Server-Timing"] = server_timing
+    return resp
+
+def current_snapshot():
+    # 還沒有快照時同步整理一次；同時到達的請求由 scheduler.refresh() 合併成一次抓取
+    snapshot = scheduler.current()
+    if snapshot is None:
+        try:
+            snapshot = scheduler.refresh()
+        except (UpstreamError, requests.RequestException):
+            # 剛啟動、上游又無法使用且沒有任何舊資料可用
+            abort(503)
+    return snapshot
 
 @app.route("/")
 def index():
     num = request.args.get("num", default=5, type=int)
-    books = recommend(num)
-    return render_template_string(HTML_TEMPLATE, books=books, num=num)
+    formula = request.args.get("formula", default="default")
+    # 只接受具名公式，避免任意運算式
+    if formula not in FORMULAS:
+        abort(400)
+    snapshot = current_snapshot()
+    body, etag = cached_page(snapshot, num, formula)
+    resp = Response(body, mimetype="text/html")
+    resp.set_etag(etag)
+    resp.last_modified = snapshot.refreshed_at
+    # 帶有相符 If-None-Match / If-Modified-Since 的請求回傳 304
+    return resp.make_conditional(request)
+
+@app.route("/api/recommendations")
+def api_recommendations():
+    """推薦書單的 JSON API，參數見 api.Query。"""
+    snapshot = current_snapshot()
+    try:
+        query = Query(snapshot, request.args, details=enricher)
+    except ApiError as e:
+        return jsonify(error=e.message), e.status
+    if query.stream:
+        resp = Response(query.iter_ndjson(), mimetype="application/x-ndjson")
+    else:
+        resp = jsonify(query.page())
+    resp.set_etag(query.etag)
+    resp.last_modified = snapshot.refreshed_at
+    if query.next_cursor:
+        args = request.args.to_dict()
+        args.pop("offset", None)
+        args["cursor"] = query.next_cursor
+        resp.headers["Link"] = f'<{url_for("api_recommendations", **args)}>; rel="next"'
+    return resp.make_conditional(request)
+
+@app.route("/api/changes")
+def api_changes():
+    """快照更新的變動紀錄：/api/changes?since=<版本>&wait=<秒數>"""
+    current_snapshot()
+    try:
+        return jsonify(changes_since(scheduler.changes, request.args))
+    except ApiError as e:
+        return jsonify(error=e.message), e.status
+
+@app.route("/stats")
+def stats():
+    index = similar_index()
+    searcher = current_search_index()
+    return jsonify(scheduler=scheduler.stats(),
+                   search=searcher.stats() if searcher is not None else None,
+                   upstream=upstream_stats(),
+                   details=enricher.stats() if enricher is not None else None,
+                   similar=index.stats() if index is not None else None)
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def collect_app_metrics():
+    lines = []
+    info = scheduler.stats()
+    lines += metrics.counter_lines("books_snapshot_version", "Current snapshot version.",
+                                   info["version"], "gauge")
+    lines += metrics.counter_lines("books_snapshot_rows", "Books in the current snapshot.",
+                                   info["rows"], "gauge")
+    lines += metrics.counter_lines("books_snapshot_refreshed_timestamp_seconds",
+                                   "When the current snapshot was built.",
+                                   info["refreshed_at"] or 0, "gauge")
+    lines += metrics.counter_lines("books_refresh_errors_total",
+                                   "Failed background refreshes.", info["errors"])
+    lines += metrics.counter_lines("books_refresh_coalesced_total",
+                                   "Refresh calls that waited for one already in flight.",
+                                   info["coalesced"])
+    upstream = upstream_stats()
+    lines += metrics.counter_lines("books_upstream_circuit_open",
+                                   "1 while the upstream circuit breaker is not closed.",
+                                   int(upstream.pop("circuit") != "closed"), "gauge")
+    upstream.pop("hedge_delay")
+    for name, value in upstream.items():
+        lines += metrics.counter_lines(f"books_upstream_{name}_total",
+                                       f"Upstream fetch {name}.", value)
+    return lines
+
+metrics.register_collector(collect_app_metrics)
+
+@app.route("/history")
+def history():
+    """查詢某本書最近 days 天的排名變化：/history?title=...&author=...&days=7"""
+    title = request.args.get("title")
+    author = request.args.get("author", default="")
+    days = request.args.get("days", default=7, type=float)
+    if not title:
+        abort(400)
+    # HISTORY_DB 設為 None 時不記錄歷史，也就沒有可查詢的資料
+    if not recommend.HISTORY_DB:
+        abort(404)
+    rows = get_history().book_history(title, author,
+                                      since=time.time() - days * 86400)
+    return jsonify([
+        {"taken_at": taken_at, "url": url, "rank": rank,
+         "discount": discount, "price": price}
+        for taken_at, url, rank, discount, price in rows
+    ])
+
+@app.route("/search")
+def search():
+    """以書名或作者的任意片段搜尋看過的書：/search?q=...&limit=20"""
+    q = request.args.get("q", default="").strip()
+    limit = request.args.get("limit", default=20, type=int)
+    if not q or not 1 <= limit <= 100:
+        abort(400)
+    index = current_search_index()
+    if index is None:
+        abort(503)
+    with metrics.timer("search"):
+        books = index.search(q, limit)
+    return jsonify([dict(book.to_dict(), id=book_id(book.title, book.author))
+                    for book in books])
+
+@app.route("/similar/<book>")
+def similar(book):
+    """與某本書最相似的書：/similar/<id>?limit=10，id 見 /search 或 API 的 id 欄位。"""
+    index = similar_index()
+    if index is None:
+        abort(503)
+    limit = request.args.get("limit", default=min(10, index.k), type=int)
+    if not 1 <= limit <= index.k:
+        abort(400)
+    result = index.similar(book, limit)
+    if result is None:
+        abort(404)
+    return jsonify(result)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000)
+    scheduler.start()
+    # 關閉 reloader，避免監看行程也啟動一份排程器
+    app.run(host="0.0.0.0", port=5000, use_reloader=False)
@@ -0,0 +1,114 @@
+"""以內容雜湊保存抓取到的原始排行榜頁面（gzip 壓縮）。
+
+相同內容的頁面只存一份：`<root>/<雜湊前兩碼>/<sha256>.html.gz`；
+每次抓取另在 `<root>/index.jsonl` 記錄網址、時間、雜湊與編碼。
+之後可用新版解析器離線、平行地重新解析所有歷史頁面：
+
+    python3 archive.py [--backend soup] [--workers 4]
+"""
+
+import argparse
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+import parsers
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+
+
+def page_digest(body):
+    """回傳頁面內容的 sha256 十六進位字串。"""
+    return hashlib.sha256(body).hexdigest()
+
+
+class PageArchive:
+    """以內容雜湊為檔名的壓縮頁面庫。"""
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest + '.html.gz')
+
+    def put(self, url, body, encoding='utf-8', fetched_at=None):
+        """保存頁面並記錄一次抓取，回傳內容雜湊；內容已存在時不重複寫入。"""
+        digest = page_digest(body)
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with gzip.open(tmp, 'wb') as f:
+                f.write(body)
+            os.replace(tmp, path)
+        entry = {
+            'url': url,
+            'fetched_at': time.time() if fetched_at is None else fetched_at,
+            'sha256': digest,
+            'encoding': encoding,
+        }
+        with self._lock, open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return digest
+
+    def get(self, digest):
+        """讀回頁面的原始位元組。"""
+        with gzip.open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def entries(self, url=None):
+        """依抓取順序產生索引紀錄，可依網址篩選。"""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if url is None or entry['url'] == url:
+                    yield entry
+
+    def pages(self):
+        """回傳不重複的 {sha256: encoding}。"""
+        return {entry['sha256']: entry['encoding'] for entry in self.entries()}
+
+    def reparse(self, backend='scan', workers=None, chunksize=8):
+        """以行程池重新解析所有保存的頁面，依序產生 (sha256, 書籍列表)。"""
+        pages = self.pages()
+        jobs = [(self.path(digest), encoding, backend)
+                for digest, encoding in pages.items()]
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            results = pool.map(_parse_archived, jobs, chunksize=chunksize)
+            yield from zip(pages, results)
+
+
+def _parse_archived(job):
+    path, encoding, backend = job
+    with gzip.open(path, 'rb') as f:
+        html = f.read().decode(encoding or 'utf-8', 'replace')
+    return parsers.BACKENDS[backend](html)
+
+
+def main(argv=None):
+    """離線重新解析歸檔中的所有頁面並列出每頁的書籍數。"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--root', default=DEFAULT_ROOT)
+    parser.add_argument('--backend', default='scan', choices=sorted(parsers.BACKENDS))
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+    archive = PageArchive(args.root)
+    total = 0
+    for digest, books in archive.reparse(args.backend, args.workers):
+        total += 1
+        print(f"{digest}  {len(books)} books")
+    print(f"{total} pages reparsed with {args.backend}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
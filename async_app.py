@@ -0,0 +1,261 @@
+"""以 aiohttp 在事件迴圈中提供與 app.py 相同的首頁、`/api/recommendations` 與 `/api/changes`。
+
+    python3 async_app.py [--host 0.0.0.0] [--port 8080]
+
+同步模式（app.py）每個連線都佔用一個執行緒，等待上游或長輪詢時執行緒就停在那裡；
+這裡的連線只是事件迴圈中的一個 coroutine：
+
+- 排行榜以 upstream.AsyncFetcher（aiohttp）非阻塞地下載，解析與建立快照交給執行緒池。
+- `/api/changes?wait=` 以 asyncio.Event 等待下一份快照，不佔用執行緒。
+- 快照、分頁與欄位選取（api.Query）、頁面渲染（pages.py）、商品頁細節（details.Enricher）
+  與 JSON 格式（api.dumps）都與同步模式共用。
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+
+from aiohttp import web
+
+import recommend
+from api import ApiError, Query, changes_args, changes_page, dumps
+from details import DEFAULT_ROOT as DETAILS_ROOT, DetailCache, Enricher
+from formulas import FORMULAS
+from pages import MAX_NUM, cached_page, prerender
+from scheduler import RefreshScheduler
+from upstream import AsyncFetcher
+
+log = logging.getLogger(__name__)
+
+# 與 app.py 相同：每份新快照在背景補上商品頁細節，設 BOOKS_DETAILS_DIR= 可停用
+DETAILS_DIR = os.environ.get('BOOKS_DETAILS_DIR', DETAILS_ROOT)
+
+
+class AsyncRefreshScheduler(RefreshScheduler):
+    """在事件迴圈中定期更新快照的排程器；同步的 refresh() 仍可使用（以 load_table 抓取）。"""
+
+    def __init__(self, fetcher, url=None, interval=recommend.CACHE_TTL, jitter=0.1,
+                 on_refresh=None):
+        super().__init__(recommend.load_table, url, interval, jitter, on_refresh)
+        self.fetcher = fetcher
+        self._task = None
+        self._updated = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def refresh_async(self):
+        """非阻塞地抓取一次並替換快照，回傳新的快照。"""
+        url = self.url or recommend.URL
+        books, fresh = await recommend.fetch_books_async(self.fetcher, url)
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(None, self._apply, books, url, fresh)
+        # 喚醒等待新版本的 /api/changes
+        updated, self._updated = self._updated, asyncio.Event()
+        if updated is not None:
+            updated.set()
+        return snapshot
+
+    def _apply(self, books, url, fresh):
+        table = recommend.make_table(books, url, fresh)
+        with self._lock:
+            self._version += 1
+            version = self._version
+        snapshot = self._build(table, version)
+        self._install(snapshot)
+        return snapshot
+
+    async def wait_for_version(self, version, timeout):
+        """等到有比 version 新的快照，最多 timeout 秒。"""
+        if self._updated is None:
+            self._updated = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.changes.version <= version and loop.time() < deadline:
+            try:
+                async with asyncio.timeout(deadline - loop.time()):
+                    await self._updated.wait()
+            except TimeoutError:
+                return
+
+    async def start_async(self, wait=True):
+        """啟動背景 task；wait=True 時先完成第一次整理（失敗時之後的請求回傳 503）。"""
+        if self.running:
+            return
+        if wait and self._snapshot is None:
+            await self._safe_refresh_async()
+        self._task = asyncio.create_task(self._run_async())
+
+    async def stop_async(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.fetcher.close()
+
+    async def _run_async(self):
+        while True:
+            await asyncio.sleep(self._next_delay())
+            await self._safe_refresh_async()
+
+    async def _safe_refresh_async(self):
+        try:
+            await self.refresh_async()
+        except Exception as e:
+            # 保留舊快照，下一輪再試
+            self._errors += 1
+            log.warning("排行榜更新失敗: %s", e)
+
+
+SCHEDULER = web.AppKey('scheduler', AsyncRefreshScheduler)
+ENRICHER = web.AppKey('enricher', Enricher)
+routes = web.RouteTableDef()
+
+
+def current_snapshot(request):
+    snapshot = request.app[SCHEDULER].current()
+    if snapshot is None:
+        raise web.HTTPServiceUnavailable(text='no snapshot yet')
+    return snapshot
+
+
+def conditional(request, resp, etag, last_modified):
+    """設定 ETag 與 Last-Modified；與 If-None-Match / If-Modified-Since 相符時改回 304。"""
+    resp.etag = etag
+    resp.last_modified = last_modified
+    if request.if_none_match is not None:
+        fresh = any(tag.value in (etag, '*') for tag in request.if_none_match)
+    else:
+        since = request.if_modified_since
+        fresh = since is not None and int(last_modified) <= since.timestamp()
+    if not fresh:
+        return resp
+    not_modified = web.Response(status=304)
+    not_modified.etag = etag
+    not_modified.last_modified = last_modified
+    return not_modified
+
+
+@routes.get('/')
+async def index(request):
+    try:
+        num = int(request.query.get('num', 5))
+    except ValueError:
+        num = 5
+    formula = request.query.get('formula', 'default')
+    # 只接受具名公式，避免任意運算式
+    if formula not in FORMULAS:
+        raise web.HTTPBadRequest()
+    snapshot = current_snapshot(request)
+    if 1 <= num <= MAX_NUM:
+        body, etag = cached_page(snapshot, num, formula)
+    else:
+        # 不快取的大頁面在執行緒池渲染，不卡住事件迴圈
+        loop = asyncio.get_running_loop()
+        body, etag = await loop.run_in_executor(None, cached_page, snapshot, num, formula)
+    resp = web.Response(body=body, content_type='text/html', charset='utf-8')
+    return conditional(request, resp, etag, snapshot.refreshed_at)
+
+
+@routes.get('/api/recommendations')
+async def api_recommendations(request):
+    """推薦書單的 JSON API，參數見 api.Query。"""
+    snapshot = current_snapshot(request)
+    try:
+        query = Query(snapshot, request.query, details=request.app[ENRICHER])
+    except ApiError as e:
+        return web.json_response({'error': e.message}, status=e.status, dumps=dumps)
+    headers = {}
+    if query.next_cursor:
+        args = dict(request.query)
+        args.pop('offset', None)
+        args['cursor'] = query.next_cursor
+        headers['Link'] = f'<{request.rel_url.with_query(args)}>; rel="next"'
+    if not query.stream:
+        resp = web.json_response(query.page(), dumps=dumps, headers=headers)
+        return conditional(request, resp, query.etag, snapshot.refreshed_at)
+    resp = conditional(request, web.StreamResponse(headers=headers), query.etag,
+                       snapshot.refreshed_at)
+    if resp.status == 304:
+        return resp
+    resp.content_type = 'application/x-ndjson'
+    await resp.prepare(request)
+    for chunk in query.iter_ndjson():
+        await resp.write(chunk.encode('utf-8'))
+    await resp.write_eof()
+    return resp
+
+
+@routes.get('/api/changes')
+async def api_changes(request):
+    """快照更新的變動紀錄：/api/changes?since=<版本>&wait=<秒數>"""
+    current_snapshot(request)
+    scheduler = request.app[SCHEDULER]
+    try:
+        since, wait = changes_args(scheduler.changes, request.query)
+        if wait:
+            await scheduler.wait_for_version(since, wait)
+        result = changes_page(scheduler.changes, since)
+    except ApiError as e:
+        return web.json_response({'error': e.message}, status=e.status, dumps=dumps)
+    return web.json_response(result, dumps=dumps)
+
+
+@routes.get('/stats')
+async def stats(request):
+    scheduler = request.app[SCHEDULER]
+    enricher = request.app[ENRICHER]
+    return web.json_response({'scheduler': scheduler.stats(),
+                              'upstream': scheduler.fetcher.stats(),
+                              'details': enricher.stats() if enricher is not None else None},
+                             dumps=dumps)
+
+
+def make_app(url=None, interval=recommend.CACHE_TTL, refresh=True, details_dir=DETAILS_DIR):
+    """建立 aiohttp 應用程式；refresh=False 時不在啟動時抓取（測試時自行呼叫 refresh_async）。
+
+    details_dir 為商品頁細節的快取目錄，None 或空字串時不補上細節。
+    """
+    enricher = Enricher(DetailCache(details_dir)) if details_dir else None
+
+    def on_refresh(snapshot):
+        prerender(snapshot)
+        if enricher is not None:
+            enricher.submit(snapshot.table.url)
+
+    scheduler = AsyncRefreshScheduler(AsyncFetcher(timeout=recommend.TIMEOUT), url, interval,
+                                      on_refresh=on_refresh)
+    app = web.Application()
+    app[SCHEDULER] = scheduler
+    app[ENRICHER] = enricher
+    app.add_routes(routes)
+
+    async def start(app):
+        if refresh:
+            await scheduler.start_async()
+
+    async def stop(app):
+        await scheduler.stop_async()
+        if enricher is not None:
+            enricher.close()
+
+    app.on_startup.append(start)
+    app.on_cleanup.append(stop)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='非同步模式的書籍推薦網站')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args(argv)
+    web.run_app(make_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""離線基準測試與測試用排行榜頁面。"""
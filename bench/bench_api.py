@@ -0,0 +1,43 @@
+"""量測 /api/recommendations 每次請求的耗時，確認不隨快照列數增加。
+
+用法：python -m bench.bench_api [列數 ...]
+"""
+
+import sys
+import time
+
+import app
+from bench.bench_table import make_books
+from table import BookTable
+
+
+def main(argv=None):
+    sizes = [int(a) for a in (argv if argv is not None else sys.argv[1:])] or \
+        [1_000, 100_000, 1_000_000]
+    app.app.config['REFRESH_IN_BACKGROUND'] = False
+    client = app.app.test_client()
+    repeat = 200
+    print(f"{'rows':>10}{'refresh s':>11}{'page 1 ms':>11}{'deep page ms':>14}{'fields ms':>11}")
+    for size in sizes:
+        table = BookTable.from_books(make_books(size))
+        app.scheduler.loader = lambda url: table
+        start = time.perf_counter()
+        app.scheduler.refresh()
+        refresh_time = time.perf_counter() - start
+        timings = []
+        for query in ('/api/recommendations?limit=20',
+                      f'/api/recommendations?limit=20&offset={size // 2}',
+                      '/api/recommendations?limit=20&fields=title,score'):
+            client.get(query)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                resp = client.get(query)
+            timings.append((time.perf_counter() - start) / repeat)
+            assert resp.status_code == 200
+        print(f"{size:>10}{refresh_time:>11.2f}" +
+              ''.join(f"{t * 1000:>{w}.3f}" for t, w in zip(timings, (11, 14, 11))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""比較同步（app.py，多執行緒 WSGI）與非同步（async_app.py，aiohttp）模式能同時撐住的連線數與每個連線的記憶體。
+
+用法：python -m bench.bench_async [連線數 ...]
+兩種模式各在獨立的子行程中執行，上游都指向同一個本機替身伺服器。對每個連線數：
+
+1. 開啟這麼多個 `/api/changes?wait=20` 長輪詢，讓每個連線都停在伺服器上；
+2. 讀取伺服器行程的 RSS 與執行緒數，與沒有連線時相比得出每個連線的記憶體；
+3. 在這些連線都還開著時，循序送出一般的 `/api/recommendations` 請求，量測延遲與錯誤數。
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from bench.bench_search import percentile
+from bench.server import StandInServer
+
+PROBES = 50
+# 長輪詢的等待秒數，要比量測一輪的時間長
+WAIT = 20
+
+
+def serve(mode, port, upstream):
+    """子行程：以指定模式啟動網站。"""
+    import recommend
+
+    recommend.HISTORY_DB = None
+    recommend.ARCHIVE_DIR = None
+    recommend.URL = upstream
+    if mode == 'sync':
+        from werkzeug.serving import make_server
+
+        import app
+        from bench.suite import QuietHandler
+
+        app.app.config['REFRESH_IN_BACKGROUND'] = False
+        app.enricher = None
+        app.scheduler.refresh()
+        make_server('127.0.0.1', port, app.app, threaded=True,
+                    request_handler=QuietHandler).serve_forever()
+    else:
+        from aiohttp import web
+
+        import async_app
+
+        web.run_app(async_app.make_app(interval=3600, details_dir=None), host='127.0.0.1', port=port,
+                    print=None, access_log=None, backlog=1024)
+
+
+def proc_status(pid):
+    fields = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            fields[name] = value.split()[:1]
+    return int(fields['VmRSS'][0]) * 1024, int(fields['Threads'][0])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def wait_ready(base):
+    async with aiohttp.ClientSession() as session:
+        for _ in range(200):
+            try:
+                async with session.get(base + '/api/recommendations?limit=1') as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f'{base} did not start')
+
+
+async def hold(session, url, opened):
+    try:
+        async with session.get(url) as resp:
+            opened.append(1)
+            await resp.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+
+
+async def measure(base, pid, count):
+    """開著 count 個長輪詢時的 (RSS, 執行緒數, 請求延遲, 錯誤數)。"""
+    timeout = aiohttp.ClientTimeout(total=60)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        opened = []
+        tasks = [asyncio.create_task(hold(session, base + f'/api/changes?wait={WAIT}', opened))
+                 for _ in range(count)]
+        # 等到伺服器接受了所有連線（執行緒數或 RSS 不再變化）
+        previous = None
+        for _ in range(100):
+            await asyncio.sleep(0.2)
+            status = proc_status(pid)
+            if status == previous:
+                break
+            previous = status
+        rss, threads = proc_status(pid)
+        times, errors = [], 0
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as probe:
+            for _ in range(PROBES):
+                start = time.perf_counter()
+                try:
+                    async with probe.get(base + '/api/recommendations?limit=20') as resp:
+                        await resp.read()
+                        errors += resp.status != 200
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                times.append(time.perf_counter() - start)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return rss, threads, times, errors
+
+
+async def run_mode(mode, counts, upstream):
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, '-m', 'bench.bench_async', '--serve', mode,
+                             '--port', str(port), '--upstream', upstream])
+    base = f'http://127.0.0.1:{port}'
+    try:
+        await wait_ready(base)
+        base_rss, base_threads = proc_status(proc.pid)
+        print(f"{mode}: idle RSS {base_rss / 2 ** 20:.1f} MiB, {base_threads} threads")
+        for count in counts:
+            rss, threads, times, errors = await measure(base, proc.pid, count)
+            per_conn = (rss - base_rss) / count
+            print(f"  {count:5d} conns: RSS {rss / 2 ** 20:7.1f} MiB "
+                  f"({per_conn / 1024:6.1f} KiB/conn), {threads:5d} threads, "
+                  f"probe p50 {percentile(times, 0.5) * 1000:6.1f}ms "
+                  f"p99 {percentile(times, 0.99) * 1000:7.1f}ms, {errors} errors")
+            # 同步模式的執行緒要等長輪詢逾時才會結束，等它們釋放後再量下一輪
+            for _ in range(WAIT + 5):
+                if proc_status(proc.pid)[1] <= base_threads + 1:
+                    break
+                await asyncio.sleep(1)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('counts', nargs='*', type=int, default=[100, 500, 1000, 2000])
+    parser.add_argument('--serve', choices=['sync', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--upstream', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.serve:
+        serve(args.serve, args.port, args.upstream)
+        return
+    with StandInServer(latency=0.02) as server:
+        upstream = server.url('/web/sys_saletopb/books/')
+        print(f"{os.cpu_count()} CPU cores, {PROBES} probe requests per level")
+        for mode in ('sync', 'async'):
+            asyncio.run(run_mode(mode, args.counts, upstream))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""量測 recommend.py 批次模式在不同 worker 數下的吞吐量。
+
+用法：python -m bench.bench_batch [頁面數] [worker 數 ...]
+在暫存目錄產生頁面數個 500 本書的排行榜頁面，預設比較 1 到 CPU 核心數個 worker。
+解析是 CPU 密集的工作，吞吐量應大致隨核心數線性增加。
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import recommend
+from bench.fixtures import ranking_page
+
+
+def write_pages(directory, count):
+    for i in range(count):
+        path = os.path.join(directory, f'page_{i:05d}.html')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(ranking_page(500, seed=i % 50))
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    count = int(argv[0]) if argv else 400
+    cores = os.cpu_count() or 1
+    workers = [int(w) for w in argv[1:]] or sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    with tempfile.TemporaryDirectory() as directory:
+        write_pages(directory, count)
+        print(f"{count} pages of 500 books, {cores} CPU cores")
+        baseline = None
+        for n in workers:
+            start = time.perf_counter()
+            lines = sum(1 for _ in recommend.score_files(
+                recommend.expand_paths([directory]), workers=n))
+            elapsed = time.perf_counter() - start
+            assert lines == count
+            rate = count / elapsed
+            baseline = baseline or rate
+            print(f"  {n:2d} workers: {rate:8.1f} pages/s  x{rate / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    main()
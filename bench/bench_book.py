@@ -0,0 +1,46 @@
+"""比較每本書一個字典與 Book 紀錄的記憶體用量。
+
+用法：python -m bench.bench_book [書籍數]
+以 tracemalloc 量測建立紀錄本身配置的位元組；欄位值（字串、整數）在兩種作法間共用，不計入。
+"""
+
+import sys
+import tracemalloc
+
+from book import Book
+
+
+def measure(build, count, values):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [build(*values[i % len(values)]) for i in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del records
+    return used
+
+
+def as_dict(rank, title, author, discount, price, score):
+    # 原本 fetch_books() 的字典，recommend() 再加上 score
+    book = {'rank': rank, 'title': title, 'author': author,
+            'discount': discount, 'price': price}
+    book['score'] = score
+    return book
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    count = int(argv[0]) if argv else 1_000_000
+    values = [(i % 100 + 1, f'書名{i}', f'作者{i % 97}', 79, 474, 8000 + i)
+              for i in range(1000)]
+    results = {'dict': measure(as_dict, count, values),
+               'Book': measure(Book, count, values)}
+    print(f"{count} books")
+    for name, used in results.items():
+        print(f"{name:>5}: {used / count:7.1f} bytes/book  {used / 2**20:8.1f} MiB total")
+    print(f"saved {1 - results['Book'] / results['dict']:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""比較新快照從頭評分排序與依差異修補排序的耗時。
+
+用法：python -m bench.bench_changes [書籍數] [變動書數]
+上一份快照已算好所有具名公式；新快照只有少數書的折扣或價格改變。
+"""
+
+import random
+import sys
+import time
+
+import numpy as np
+
+from bench.bench_table import make_books
+from changes import Diff
+from formulas import FORMULAS
+from scheduler import Snapshot
+from table import BookTable
+
+
+def changed_books(books, count, seed=1):
+    rng = random.Random(seed)
+    books = [book.with_score(None) for book in books]
+    for i in rng.sample(range(len(books)), count):
+        books[i].discount = rng.randint(50, 99)
+        books[i].price = rng.randint(100, 900)
+    return books
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    count = int(argv[0]) if argv else 100_000
+    changed = int(argv[1]) if len(argv) > 1 else 10
+    previous = Snapshot(BookTable.from_books(make_books(count)), 1, None)
+    for formula in FORMULAS:
+        previous.ranked(formula)
+    table = BookTable.from_books(changed_books(previous.table.to_books(), changed))
+
+    full, _ = timed(lambda: [Snapshot(table, 2, None).ranked(f) for f in FORMULAS])
+    diff_time, diff = timed(lambda: Diff(previous.table, table))
+    patch_time, patched = timed(lambda: {
+        f: diff.patch_ranking(previous.ranked(f), table, f) for f in FORMULAS})
+    reference = Snapshot(table, 2, None)
+    for formula, result in patched.items():
+        scores, order = reference.ranked(formula)
+        assert result is not None and np.array_equal(result[1], order), formula
+
+    print(f"{count} books, {changed} changed, {len(diff.events)} events, "
+          f"{len(FORMULAS)} formulas")
+    print(f"  full rescore + sort: {full * 1000:8.2f}ms")
+    print(f"  diff:                {diff_time * 1000:8.2f}ms")
+    print(f"  patch rankings:      {patch_time * 1000:8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
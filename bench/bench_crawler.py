@@ -0,0 +1,36 @@
+"""比較逐一抓取與 crawler 並行抓取多個排行榜的耗時。
+
+用法：python -m bench.bench_crawler [網址數] [延遲秒數]
+"""
+
+import sys
+import time
+
+import crawler
+import recommend
+from bench.server import StandInServer
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    count = int(argv[0]) if argv else 38
+    latency = float(argv[1]) if len(argv) > 1 else 0.2
+    with StandInServer(latency=latency) as server:
+        urls = crawler.ranking_urls(base_url=server.url('/web/sys_saletopb/books/'))[:count]
+
+        start = time.perf_counter()
+        sequential = crawler.merge_books(recommend.fetch_books(url) for url in urls)
+        seq_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        merged, errors = crawler.crawl_books(urls, concurrency=16, per_host_rate=0)
+        crawl_time = time.perf_counter() - start
+
+    print(f"{len(urls)} pages, {latency * 1000:.0f} ms latency each")
+    print(f"sequential: {seq_time:.2f}s  {len(sequential)} books")
+    print(f"crawler:    {crawl_time:.2f}s  {len(merged)} books  {len(errors)} errors")
+    return 0 if merged == sequential and not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""比較逐一抓取商品頁與 details.Enricher 的並行抓取，以及快取命中後的第二次更新。
+
+用法：python -m bench.bench_enrich [書籍數] [每頁延遲秒數] [並行數]
+替身伺服器的排行榜連結指向自己的 /products/<pid>，每個商品頁約 24 KB。
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import recommend
+from bench.server import StandInServer
+from details import DetailCache, Enricher, parse_detail
+
+
+def sequential(urls):
+    """原本可能的作法：一頁一頁下載並解析。"""
+    for url in urls:
+        resp = recommend.session.get(url, timeout=recommend.TIMEOUT)
+        resp.raise_for_status()
+        parse_detail(resp.text)
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    books = int(argv[0]) if argv else 200
+    latency = float(argv[1]) if len(argv) > 1 else 0.05
+    concurrency = int(argv[2]) if len(argv) > 2 else 16
+    with StandInServer(latency=latency, books_per_page=books) as server, \
+            tempfile.TemporaryDirectory() as root:
+        resp = recommend.session.get(server.url('/web/sys_saletopb/books/'))
+        urls = [book.url for book in recommend.parse_books(resp.text)]
+        print(f"{len(urls)} detail pages, {latency * 1000:.0f}ms latency, "
+              f"{os.cpu_count()} CPU cores")
+        start = time.perf_counter()
+        sequential(urls)
+        base = time.perf_counter() - start
+        print(f"  sequential:          {base:6.2f}s")
+        enricher = Enricher(DetailCache(root), concurrency=concurrency, per_host_rate=None)
+        try:
+            for label in (f'enricher (c={concurrency}):', 'enricher, cached:'):
+                start = time.perf_counter()
+                enricher.enrich(urls)
+                elapsed = time.perf_counter() - start
+                print(f"  {label:<20} {elapsed:6.2f}s  x{base / elapsed:.1f}")
+            print(enricher.stats())
+        finally:
+            enricher.close()
+
+
+if __name__ == '__main__':
+    main()
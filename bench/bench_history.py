@@ -0,0 +1,56 @@
+"""量測排行榜歷史資料庫的寫入與走勢查詢速度。
+
+用法：python -m bench.bench_history [天數]
+模擬每小時一份、每份 100 本書的快照。
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from book import Book
+from history import HistoryStore
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    days = int(argv[0]) if argv else 90
+    rnd = random.Random(0)
+    catalog = [(f'書名{i}', f'作者{i % 50}') for i in range(400)]
+    start_at = time.time() - days * 86400
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, 'history.sqlite3'))
+        write_times = []
+        snapshot_ids = []
+        for hour in range(days * 24):
+            books = [Book(rank, title, author, rnd.randint(50, 100), rnd.randint(100, 900))
+                     for rank, (title, author) in enumerate(rnd.sample(catalog, 100), 1)]
+            t = time.perf_counter()
+            snapshot_ids.append(store.record(books, 'bench', taken_at=start_at + hour * 3600))
+            write_times.append(time.perf_counter() - t)
+
+        def timed(fn, repeat=50):
+            t = time.perf_counter()
+            for _ in range(repeat):
+                result = fn()
+            return result, (time.perf_counter() - t) / repeat
+
+        week, week_time = timed(lambda: store.book_history(
+            *catalog[0], since=time.time() - 7 * 86400))
+        full, full_time = timed(lambda: store.book_history(*catalog[0]))
+        top, top_time = timed(lambda: store.snapshot_books(snapshot_ids[-1], limit=10))
+        store.close()
+
+    write_times.sort()
+    print(f"{len(snapshot_ids)} snapshots x 100 books")
+    print(f"record():                  median {write_times[len(write_times) // 2] * 1000:.2f} ms")
+    print(f"book_history(7 days):      {week_time * 1000:.2f} ms ({len(week)} rows)")
+    print(f"book_history(all {days} days): {full_time * 1000:.2f} ms ({len(full)} rows)")
+    print(f"snapshot_books(top 10):    {top_time * 1000:.2f} ms ({len(top)} rows)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
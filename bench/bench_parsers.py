@@ -0,0 +1,49 @@
+"""比較各解析後端的結果是否一致，並量測每頁解析時間。
+
+用法：python -m bench.bench_parsers [頁面檔案 ...]
+未指定檔案時使用 bench/pages/*.html。
+"""
+
+import glob
+import os
+import sys
+import timeit
+
+import parsers
+from bench.fixtures import PAGES_DIR
+
+
+def bench_page(html, repeat=5):
+    """回傳 {後端名稱: (書籍列表, 最佳單次解析秒數)}。"""
+    results = {}
+    for name, parse in parsers.BACKENDS.items():
+        books = parse(html)
+        timer = timeit.Timer(lambda: parse(html))
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        results[name] = (books, best)
+    return results
+
+
+def main(argv=None):
+    paths = (argv if argv is not None else sys.argv[1:]) or \
+        sorted(glob.glob(os.path.join(PAGES_DIR, '*.html')))
+    reference = 'soup'
+    mismatches = 0
+    print(f"{'page':<24}{'backend':<8}{'books':>7}{'ms/page':>10}{'speedup':>9}  parity")
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        results = bench_page(html)
+        ref_books, ref_time = results[reference]
+        for name, (books, best) in results.items():
+            same = books == ref_books
+            mismatches += not same
+            print(f"{os.path.basename(path):<24}{name:<8}{len(books):>7}"
+                  f"{best * 1000:>10.2f}{ref_time / best:>8.1f}x  "
+                  f"{'ok' if same else 'MISMATCH'}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
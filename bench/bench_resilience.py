@@ -0,0 +1,83 @@
+"""在會注入故障的替身伺服器上，比較直接請求與 upstream.ResilientFetcher 的延遲與可用性。
+
+用法：python -m bench.bench_resilience [每階段請求數] [停滯秒數]
+依序經過正常、長尾延遲、全面 503、全面停滯與恢復五個階段，每階段循序呼叫 fetch_books()。
+為了讓示範在一分鐘內跑完，期限與斷路器冷卻時間都比 recommend.py 的預設值短。
+"""
+
+import sys
+import time
+
+import recommend
+from bench.server import StandInServer
+from upstream import CircuitBreaker, ResilientFetcher
+
+
+def plain_fetch(url):
+    """原本的作法：單次請求，失敗就拋出例外。"""
+    resp = recommend.session.get(url, timeout=recommend.TIMEOUT)
+    resp.raise_for_status()
+    return recommend.parse_books(resp.text)
+
+
+def run_phase(fetch, count):
+    times, errors = [], 0
+    fallbacks = recommend._fallbacks
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            fetch()
+        except Exception:
+            errors += 1
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        'ok': count - errors - (recommend._fallbacks - fallbacks),
+        'fallback': recommend._fallbacks - fallbacks,
+        'errors': errors,
+        'p50': times[len(times) // 2],
+        'p99': times[min(len(times) - 1, int(len(times) * 0.99))],
+        'max': times[-1],
+    }
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    count = int(argv[0]) if argv else 20
+    stall = float(argv[1]) if len(argv) > 1 else 2.0
+    phases = [
+        ('healthy', dict(latency=0.01, slow_rate=0.0, error_rate=0.0)),
+        ('tail 10%', dict(latency=0.01, slow_rate=0.1, slow_latency=stall)),
+        ('all 503', dict(latency=0.01, slow_rate=0.0, error_rate=1.0)),
+        ('stalled', dict(latency=0.01, slow_rate=1.0, error_rate=0.0)),
+        ('recovered', dict(latency=0.01, slow_rate=0.0, error_rate=0.0)),
+    ]
+    recommend.ARCHIVE_DIR = None
+    recommend.upstream = ResilientFetcher(
+        recommend.session, timeout=recommend.TIMEOUT, attempt_deadline=0.5, deadline=1.5,
+        breaker=CircuitBreaker(failure_threshold=5, reset_timeout=1.0))
+    with StandInServer(slow_latency=stall) as server:
+        url = server.url('/web/sys_saletopb/books/')
+        modes = {
+            'plain': lambda: plain_fetch(url),
+            'resilient': lambda: recommend.fetch_books(url),
+        }
+        print(f"{count} sequential fetches per phase, stalls last {stall}s")
+        print(f"{'phase':>10} {'mode':>10} {'ok':>4} {'stale':>5} {'err':>4} "
+              f"{'p50':>8} {'p99':>8} {'max':>8}")
+        for name, settings in phases:
+            for mode, fetch in modes.items():
+                for key, value in settings.items():
+                    setattr(server, key, value)
+                if name == 'recovered' and mode == 'resilient':
+                    # 等斷路器冷卻後才會送出試探請求
+                    time.sleep(recommend.upstream.breaker.reset_timeout)
+                r = run_phase(fetch, count)
+                print(f"{name:>10} {mode:>10} {r['ok']:4d} {r['fallback']:5d} {r['errors']:4d} "
+                      f"{r['p50'] * 1000:7.1f}ms {r['p99'] * 1000:7.1f}ms "
+                      f"{r['max'] * 1000:7.1f}ms")
+        print(recommend.upstream_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""量測 n-gram 搜尋索引的建立時間、記憶體與查詢延遲。
+
+用法：python -m bench.bench_search [書籍數] [查詢次數]
+書名由常用漢字依 Zipf 分布隨機組成，查詢取自既有書名或作者的 1–4 字片段。
+"""
+
+import itertools
+import random
+import resource
+import sys
+import time
+
+from book import Book
+from search import SearchIndex
+
+# 依頻率大致排序的常用字，越前面越常出現
+_CHARS = [chr(0x4E00 + i) for i in range(3000)]
+_CUM_WEIGHTS = list(itertools.accumulate(1 / (i + 1) for i in range(len(_CHARS))))
+
+
+def make_books(count, seed=0):
+    rng = random.Random(seed)
+    authors = [''.join(rng.choices(_CHARS, cum_weights=_CUM_WEIGHTS, k=3)) for _ in range(count // 20 + 1)]
+    books = []
+    for i in range(count):
+        title = ''.join(rng.choices(_CHARS, cum_weights=_CUM_WEIGHTS, k=rng.randint(4, 14)))
+        books.append(Book(i % 100 + 1, title, rng.choice(authors), 79, 300 + i % 500))
+    return books
+
+
+def make_queries(books, count, seed=1):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        book = rng.choice(books)
+        text = book.title if rng.random() < 0.8 else book.author
+        size = min(rng.choice((1, 2, 2, 3, 3, 4)), len(text))
+        start = rng.randrange(len(text) - size + 1)
+        queries.append(text[start:start + size])
+    return queries
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    count = int(argv[0]) if argv else 1_000_000
+    rounds = int(argv[1]) if len(argv) > 1 else 2000
+    books = make_books(count)
+    queries = make_queries(books, rounds)
+
+    index = SearchIndex()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    index.add_books(books)
+    built = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    # 第二份快照只更新已知的書
+    start = time.perf_counter()
+    index.add_books(books[:1000])
+    update = time.perf_counter() - start
+
+    samples = {1: [], 2: []}
+    hits = 0
+    for q in queries:
+        start = time.perf_counter()
+        hits += bool(index.search(q))
+        samples[min(len(q), 2)].append(time.perf_counter() - start)
+
+    info = index.stats()
+    print(f"{count} books: build {built:.1f}s (peak +{peak / 1024:.0f} MiB), "
+          f"{info['segments']} segments, {info['postings']} postings "
+          f"({info['bytes'] / 2**20:.0f} MiB)")
+    print(f"re-index 1000 known books: {update * 1000:.1f}ms")
+    for size, label in ((1, '1 char'), (2, '2+ chars')):
+        times = samples[size]
+        if times:
+            print(f"{label:>8}: {len(times):5d} queries  "
+                  f"p50 {percentile(times, 0.5) * 1000:6.2f}ms  "
+                  f"p99 {percentile(times, 0.99) * 1000:6.2f}ms")
+    print(f"{hits}/{len(queries)} queries found at least one book")
+
+
+if __name__ == '__main__':
+    main()
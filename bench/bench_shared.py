@@ -0,0 +1,123 @@
+"""比較每個 worker 各自保存快照與共用 mmap 快照檔時的記憶體用量。
+
+用法：python -m bench.bench_shared [列數] [worker 數 ...]
+以 /proc/self/smaps_rollup 的 Pss（共用頁面依行程數均分）計算，僅支援 Linux。
+各 worker 先載入第一版、量一次，接著發布少數書折扣改變的第二版，
+worker 與第一版比對後再量一次，確認比對變動不會讓每個 worker 各自解碼出整份文字。
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+
+from bench.bench_changes import changed_books
+from bench.bench_table import make_books
+from scheduler import Snapshot
+from table import BookTable
+
+# 第二版中折扣或價格改變的書數
+CHANGED = 100
+
+
+def versions(rows):
+    """依序回傳第一版與第二版的 BookTable。"""
+    books = make_books(rows)
+    yield BookTable.from_books(books)
+    yield BookTable.from_books(changed_books(books, CHANGED))
+
+
+def pss_kib():
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1])
+    return 0
+
+
+def worker(mode, rows, directory, barrier, results):
+    import shared
+
+    before = pss_kib()
+    if mode == 'private':
+        # 模擬每個 worker 自己抓取、解析並保存一份資料
+        tables = versions(rows)
+        snapshot = Snapshot(next(tables), 1, None)
+    else:
+        scheduler = shared.SharedSnapshotScheduler(directory, loader=None)
+        snapshot = scheduler.current()
+    for n in (5, 20, 100):
+        snapshot.recommend(n)
+    # 等所有 worker 都載入後再量，共用頁面才會被均分
+    barrier.wait()
+    first = pss_kib() - before
+    barrier.wait()
+    # 主行程在這兩個 barrier 之間發布第二版
+    barrier.wait()
+    if mode == 'private':
+        snapshot = Snapshot.after(snapshot, next(tables), 2, None)
+    else:
+        # 代替背景執行緒檢查版本計數器
+        snapshot = scheduler.sync()
+    assert snapshot.version == 2 and snapshot.changes
+    for n in (5, 20, 100):
+        snapshot.recommend(n)
+    barrier.wait()
+    results.put((first, pss_kib() - before))
+    barrier.wait()
+
+
+def measure(mode, rows, workers):
+    """回傳所有 worker 載入第一版與第二版後的 Pss 總和（KiB）。"""
+    import shared
+
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(workers + 1)
+    results = ctx.Queue()
+    with tempfile.TemporaryDirectory() as directory:
+        tables = versions(rows)
+        publisher = shared.SharedSnapshotScheduler(
+            directory, loader=lambda url: next(tables), interval=0)
+        if mode == 'shared':
+            publisher.refresh()
+        procs = [ctx.Process(target=worker, args=(mode, rows, directory, barrier, results))
+                 for _ in range(workers)]
+        for p in procs:
+            p.start()
+        barrier.wait()
+        barrier.wait()
+        if mode == 'shared':
+            publisher.refresh()
+        for _ in range(3):
+            barrier.wait()
+        usage = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+    return [sum(column) for column in zip(*usage)]
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    rows = int(argv[0]) if argv else 1_000_000
+    counts = [int(a) for a in argv[1:]] or [1, 2, 4, 8]
+    import shared
+
+    with tempfile.TemporaryDirectory() as directory:
+        publisher = shared.SharedSnapshotScheduler(
+            directory, loader=lambda url: BookTable.from_books(make_books(rows)))
+        publisher.refresh()
+        size = os.path.getsize(publisher.snapshot_path(publisher.published_version()))
+    print(f"{rows} rows, snapshot file {size / 2**20:.1f} MiB, {CHANGED} books changed in v2")
+    print(f"{'workers':>8}{'':>4}{'private MiB':>14}{'per worker':>12}"
+          f"{'shared MiB':>13}{'per worker':>12}")
+    for workers in counts:
+        private = measure('private', rows, workers)
+        mapped = measure('shared', rows, workers)
+        for label, a, b in zip(('v1', 'v2'), private, mapped):
+            print(f"{workers:>8}{label:>4}{a / 1024:>14.1f}{a / 1024 / workers:>12.1f}"
+                  f"{b / 1024:>13.1f}{b / 1024 / workers:>12.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
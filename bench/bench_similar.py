@@ -0,0 +1,44 @@
+"""量測相似書索引的建立時間、檔案大小與查詢延遲。
+
+用法：python -m bench.bench_similar [書籍數] [k] [查詢次數]
+書籍與 bench_search 相同，由常用漢字依 Zipf 分布隨機組成，每位作者約 20 本書。
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench.bench_search import make_books, percentile
+from similar import SimilarIndex, book_id, build_index
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    count = int(argv[0]) if argv else 100_000
+    k = int(argv[1]) if len(argv) > 1 else 20
+    queries = int(argv[2]) if len(argv) > 2 else 10_000
+    books = make_books(count)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'similar.bin')
+        start = time.perf_counter()
+        build_index(books, path, k)
+        build = time.perf_counter() - start
+        size = os.path.getsize(path)
+        print(f"{count} books, k={k}: built in {build:.1f}s, "
+              f"{size / 2 ** 20:.1f} MiB ({size / count:.0f} bytes/book)")
+        index = SimilarIndex(path)
+        rng = random.Random(0)
+        ids = [book_id(b.title, b.author) for b in rng.choices(books, k=queries)]
+        times = []
+        for id in ids:
+            start = time.perf_counter()
+            index.similar(id, k)
+            times.append(time.perf_counter() - start)
+        print(f"  lookup p50 {percentile(times, 0.5) * 1e6:.0f}us  "
+              f"p99 {percentile(times, 0.99) * 1e6:.0f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""在本機替身伺服器上端對端測試多書店合併，並比較雜湊索引與兩兩比較的合併耗時。
+
+用法：python -m bench.bench_stores [書籍數] [每頁書數]
+三家書店各從同一份書目中取約 60% 的書，分成多頁：
+
+- books：books.com.tw 的標記，沒有 ISBN。
+- ld13：JSON-LD，ISBN-13，書名中的英數字改成全形（正規化後與 books 相同）。
+- ld10：JSON-LD，有連字號的 ISBN-10，書名後加上「（新版）」，只能以 ISBN 對上。
+
+依 books、ld13、ld10 的順序合併時，只同時出現在 books 與 ld10、卻不在 ld13 的書無從對上，
+預期的筆數因此是實際不同的書數加上這些書。
+"""
+
+import random
+import sys
+import time
+
+from bench.fixtures import catalog, fullwidth, isbn10, jsonld_page, ranking_page
+from bench.server import StandInServer
+from parsers import book_key
+from stores import Store, aggregate, merge_listings, normalize_isbn, parse_jsonld
+from recommend import parse_books
+
+
+def pages_for(books, size, render):
+    return [render(books[i:i + size], i + 1) for i in range(0, len(books), size)]
+
+
+def pairwise(listings):
+    """對照組：每本書與已合併的每一筆逐一比較，規則與 merge_listings 相同。"""
+    merged = []
+    for _, books in listings:
+        for book in books:
+            isbn, name = normalize_isbn(book.isbn), book_key(book)
+            for isbns, names in merged:
+                if (isbn and isbn in isbns) or name in names:
+                    break
+            else:
+                isbns, names = set(), set()
+                merged.append((isbns, names))
+            if isbn:
+                isbns.add(isbn)
+            names.add(name)
+    return merged
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    count = int(argv[0]) if argv else 3000
+    size = int(argv[1]) if len(argv) > 1 else 100
+    books = catalog(count)
+    rng = random.Random(0)
+    picks = {name: sorted(rng.sample(range(count), int(count * 0.6)))
+             for name in ('books', 'ld13', 'ld10')}
+    renders = {
+        'books': lambda chunk, start: ranking_page(
+            books=[(books[i][0], books[i][1]) for i in chunk], ads=False),
+        'ld13': lambda chunk, start: jsonld_page(
+            [(fullwidth(books[i][0]), books[i][1], books[i][2]) for i in chunk], start=start),
+        'ld10': lambda chunk, start: jsonld_page(
+            [(books[i][0] + '（新版）', books[i][1], isbn10(books[i][2])) for i in chunk],
+            start=start),
+    }
+    site = {}
+    for name, chunk in picks.items():
+        for n, page in enumerate(pages_for(chunk, size, renders[name])):
+            site[f'/{name}/{n}'] = page
+    with StandInServer(pages=site) as server:
+        urls = {name: [server.url(path) for path in site if path.startswith(f'/{name}/')]
+                for name in picks}
+        stores = [Store('books', urls['books'], parse_books),
+                  Store('ld13', urls['ld13'], parse_jsonld),
+                  Store('ld10', urls['ld10'], parse_jsonld)]
+        start = time.perf_counter()
+        entries, errors = aggregate(stores, concurrency=16, per_host_rate=0)
+        elapsed = time.perf_counter() - start
+    picked = [set(p) for p in picks.values()]
+    expected = len(set.union(*picked)) + len((picked[0] & picked[2]) - picked[1])
+    listings = sum(len(p) for p in picks.values())
+    print(f"{len(site)} pages, {listings} listings of {count} books: "
+          f"{len(entries)} merged (expected {expected}), {len(errors)} errors, {elapsed:.2f}s")
+    in_all = sum(len(e.ranks) == 3 for e in entries)
+    print(f"  in all three stores: {in_all}")
+
+    # 合併本身的耗時：把書單放大，比較雜湊索引與兩兩比較
+    parsed = [('books', parse_books(site[p])) if p.startswith('/books/')
+              else (p.split('/')[1], parse_jsonld(site[p])) for p in site]
+    start = time.perf_counter()
+    merged = merge_listings(parsed)
+    hashed = time.perf_counter() - start
+    start = time.perf_counter()
+    baseline = pairwise(parsed)
+    slow = time.perf_counter() - start
+    print(f"  merge: hash index {hashed * 1000:.1f}ms, pairwise {slow * 1000:.0f}ms "
+          f"({len(merged)} vs {len(baseline)} books)")
+    return 0 if len(entries) == expected and not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""比較原本的逐本計分＋完整排序與 BookTable 向量化評分＋部分選取。
+
+用法：python -m bench.bench_table [列數 ...]
+"""
+
+import random
+import sys
+import time
+
+from book import Book
+from table import BookTable
+
+
+def make_books(count, seed=0):
+    """產生 count 本模擬書籍；排名落在 1..100，會有大量同分。"""
+    rnd = random.Random(seed)
+    return [Book(rnd.randint(1, 100), f'書名{i}', f'作者{i % 997}',
+                 rnd.randint(50, 100), rnd.randint(100, 900))
+            for i in range(count)]
+
+
+def legacy_recommend(books, n):
+    """原本 recommend() 的作法：逐本計分後完整排序。"""
+    books = [b.with_score((101 - b.rank) * b.discount) for b in books]
+    books.sort(key=lambda b: b.score, reverse=True)
+    return books[:n]
+
+
+def table_recommend(table, n):
+    scores = table.score()
+    return table.rows(table.top(n, scores), scores)
+
+
+def best_of(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def main(argv=None):
+    sizes = [int(a) for a in (argv if argv is not None else sys.argv[1:])] or \
+        [10_000, 100_000, 1_000_000]
+    n = 20
+    failed = False
+    print(f"{'rows':>10}{'legacy ms':>12}{'table ms':>12}{'speedup':>9}  identical")
+    for size in sizes:
+        books = make_books(size)
+        table = BookTable.from_books(books)
+        expected, legacy_time = best_of(lambda: legacy_recommend(books, n))
+        got, table_time = best_of(lambda: table_recommend(table, n))
+        same = got == expected
+        failed |= not same
+        print(f"{size:>10}{legacy_time * 1000:>12.2f}{table_time * 1000:>12.2f}"
+              f"{legacy_time / table_time:>8.0f}x  {'yes' if same else 'NO'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
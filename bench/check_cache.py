@@ -0,0 +1,167 @@
+"""cache.py 的行為檢查：single-flight 合併、錯誤傳遞與 stale-while-revalidate。
+
+用法：python -m bench.check_cache
+以假的 loader 與時鐘執行，不需連網；任何一項不符都會以 AssertionError 結束。
+"""
+
+import threading
+import time
+
+from cache import SingleFlight, TTLCache
+
+THREADS = 16
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class BlockingLoader:
+    """計算呼叫次數；每次呼叫都停住，直到 release() 才回傳（或拋出 error）。"""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.entered = threading.Event()
+        self._release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, key):
+        with self._lock:
+            self.calls += 1
+            value = f'{key}-{self.calls}'
+        self.entered.set()
+        self._release.wait(10)
+        if self.error is not None:
+            raise self.error
+        return value
+
+    def release(self):
+        self._release.set()
+
+
+def run_threads(target, count=THREADS):
+    """讓 count 個執行緒同時呼叫 target()，回傳各自的 (結果, 例外)。"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = (target(), None)
+        except Exception as e:
+            results[i] = (None, e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def waiting_followers(flight, key, count):
+    """等到 count 個跟隨者都在等待同一次呼叫；以 Event 內部的等待者數判斷，不靠 sleep 猜測。"""
+    for _ in range(1000):
+        with flight._lock:
+            call = flight._calls.get(key)
+        if call is not None and len(call.done._cond._waiters) >= count:
+            return
+        time.sleep(0.01)
+    raise AssertionError('followers never joined the in-flight call')
+
+
+def check_single_flight():
+    flight = SingleFlight()
+    loader = BlockingLoader()
+    threads, results = run_threads(lambda: flight.do('k', lambda: loader('k')))
+    loader.entered.wait(10)
+    waiting_followers(flight, 'k', THREADS - 1)
+    loader.release()
+    for t in threads:
+        t.join()
+    assert loader.calls == 1, loader.calls
+    assert {value for (value, _), _ in results} == {'k-1'}
+    shared = sorted(shared for (_, shared), _ in results)
+    assert shared == [False] + [True] * (THREADS - 1), shared
+    # 完成後不再合併，下一次呼叫重新執行
+    assert flight.do('k', lambda: 'again') == ('again', False)
+
+
+def check_error_propagates():
+    flight = SingleFlight()
+    loader = BlockingLoader(error=RuntimeError('upstream down'))
+    threads, results = run_threads(lambda: flight.do('k', lambda: loader('k')))
+    loader.entered.wait(10)
+    waiting_followers(flight, 'k', THREADS - 1)
+    loader.release()
+    for t in threads:
+        t.join()
+    assert loader.calls == 1, loader.calls
+    assert all(isinstance(error, RuntimeError) for _, error in results)
+    # 失敗不會留下結果，下一次呼叫重試
+    assert flight.do('k', lambda: 'retried') == ('retried', False)
+
+
+def check_cache_miss():
+    loader = BlockingLoader()
+    cache = TTLCache(loader, ttl=10, clock=FakeClock())
+    threads, results = run_threads(lambda: cache.get('k'))
+    loader.entered.wait(10)
+    waiting_followers(cache._flight, 'k', THREADS - 1)
+    loader.release()
+    for t in threads:
+        t.join()
+    assert loader.calls == 1, loader.calls
+    assert {value for value, _ in results} == {'k-1'}
+    stats = cache.stats()
+    assert stats['misses'] == THREADS and stats['refreshes'] == 1, stats
+    assert stats['coalesced'] == THREADS - 1, stats
+
+
+def check_stale_while_revalidate():
+    clock = FakeClock()
+    calls = []
+    gate = threading.Event()
+
+    def loader(key):
+        calls.append(key)
+        if len(calls) > 1:
+            # 背景更新停住，確認過期期間的請求都拿到舊值且只觸發一次更新
+            gate.wait(10)
+        return f'{key}-{len(calls)}'
+
+    cache = TTLCache(loader, ttl=10, clock=clock)
+    assert cache.get('k') == 'k-1'
+    clock.now = 5
+    assert cache.get('k') == 'k-1' and len(calls) == 1
+    clock.now = 11
+    threads, results = run_threads(lambda: cache.get('k'))
+    for t in threads:
+        t.join()
+    assert {value for value, _ in results} == {'k-1'}, results
+    gate.set()
+    for _ in range(1000):
+        with cache._lock:
+            if not cache._refreshing:
+                break
+        time.sleep(0.01)
+    assert cache.get('k') == 'k-2' and len(calls) == 2, calls
+    stats = cache.stats()
+    assert stats['stale_hits'] == THREADS and stats['refreshes'] == 2, stats
+
+
+CHECKS = [check_single_flight, check_error_propagates, check_cache_miss,
+          check_stale_while_revalidate]
+
+
+def main():
+    for check in CHECKS:
+        check()
+        print(f"ok  {check.__name__}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""upstream.py 的行為檢查：斷路器的半開試探、恢復與 ResilientFetcher 的延遲統計。
+
+用法：python -m bench.check_upstream
+以假的時鐘與假的 session 執行，不需連網；任何一項不符都會以 AssertionError 結束。
+"""
+
+import threading
+import time
+
+import requests
+
+from bench.check_cache import FakeClock, run_threads
+from upstream import CircuitBreaker, CircuitOpenError, ResilientFetcher, UpstreamError
+
+
+class StubResponse:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.content = b'ok'
+
+
+class StubSession:
+    """依 fail 決定每次 get() 拋出連線錯誤或回傳 200；delay 秒後才回應。"""
+
+    def __init__(self, fail=False, delay=0.0):
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        self.finished.set()
+        if self.fail:
+            raise requests.ConnectionError('connection refused')
+        return StubResponse()
+
+
+def open_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opened == 1
+    return breaker
+
+
+def check_half_open_single_probe():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 29
+    assert not breaker.allow() and breaker.is_open
+    clock.now = 30
+    threads, results = run_threads(breaker.allow)
+    for t in threads:
+        t.join()
+    allowed = [value for value, _ in results]
+    assert allowed.count(True) == 1, allowed
+    assert breaker.state == 'half_open'
+    # 試探還沒有結果前，其他請求一律擋下
+    assert not breaker.allow()
+
+
+def check_probe_failure_reopens():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opened == 2
+    # 重新計算冷卻時間
+    clock.now = 59
+    assert not breaker.allow()
+    clock.now = 60
+    assert breaker.allow()
+
+
+def check_probe_success_closes():
+    clock = FakeClock()
+    breaker = open_breaker(clock)
+    clock.now = 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and not breaker.is_open
+    assert all(breaker.allow() for _ in range(10))
+    # 恢復後失敗次數重新計算
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def check_fetcher_rejects_while_open():
+    clock = FakeClock()
+    session = StubSession(fail=True)
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    fetcher = ResilientFetcher(session, attempts=3, backoff=0, breaker=breaker,
+                               hedge_percentile=None)
+    try:
+        fetcher.get('http://upstream/')
+    except CircuitOpenError:
+        raise AssertionError('breaker opened before the attempts ran out')
+    except UpstreamError:
+        pass
+    assert session.calls == 3 and breaker.state == 'open', (session.calls, breaker.state)
+    # 斷路中不呼叫 session
+    for _ in range(5):
+        try:
+            fetcher.get('http://upstream/')
+        except CircuitOpenError:
+            continue
+        raise AssertionError('request passed an open breaker')
+    assert session.calls == 3 and fetcher.stats()['rejected'] == 5
+    # 冷卻後只送出一個試探請求，成功即恢復
+    clock.now = 30
+    session.fail = False
+    assert fetcher.get('http://upstream/').status_code == 200
+    assert session.calls == 4 and breaker.state == 'closed'
+
+
+def check_stalled_latency_excluded():
+    session = StubSession(delay=0.2)
+    fetcher = ResilientFetcher(session, attempts=1, attempt_deadline=0.05, deadline=1)
+    try:
+        fetcher.get('http://upstream/')
+    except UpstreamError:
+        pass
+    else:
+        raise AssertionError('stalled response returned within the deadline')
+    # 背景請求最後仍會成功，但呼叫端早已放棄，不列入延遲統計
+    session.finished.wait(5)
+    time.sleep(0.05)
+    assert not fetcher.latency._samples, list(fetcher.latency._samples)
+
+
+def check_hedge_delay_capped():
+    fetcher = ResilientFetcher(StubSession(), attempt_deadline=4.0)
+    assert fetcher._hedge_delay() is None
+    # 即使延遲分布被拉長，對沖時間也不超過每次嘗試期限的一半
+    for _ in range(fetcher.latency.min_samples):
+        fetcher.latency.add(10.0)
+    assert fetcher._hedge_delay() == 2.0, fetcher._hedge_delay()
+
+
+CHECKS = [check_half_open_single_probe, check_probe_failure_reopens,
+          check_probe_success_closes, check_fetcher_rejects_while_open,
+          check_stalled_latency_excluded, check_hedge_delay_capped]
+
+
+def main():
+    for check in CHECKS:
+        check()
+        print(f"ok  {check.__name__}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""產生仿 books.com.tw 排行榜結構的測試頁面，以及其他書店以 JSON-LD 標示的暢銷榜。
+
+`python -m bench.fixtures` 會重新產生 `bench/pages/` 下的固定頁面。
+"""
+
+import html
+import json
+import os
+import random
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+_HEAD = """<!DOCTYPE html>
+<html lang="zh-TW">
+<head>
+<meta charset="utf-8">
+<title>博客來-中文書暢銷榜</title>
+<link rel="stylesheet" href="https://www.books.com.tw/css/v2/list.css">
+</head>
+<body>
+<div id="header"><ul class="nav"><li><a href="/">首頁</a></li><li><a href="/web/books">中文書</a></li></ul></div>
+<div class="mod_a clearfix">
+<ul class="clearfix">
+"""
+
+_TAIL = """</ul>
+</div>
+<div id="footer"><ul><li>客服中心</li><li>隱私權政策</li></ul></div>
+</body>
+</html>
+"""
+
+_ITEM = """<li class="item">
+  <div class="stitle">
+    <p class="no_list"><strong class="no">{rank}</strong></p>
+  </div>
+  <div class="type02_bd-a">
+    <h4><a href="{base}/products/{pid}?loc=P_0002_{rank:03d}">{title}</a></h4>
+    <ul class="msg">
+      <li>作者：<a href="https://search.books.com.tw/search/query/key/{author}/adv_author/1/">{author}</a></li>
+      <li class="price_a">{price}</li>
+    </ul>
+  </div>
+  <div class="type02_bd-b"><a href="{base}/products/{pid}"><img src="https://im1.book.com.tw/image/{pid}.jpg" alt=""></a></div>
+</li>
+"""
+
+_AD = """<li class="item ad">
+  <div class="banner"><a href="https://www.books.com.tw/activity/{rank}"><img src="ad{rank}.jpg" alt="活動"></a></div>
+</li>
+"""
+
+_WORDS = ['原子', '習慣', '被討厭', '的', '勇氣', '蛤蟆', '先生', '去看', '心理師',
+          '底層', '邏輯', '窮查理', '寶典', '你', '願意', '人生', '從此', '不同',
+          '晨讀', '10分鐘', '少年', '小說', '貓', '咖啡', '時光', 'Python', '入門',
+          '&amp;', '《', '》', '：']
+_NAMES = ['詹姆斯．克利爾', '岸見一郎', '古賀史健', '羅伯．狄保德', '劉潤',
+          '查理．蒙格', '東野圭吾', '村上春樹', '吉本芭娜娜', '張曼娟']
+
+
+def ranking_page(n=100, seed=0, ads=True, base='https://www.books.com.tw', books=None):
+    """產生含 n 本書的排行榜 HTML；商品頁連結指向 base。
+
+    books 為 (書名, 作者) 列表時依序使用這些書（n 為其長度），否則隨機產生。
+    """
+    rnd = random.Random(seed)
+    if books is not None:
+        n = len(books)
+    parts = [_HEAD]
+    for rank in range(1, n + 1):
+        if ads and rank % 25 == 0:
+            parts.append(_AD.format(rank=rank))
+        title = ''.join(rnd.choice(_WORDS) for _ in range(rnd.randint(2, 6)))
+        author = rnd.choice(_NAMES)
+        if books is not None:
+            title, author = books[rank - 1]
+            title = html.escape(title, quote=False)
+        roll = rnd.random()
+        if roll < 0.05:
+            price = '定價：<strong><b>{}</b></strong>元'.format(rnd.randint(200, 900))
+        else:
+            price = '優惠價：<strong><b>{}</b></strong>折<strong><b>{}</b></strong>元'.format(
+                rnd.randint(50, 95), rnd.randint(100, 900))
+        parts.append(_ITEM.format(
+            rank=rank,
+            pid='{:010d}'.format(seed * 100000 + rank),
+            base=base,
+            title=title,
+            author=author,
+            price=price,
+        ))
+    parts.append(_TAIL)
+    return ''.join(parts)
+
+
+_DETAIL = """<!DOCTYPE html>
+<html lang="zh-TW">
+<head>
+<meta charset="utf-8">
+<title>{title} - 博客來</title>
+</head>
+<body>
+<div class="mod type02_p002 clearfix"><h1>{title}</h1></div>
+<div class="type02_p003 clearfix">
+<ul>
+<li>作者：<a href="https://search.books.com.tw/search/query/key/{author}/adv_author/1/">{author}</a></li>
+<li>出版社：<a href="https://www.books.com.tw/web/sys_puballb/books/?pubid={pubid}"><span>{publisher}</span></a></li>
+<li>出版日期：{published}</li>
+<li>語言：繁體中文</li>
+</ul>
+</div>
+<div class="mod_b type02_m057 clearfix"><div class="bd"><div class="content">{description}</div></div></div>
+<div class="mod_b type02_m058 clearfix">
+<div class="bd">
+<ul>
+<li>ISBN：{isbn}</li>
+<li>規格：{binding} / {pages}頁 / 14.8 x 21 x 1.6 cm / 普通級 / 單色印刷 / 初版</li>
+<li>出版地：台灣</li>
+</ul>
+<ul class="sort">
+<li>本書分類：{category}</li>
+</ul>
+</div>
+</div>
+{filler}
+</body>
+</html>
+"""
+
+_PUBLISHERS = ['方智', '究竟', '遠流', '天下雜誌', '商業周刊', '時報出版', '皇冠', '圓神']
+_CATEGORIES = [('商業理財', '成功法'), ('心理勵志', '自我成長'), ('文學小說', '日本文學'),
+               ('電腦資訊', '程式設計'), ('人文社科', '哲學')]
+
+
+def detail_page(pid, filler=40):
+    """產生商品頁 HTML；內容由 pid 決定，filler 為附加的評論區塊數（模擬實際頁面大小）。"""
+    rnd = random.Random(pid)
+    category = rnd.choice(_CATEGORIES)
+    links = '&gt; '.join(
+        f'<a href="https://www.books.com.tw/web/books_bmidm_{i:02d}/">{name}</a>'
+        for i, name in enumerate(('中文書',) + category))
+    review = '<div class="review"><p>{}</p><ul><li>推薦</li><li>回覆</li></ul></div>'
+    return _DETAIL.format(
+        title=''.join(rnd.choice(_WORDS) for _ in range(rnd.randint(2, 6))),
+        author=rnd.choice(_NAMES),
+        publisher=rnd.choice(_PUBLISHERS),
+        pubid=rnd.randint(1, 9999),
+        published=f'{rnd.randint(2000, 2024)}/{rnd.randint(1, 12):02d}/{rnd.randint(1, 28):02d}',
+        description=''.join(rnd.choice(_WORDS) for _ in range(300)),
+        isbn=f'978{rnd.randint(0, 10**10 - 1):010d}',
+        binding=rnd.choice(['平裝', '精裝']),
+        pages=rnd.randint(120, 640),
+        category=links,
+        filler='\n'.join(review.format(''.join(rnd.choice(_WORDS) for _ in range(80)))
+                          for _ in range(filler)),
+    )
+
+
+def catalog(n, seed=0):
+    """產生 n 本不重複的書：(書名, 作者, ISBN-13) 列表。"""
+    rnd = random.Random(seed)
+    books, seen = [], set()
+    while len(books) < n:
+        title = html.unescape(''.join(rnd.choice(_WORDS) for _ in range(rnd.randint(3, 7))))
+        author = rnd.choice(_NAMES)
+        if (title, author) in seen:
+            continue
+        seen.add((title, author))
+        digits = '978' + ''.join(rnd.choice('0123456789') for _ in range(9))
+        check = -sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10
+        books.append((title, author, digits + str(check)))
+    return books
+
+
+def isbn10(isbn13):
+    """把 978 開頭的 ISBN-13 轉成有連字號的 ISBN-10 寫法。"""
+    body = isbn13[3:12]
+    check = -sum(int(d) * (10 - i) for i, d in enumerate(body)) % 11
+    return f"{body[0]}-{body[1:5]}-{body[5:9]}-{'X' if check == 10 else check}"
+
+
+def fullwidth(text):
+    """把 ASCII 字元換成全形，正規化後應與原字串相同。"""
+    return ''.join(chr(ord(c) + 0xFEE0) if '!' <= c <= '~' else c for c in text)
+
+
+_JSONLD_PAGE = """<!DOCTYPE html>
+<html lang="zh-TW">
+<head>
+<meta charset="utf-8">
+<title>{store}暢銷排行榜</title>
+<script type="application/ld+json">{data}</script>
+</head>
+<body>
+<h1>{store}暢銷排行榜</h1>
+<ol>{items}</ol>
+</body>
+</html>
+"""
+
+
+def jsonld_page(books, store='範例書店', base='https://store.example', start=1, seed=0):
+    """產生以 schema.org ItemList（JSON-LD）標示暢銷榜的頁面。
+
+    books 為 (書名, 作者, ISBN 或 None) 列表，名次從 start 起算。
+    """
+    rnd = random.Random(seed)
+    elements, items = [], []
+    for position, (title, author, isbn) in enumerate(books, start):
+        list_price = rnd.randint(200, 900)
+        book = {
+            '@type': 'Book',
+            'name': title,
+            'author': {'@type': 'Person', 'name': author},
+            'url': f'{base}/book/{position}',
+            'offers': {
+                '@type': 'Offer',
+                'price': round(list_price * rnd.randint(66, 100) / 100),
+                'priceCurrency': 'TWD',
+                'priceSpecification': {'@type': 'UnitPriceSpecification',
+                                       'priceType': 'https://schema.org/ListPrice',
+                                       'price': list_price},
+            },
+        }
+        if isbn:
+            book['isbn'] = isbn
+        elements.append({'@type': 'ListItem', 'position': position, 'item': book})
+        items.append(f'<li>{html.escape(title)} / {html.escape(author)}</li>')
+    data = json.dumps({'@context': 'https://schema.org', '@type': 'ItemList',
+                       'itemListElement': elements}, ensure_ascii=False)
+    return _JSONLD_PAGE.format(store=store, data=data.replace('</', '<\\/'),
+                               items=''.join(items))
+
+
+def main():
+    """重新產生 bench/pages/ 下的固定頁面。"""
+    os.makedirs(PAGES_DIR, exist_ok=True)
+    for name, n, seed in [('saletopb_100.html', 100, 1),
+                          ('saletopb_500.html', 500, 2)]:
+        with open(os.path.join(PAGES_DIR, name), 'w', encoding='utf-8') as f:
+            f.write(ranking_page(n, seed))
+
+
+if __name__ == '__main__':
+    main()
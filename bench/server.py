@@ -0,0 +1,107 @@
+"""本機的 books.com.tw 替身伺服器，提供測試頁面並可注入延遲與錯誤。
+
+每個路徑都會回傳一份排行榜頁面：若 pages 中有該路徑就用指定內容，
+否則依路徑產生一份含 books_per_page 本書的固定模擬頁面，其中的商品頁連結指向這個伺服器；
+`/products/<pid>` 則回傳模擬的商品頁。
+latency 為每個回應的延遲秒數，error_rate 為回傳 503 的機率；
+slow_rate 為改以 slow_latency 秒延遲回應的機率，用來模擬長尾延遲。
+這些屬性都可在執行中修改，模擬上游事故的開始與結束。
+"""
+
+import http.server
+import random
+import threading
+import time
+import zlib
+
+from bench.fixtures import detail_page, ranking_page
+
+
+class StandInServer:
+    """在背景執行緒啟動的本機 HTTP 伺服器，可當作 context manager 使用。"""
+
+    def __init__(self, pages=None, latency=0.0, books_per_page=100,
+                 error_rate=0.0, seed=0, host='127.0.0.1', port=0,
+                 slow_rate=0.0, slow_latency=0.0):
+        self.pages = dict(pages or {})
+        self.latency = latency
+        self.books_per_page = books_per_page
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = http.server.ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path='/'):
+        return self.base_url + path
+
+    def page(self, path):
+        """取得路徑對應的頁面位元組，未指定的路徑會產生並快取一份。"""
+        with self._lock:
+            body = self.pages.get(path)
+            if body is None:
+                if path.startswith('/products/'):
+                    body = detail_page(path.rsplit('/', 1)[1])
+                else:
+                    body = ranking_page(self.books_per_page, seed=zlib.crc32(path.encode()),
+                                        base=self.base_url)
+                self.pages[path] = body
+            if isinstance(body, str):
+                body = self.pages[path] = body.encode('utf-8')
+            return body
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    fail = server._random.random() < server.error_rate
+                    if fail:
+                        server.errors += 1
+                    slow = server._random.random() < server.slow_rate
+                delay = server.slow_latency if slow else server.latency
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    self.send_error(503)
+                    return
+                body = server.page(self.path)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
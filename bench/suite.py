@@ -0,0 +1,184 @@
+"""離線基準測試：對本機替身伺服器量測抓取、推薦與網頁伺服器吞吐量，結果輸出為 JSON。
+
+用法：
+    python -m bench.suite --latency 0.05 --books 100 --error-rate 0 --output bench_output.json
+
+不同 commit 的輸出可以直接 diff 比較。
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import recommend
+from bench.server import StandInServer
+from upstream import UpstreamError
+
+
+def percentiles(samples):
+    """回傳 {p50, p90, p99, mean}（毫秒）。"""
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        'p50_ms': round(pick(0.50), 3),
+        'p90_ms': round(pick(0.90), 3),
+        'p99_ms': round(pick(0.99), 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def bench_fetch(url, iterations):
+    """每次都清掉上次的解析結果，量測完整的下載＋解析；重試後仍失敗的抓取計入 errors。"""
+    samples, errors = [], 0
+    for _ in range(iterations):
+        recommend._last_fetch.clear()
+        start = time.perf_counter()
+        try:
+            recommend.fetch_books(url)
+        except (requests.RequestException, UpstreamError):
+            errors += 1
+            continue
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    return dict(percentiles(samples) if samples else {},
+                pages_per_s=round(len(samples) / total, 2) if total else 0,
+                errors=errors)
+
+
+def timed_call(fn):
+    """回傳 fn() 的耗時秒數；失敗時回傳 None（上游錯誤率不為 0 時是預期的）。"""
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception:
+        return None
+    return time.perf_counter() - start
+
+
+def bench_recommend(iterations):
+    """快取已暖時 recommend() 的延遲，另量測一次冷啟動；失敗的呼叫計入 errors。"""
+    recommend.books_cache.invalidate()
+    cold = timed_call(lambda: recommend.recommend(5))
+    samples, errors = [], int(cold is None)
+    for _ in range(iterations):
+        elapsed = timed_call(lambda: recommend.recommend(5))
+        if elapsed is None:
+            errors += 1
+        else:
+            samples.append(elapsed)
+    return dict(percentiles(samples) if samples else {},
+                cold_ms=None if cold is None else round(cold * 1000, 3), errors=errors)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def bench_app(duration, concurrency, path='/?num=10'):
+    """以多執行緒 WSGI 伺服器啟動 app.py，並以 concurrency 個用戶端持續請求。
+
+    預先整理快照失敗時（上游錯誤）不中斷，由請求自行觸發整理，非 200 的回應計入 errors。
+    """
+    import app
+
+    app.app.config['REFRESH_IN_BACKGROUND'] = False
+    refresh_error = timed_call(app.scheduler.refresh) is None
+    httpd = make_server('127.0.0.1', 0, app.app, threaded=True,
+                        request_handler=QuietHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{httpd.server_port}{path}'
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    samples, errors = [], [0]
+
+    def client():
+        session = requests.Session()
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = session.get(url, timeout=10).status_code == 200
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - start)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            samples.extend(local)
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.perf_counter() - start
+    httpd.shutdown()
+    return dict(percentiles(samples), requests=len(samples),
+                requests_per_s=round(len(samples) / elapsed, 1), errors=errors[0],
+                refresh_error=refresh_error)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.02, help='上游延遲秒數')
+    parser.add_argument('--books', type=int, default=100, help='每頁書籍數')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='上游回傳 503 的機率')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=5.0, help='網頁壓測秒數')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', help='結果 JSON 檔案，預設輸出到 stdout')
+    args = parser.parse_args(argv)
+
+    # 基準測試不寫入歷史資料庫與頁面歸檔
+    recommend.HISTORY_DB = None
+    recommend.ARCHIVE_DIR = None
+    with StandInServer(latency=args.latency, books_per_page=args.books,
+                       error_rate=args.error_rate) as server:
+        recommend.URL = server.url('/web/sys_saletopb/books/')
+        results = {
+            'fetch_books': bench_fetch(recommend.URL, args.iterations),
+            'recommend': bench_recommend(args.iterations * 20),
+            'app': bench_app(args.duration, args.concurrency),
+        }
+        upstream_requests = server.requests
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'config': vars(args),
+        'upstream_requests': upstream_requests,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
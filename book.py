@@ -0,0 +1,44 @@
+"""書籍紀錄：以 __slots__ 取代每本書一個字典，大量書籍時可省下大部分記憶體。"""
+
+
+class Book:
+    """排行榜上的一本書；score 由推薦流程填入，url 為商品頁網址、isbn 為 ISBN（不一定有）。"""
+
+    __slots__ = ('rank', 'title', 'author', 'discount', 'price', 'score', 'url', 'isbn')
+    FIELDS = ('rank', 'title', 'author', 'discount', 'price')
+
+    def __init__(self, rank, title, author, discount, price, score=None, url=None,
+                 isbn=None):
+        self.rank = rank
+        self.title = title
+        self.author = author
+        self.discount = discount
+        self.price = price
+        self.score = score
+        self.url = url
+        self.isbn = isbn
+
+    def astuple(self):
+        return (self.rank, self.title, self.author, self.discount, self.price, self.score)
+
+    def to_dict(self, fields=None):
+        """轉成字典（例如輸出 JSON）；沒有分數時省略 score。"""
+        if fields is None:
+            fields = self.FIELDS if self.score is None else self.FIELDS + ('score',)
+        return {name: getattr(self, name) for name in fields}
+
+    def with_score(self, score):
+        """回傳附上分數的新紀錄，不修改原本（可能被快取共用）的紀錄。"""
+        return Book(self.rank, self.title, self.author, self.discount, self.price, score,
+                    self.url, self.isbn)
+
+    def __eq__(self, other):
+        if not isinstance(other, Book):
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return ('Book(rank={!r}, title={!r}, author={!r}, discount={!r}, price={!r}, '
+                'score={!r})'.format(*self.astuple()))
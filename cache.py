@@ -0,0 +1,132 @@
+"""排行榜資料的 TTL 快取與 single-flight 合併：同一份資料同時只抓取一次。"""
+
+import threading
+import time
+
+
+class SingleFlight:
+    """同一個 key 同時只執行一次 fn，其餘呼叫者等待並共用同一份結果。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+
+    def do(self, key, fn):
+        """執行 fn 並回傳 (結果, 是否與其他呼叫共用)。"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """依 key 保存 loader 的結果，並在 ttl 秒後於背景重新載入。"""
+
+    def __init__(self, loader, ttl=300, clock=time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        # 測試時可換成假的時鐘
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (value, loaded_at)
+        self._refreshing = set()
+        self._flight = SingleFlight()
+        self._counters = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'coalesced': 0,
+            'errors': 0,
+        }
+
+    def get(self, key):
+        """取得快取值；沒有資料時同步載入，過期時回傳舊值並觸發背景更新。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+            else:
+                value, loaded_at = entry
+                if self.clock() - loaded_at < self.ttl:
+                    self._counters['hits'] += 1
+                    return value
+                self._counters['stale_hits'] += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(
+                        target=self._refresh, args=(key,), daemon=True
+                    ).start()
+                return value
+        return self._load(key)
+
+    def invalidate(self, key=None):
+        """清除單一 key 或全部快取。"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """回傳命中、未命中與上游更新次數的快照。"""
+        with self._lock:
+            return dict(self._counters, size=len(self._entries))
+
+    def _load(self, key):
+        # 同時過期或未命中的請求共用同一次上游抓取
+        value, shared = self._flight.do(key, lambda: self._fetch(key))
+        if shared:
+            with self._lock:
+                self._counters['coalesced'] += 1
+        return value
+
+    def _fetch(self, key):
+        with self._lock:
+            self._counters['refreshes'] += 1
+        try:
+            value = self.loader(key)
+        except Exception:
+            with self._lock:
+                self._counters['errors'] += 1
+            raise
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+        return value
+
+    def _refresh(self, key):
+        # 背景更新失敗時保留舊資料，下一次請求會再嘗試
+        try:
+            self._load(key)
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -0,0 +1,223 @@
+"""比較相鄰兩份快照：找出新上榜、下榜、名次變動與價格／折扣變動的書。
+
+書籍以正規化後的書名與作者識別（同 parsers.book_key）。評分公式都是逐列計算，
+沒有變動的書分數不變，所以新快照只需重新評分有變動的書，再把它們插回原本排好的順序。
+每次更新的變動記在 ChangeFeed，下游可依版本讀取，不必自己比對完整清單。
+"""
+
+import collections
+import threading
+
+import numpy as np
+
+from formulas import get_formula
+from parsers import normalize_text
+from table import NUMERIC_FIELDS, TEXT_FIELDS
+
+# 記憶體中的表格以這兩個文字欄位識別同一列
+TEXT_KEY = ('title', 'author')
+
+
+def _identity(title, author):
+    return normalize_text(title), normalize_text(author)
+
+
+def _match_keys(old_keys, new_keys):
+    rows = np.full(len(new_keys), -1, dtype=np.intp)
+    if len(old_keys):
+        # 同一本書在舊表出現多次時對應到第一列
+        keys, first = np.unique(old_keys, return_index=True)
+        pos = np.minimum(np.searchsorted(keys, new_keys), len(keys) - 1)
+        found = keys[pos] == new_keys
+        rows[found] = first[pos[found]]
+    # 新表中重複的書只有第一列沿用舊列
+    _, first = np.unique(new_keys, return_index=True)
+    repeated = np.ones(len(new_keys), dtype=bool)
+    repeated[first] = False
+    rows[repeated] = -1
+    return rows
+
+
+def _match_text(old, new):
+    index = {}
+    for row, key in enumerate(zip(old['title'], old['author'])):
+        index.setdefault(key, row)
+    return np.array([index.pop(key, -1) for key in zip(new['title'], new['author'])],
+                    dtype=np.intp)
+
+
+def match_rows(old, new):
+    """回傳新表每一列在舊表中的列號（新上榜為 -1），old、new 為 BookTable。
+
+    兩份表格都有現成的 row_keys()（mmap 快照檔中已存好）時只比對雜湊，不解碼文字；
+    記憶體中的表格直接以原始字串查表，比逐列計算雜湊快。剩下的少數列才以正規化後的書名與作者比對。
+    """
+    old_keys, new_keys = old.row_keys(compute=False), new.row_keys(compute=False)
+    if old_keys is not None and new_keys is not None:
+        if np.array_equal(old_keys, new_keys):
+            return np.arange(len(new_keys))
+        rows = _match_keys(old_keys, new_keys)
+    else:
+        old_text, new_text = old.columns(TEXT_KEY), new.columns(TEXT_KEY)
+        if len(old) == len(new) and all(np.array_equal(old_text[name], new_text[name])
+                                        for name in TEXT_KEY):
+            return np.arange(len(new))
+        rows = _match_text(old_text, new_text)
+    missing = np.flatnonzero(rows < 0)
+    if len(missing):
+        kept = np.zeros(len(old), dtype=bool)
+        kept[rows[rows >= 0]] = True
+        normalized = {}
+        for row in np.flatnonzero(~kept).tolist():
+            normalized.setdefault(_identity(old.title[row], old.author[row]), row)
+        if normalized:
+            for i in missing.tolist():
+                rows[i] = normalized.pop(_identity(new.title[i], new.author[i]), -1)
+    return rows
+
+
+def _same_text(old, new):
+    """兩個文字欄位（object 陣列、shared.TextColumn 或列表）內容是否完全相同。"""
+    if hasattr(old, 'blob') and hasattr(new, 'blob'):
+        # 兩份 mmap 快照直接比較位移表與 UTF-8 內容，不解碼
+        return np.array_equal(old.offsets, new.offsets) and np.array_equal(old.blob, new.blob)
+    return len(old) == len(new) and all(a == b for a, b in zip(old, new))
+
+
+def _text_differs(old, new, source):
+    """比對到的列中原始書名或作者不同（以正規化比對到）的列。"""
+    old_keys, new_keys = old.row_keys(compute=False), new.row_keys(compute=False)
+    if old_keys is not None and new_keys is not None:
+        return new_keys != old_keys[source]
+    old_text, new_text = old.columns(TEXT_KEY), new.columns(TEXT_KEY)
+    return np.logical_or.reduce([new_text[name] != old_text[name][source]
+                                 for name in TEXT_KEY])
+
+
+class Diff:
+    """兩份 BookTable 之間的差異。
+
+    old_rows[i] 是新表第 i 列在舊表中的列號（新上榜為 -1）；changed 是需要重新評分的新表列號
+    （新上榜或任一欄位有變動），已依列號排序。mmap 快照只比較數值欄位與 row_keys()，
+    文字只在產生變動紀錄時逐列讀取。
+    """
+
+    def __init__(self, old, new):
+        self.old_rows = match_rows(old, new)
+        kept = np.zeros(len(old), dtype=bool)
+        kept[self.old_rows[self.old_rows >= 0]] = True
+        self.removed = np.flatnonzero(~kept)
+
+        matched = self.old_rows >= 0
+        source = np.where(matched, self.old_rows, 0)
+        differs = {}
+        for name in NUMERIC_FIELDS:
+            if len(old):
+                differs[name] = new.column(name) != old.column(name)[source]
+            else:
+                differs[name] = np.ones(len(new), dtype=bool)
+        # 以正規化比對到的書原始文字不同，也要重新評分
+        differs['text'] = _text_differs(old, new, source) if len(old) else ~matched
+        dirty = ~matched
+        for column in differs.values():
+            dirty |= column
+        self.changed = np.flatnonzero(dirty)
+        # 商品頁網址、ISBN 或各書店名次不影響評分，但改變時不能沿用渲染好的頁面與 digest
+        self.identical = (len(old) == len(new) and not len(self.changed)
+                          and bool(np.all(self.old_rows == np.arange(len(new))))
+                          and all(_same_text(old.column(name), new.column(name))
+                                  for name in TEXT_FIELDS if name not in TEXT_KEY))
+        self.events = self._events(old, new, matched, differs)
+
+    def _events(self, old_table, new_table, matched, differs):
+        events = []
+        for row in self.removed.tolist():
+            events.append({'op': 'remove', 'title': old_table.title[row],
+                           'author': old_table.author[row],
+                           'rank': int(old_table.rank[row])})
+        for row in self.changed.tolist():
+            book = {'title': new_table.title[row], 'author': new_table.author[row]}
+            if not matched[row]:
+                events.append({'op': 'insert', **book, **{
+                    name: int(new_table.column(name)[row]) for name in NUMERIC_FIELDS}})
+                continue
+            old = self.old_rows[row]
+            if differs['rank'][row]:
+                events.append({'op': 'move', **book,
+                               'from': int(old_table.rank[old]),
+                               'to': int(new_table.rank[row])})
+            if differs['discount'][row] or differs['price'][row]:
+                events.append({'op': 'reprice', **book, **{
+                    name: [int(old_table.column(name)[old]), int(new_table.column(name)[row])]
+                    for name in ('discount', 'price')}})
+        return events
+
+    def patch_ranking(self, ranked, table, formula):
+        """由舊快照的 (分數, 排序) 修補出新表的結果；無法保證與完整排序相同時回傳 None。"""
+        old_scores, old_order = ranked
+        fresh = get_formula(formula)(table.take(self.changed))
+        scores = np.empty(len(table), dtype=np.result_type(old_scores, fresh))
+        kept = np.ones(len(table), dtype=bool)
+        kept[self.changed] = False
+        scores[kept] = old_scores[self.old_rows[kept]]
+        scores[self.changed] = fresh
+        if scores.dtype.kind == 'f' and np.isnan(scores).any():
+            return None
+
+        # 沒變動的書依舊順序對應到新列號
+        new_of_old = np.full(len(old_scores), -1, dtype=np.intp)
+        new_of_old[self.old_rows[kept]] = np.flatnonzero(kept)
+        order = new_of_old[old_order]
+        order = order[order >= 0]
+        neg = -scores[order]
+        # 同分時要依新列號排列；沒變動的書相對位置改變時退回完整排序
+        if len(order) > 1 and not np.all((neg[1:] > neg[:-1]) |
+                                         ((neg[1:] == neg[:-1]) & (order[1:] > order[:-1]))):
+            return None
+
+        changed = self.changed[np.argsort(-scores[self.changed], kind='stable')]
+        positions = []
+        for row, score in zip(changed.tolist(), (-scores[changed]).tolist()):
+            left = np.searchsorted(neg, score, 'left')
+            right = np.searchsorted(neg, score, 'right')
+            positions.append(left + np.searchsorted(order[left:right], row))
+        return scores, np.insert(order, positions, changed)
+
+
+class ChangeFeed:
+    """保存最近幾次快照更新的變動，依版本讀取；可等待下一次更新。"""
+
+    def __init__(self, maxlen=100):
+        self._entries = collections.deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self.version = 0
+
+    def publish(self, snapshot, previous):
+        """記錄新快照相對於 previous 的變動；previous 為 None 時從頭開始。"""
+        with self._cond:
+            if previous is None or snapshot.changes is None:
+                self._entries.clear()
+            else:
+                self._entries.append({
+                    'version': snapshot.version,
+                    'from': previous.version,
+                    'refreshed_at': snapshot.refreshed_at,
+                    'events': snapshot.changes,
+                })
+            self.version = snapshot.version
+            self._cond.notify_all()
+
+    def since(self, version, timeout=0):
+        """回傳 version 之後的各次變動；已無法從 version 接續時回傳 None。
+
+        timeout 大於 0 且還沒有新版本時，最多等待 timeout 秒。
+        """
+        with self._cond:
+            if timeout > 0 and version >= self.version:
+                self._cond.wait_for(lambda: self.version > version, timeout)
+            if version >= self.version:
+                return []
+            entries = [entry for entry in self._entries if entry['version'] > version]
+            if not entries or entries[0]['from'] != version:
+                return None
+            return entries
@@ -0,0 +1,123 @@
+"""同時抓取多個分類與期間的排行榜，並合併成一份不重複的書單。"""
+
+import asyncio
+import functools
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from parsers import book_key
+from recommend import PARSER, TIMEOUT, parse_books
+
+BASE_URL = "https://www.books.com.tw/web/sys_saletopb/books/"
+# 中文書分類代碼（01 文學小說 ... 19 考試用書）
+CATEGORIES = ['{:02d}'.format(i) for i in range(1, 20)]
+# 排行期間：7 日、30 日
+PERIODS = [7, 30]
+# 這些狀態碼視為暫時性錯誤，會重試
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def ranking_urls(categories=CATEGORIES, periods=PERIODS, base_url=BASE_URL):
+    """產生各分類、各期間的排行榜網址。"""
+    return [f"{base_url}{cat}/?attribute={period}"
+            for cat in categories for period in periods]
+
+
+class HostRateLimiter:
+    """限制對同一主機每秒最多發出 rate 次請求。"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class Crawler:
+    """以有限的並行數抓取多個排行榜網址，解析工作交給執行緒或行程池。"""
+
+    def __init__(self, concurrency=8, per_host_rate=5.0, retries=3,
+                 backoff=0.5, backend=PARSER, executor=None, parse=None):
+        self.concurrency = concurrency
+        self.per_host_rate = per_host_rate
+        self.retries = retries
+        self.backoff = backoff
+        # 可傳入 ProcessPoolExecutor 讓解析在其他 CPU 上進行；None 為預設執行緒池
+        self.executor = executor
+        # parse(html) 可換成其他頁面的解析函式；使用行程池時必須能被 pickle
+        self.parse = parse or functools.partial(parse_books, backend=backend)
+        self.errors = {}
+
+    async def crawl(self, urls):
+        """抓取並解析所有網址，回傳 {url: 書籍列表}；失敗的網址記錄在 self.errors。"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = HostRateLimiter(self.per_host_rate)
+        timeout = aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            done = await asyncio.gather(
+                *(self._crawl_one(session, semaphore, limiter, url) for url in urls),
+                return_exceptions=True,
+            )
+        results = {}
+        self.errors = {}
+        for url, outcome in zip(urls, done):
+            if isinstance(outcome, Exception):
+                self.errors[url] = outcome
+            else:
+                results[url] = outcome
+        return results
+
+    async def _crawl_one(self, session, semaphore, limiter, url):
+        html = await self._fetch(session, semaphore, limiter, url)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.parse, html)
+
+    async def _fetch(self, session, semaphore, limiter, url):
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            await limiter.wait(host)
+            try:
+                async with semaphore:
+                    async with session.get(url) as resp:
+                        resp.raise_for_status()
+                        return await resp.text()
+            except aiohttp.ClientResponseError as exc:
+                if exc.status not in RETRY_STATUS or attempt == self.retries:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            # 指數退避加上隨機抖動，避免重試同時打到上游
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def merge_books(lists):
+    """合併多份排行榜，同一本書只保留排名最好的一筆。"""
+    merged = {}
+    for books in lists:
+        for book in books:
+            key = book_key(book)
+            kept = merged.get(key)
+            if kept is None or book.rank < kept.rank:
+                merged[key] = book
+    return list(merged.values())
+
+
+def crawl_books(urls=None, **kwargs):
+    """同步介面：抓取所有排行榜並回傳 (合併後書單, {url: 錯誤})。"""
+    crawler = Crawler(**kwargs)
+    results = asyncio.run(crawler.crawl(urls or ranking_urls()))
+    return merge_books(results.values()), crawler.errors
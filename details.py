@@ -0,0 +1,266 @@
+"""依排行榜上的商品頁連結補上書籍細節（ISBN、出版社、出版日期、頁數、分類）。
+
+- 抓取：沿用 crawler.Crawler 的有限並行數、每主機速率限制與重試。
+- 解析：商品頁很大，交給行程池在其他 CPU 上進行。
+- 快取：每個網址一個 JSON 檔 `<root>/<雜湊前兩碼>/<sha1(url)>.json`，
+  超過 ttl 秒才重新抓取，所以每次更新只會抓沒看過（或過期）的商品頁。
+- 多行程（shared=True）：抓取時持有 `<root>/enrich.lock`，同時只有一個行程在抓；
+  寫入新細節後更新 `<root>/updated` 的時間，其他行程查詢時才從檔案讀取。
+
+    enricher = Enricher(DetailCache('details'))
+    enricher.enrich(table.url)          # 同步；回傳 {url: 細節}
+    enricher.submit(table.url)          # 背景執行，之後以 enricher.get(url) 查詢
+"""
+
+import asyncio
+import concurrent.futures
+import fcntl
+import hashlib
+import html
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+from crawler import Crawler
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'details')
+DETAIL_FIELDS = ('isbn', 'publisher', 'published', 'pages', 'category')
+
+_LI_RE = re.compile(r'<li\b[^>]*>(.*?)</li>', re.I | re.S)
+_TAG_RE = re.compile(r'<[^>]+>')
+_DATE_RE = re.compile(r'(\d{4})/(\d{1,2})/(\d{1,2})')
+_PAGES_RE = re.compile(r'(\d+)\s*頁')
+_ISBN_RE = re.compile(r'[0-9Xx]{10,13}')
+
+
+def _text(fragment):
+    return html.unescape(_TAG_RE.sub('', fragment)).strip()
+
+
+def parse_detail(page):
+    """從商品頁 HTML 解析出 DETAIL_FIELDS；找不到的欄位為 None。"""
+    detail = dict.fromkeys(DETAIL_FIELDS)
+    for item in _LI_RE.findall(page):
+        label, sep, value = _text(item).partition('：')
+        if not sep:
+            continue
+        if label == 'ISBN':
+            match = _ISBN_RE.search(value)
+            detail['isbn'] = match.group().upper() if match else None
+        elif label == '出版社':
+            detail['publisher'] = value or None
+        elif label == '出版日期':
+            match = _DATE_RE.search(value)
+            if match:
+                detail['published'] = '{}-{:0>2}-{:0>2}'.format(*match.groups())
+        elif label == '規格':
+            match = _PAGES_RE.search(value)
+            detail['pages'] = int(match.group(1)) if match else None
+        elif label == '本書分類':
+            parts = [part.strip() for part in value.split('>')]
+            detail['category'] = ' > '.join(part for part in parts if part) or None
+    return detail
+
+
+class DetailCache:
+    """以網址雜湊為檔名的書籍細節快取，ttl 秒後視為過期。"""
+
+    def __init__(self, root=DEFAULT_ROOT, ttl=7 * 86400):
+        self.root = root
+        self.ttl = ttl
+        self._stamp_path = os.path.join(root, 'updated')
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + '.json')
+
+    def get(self, url):
+        """回傳 (細節, 抓取時間)；沒有紀錄時為 None。"""
+        try:
+            with open(self.path(url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry['detail'], entry['fetched_at']
+
+    def put(self, url, detail, fetched_at=None):
+        path = self.path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'url': url,
+            'fetched_at': time.time() if fetched_at is None else fetched_at,
+            'detail': detail,
+        }
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def is_fresh(self, fetched_at):
+        return time.time() - fetched_at < self.ttl
+
+    def stamp(self):
+        """最近一次 touch() 的時間（奈秒），其他行程以此得知有新細節；從未寫入時為 0。"""
+        try:
+            return os.stat(self._stamp_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def touch(self):
+        """標記快取中有新細節。"""
+        with open(self._stamp_path, 'a'):
+            pass
+        os.utime(self._stamp_path)
+
+
+class Enricher:
+    """依網址補上書籍細節：先查快取，只抓取沒看過或已過期的商品頁。
+
+    多個 worker 共用同一個快取目錄時設 shared=True：只由發布快照的 worker 呼叫 enrich/submit，
+    其他 worker 的 get() 從快取檔案讀取，version 改用快取的 stamp()。
+    """
+
+    def __init__(self, cache, concurrency=8, per_host_rate=5.0, retries=2, workers=None,
+                 shared=False):
+        self.cache = cache
+        self.shared = shared
+        self.concurrency = concurrency
+        self.per_host_rate = per_host_rate
+        self.retries = retries
+        self.workers = workers
+        # 已載入記憶體的 {url: 細節}，供請求時查詢，不必讀檔
+        self.details = {}
+        # 每次有新細節時遞增，API 以此組成 ETag（見 version）
+        self._version = 0
+        # shared 模式下 details 對應的快取 stamp()，改變時清空重新讀檔
+        self._stamp = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._queued = None
+        self._thread = None
+        self._counters = {'runs': 0, 'cached': 0, 'fetched': 0, 'errors': 0}
+
+    @property
+    def version(self):
+        return self.cache.stamp() if self.shared else self._version
+
+    def get(self, url):
+        """回傳已知的細節；還沒抓到時為 None。"""
+        if not url:
+            return None
+        if not self.shared:
+            return self.details.get(url)
+        stamp = self.cache.stamp()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self.details = {}
+        details = self.details
+        if url not in details:
+            # 沒有紀錄也記下來，快取更新前不再讀檔
+            entry = self.cache.get(url)
+            details[url] = entry[0] if entry is not None else None
+        return details[url]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['known'] = sum(detail is not None for detail in list(self.details.values()))
+        stats['running'] = self._thread is not None
+        return stats
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _executor(self):
+        if self._pool is None:
+            # 伺服器行程裡有其他執行緒，以 forkserver 建立子行程避免複製到被持有的鎖
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('forkserver'))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def enrich(self, urls):
+        """回傳 {url: 細節}；快取中有未過期紀錄的網址不重新抓取。
+
+        抓取失敗時沿用過期的紀錄（若有），沒有紀錄的網址不會出現在結果中。
+        shared 模式下持有 enrich.lock，其他行程正在抓取時先等它完成，再只抓仍缺少的網址。
+        """
+        if not self.shared:
+            return self._enrich(urls)
+        with open(os.path.join(self.cache.root, 'enrich.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._enrich(urls)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _enrich(self, urls):
+        result, missing, stale = {}, [], {}
+        for url in dict.fromkeys(u for u in urls if u):
+            entry = self.cache.get(url)
+            if entry is not None and self.cache.is_fresh(entry[1]):
+                result[url] = entry[0]
+            else:
+                missing.append(url)
+                if entry is not None:
+                    stale[url] = entry[0]
+        self._count('runs')
+        self._count('cached', len(result))
+        if missing:
+            crawler = Crawler(concurrency=self.concurrency, per_host_rate=self.per_host_rate,
+                              retries=self.retries, executor=self._executor(),
+                              parse=parse_detail)
+            fetched = asyncio.run(crawler.crawl(missing))
+            for url, detail in fetched.items():
+                self.cache.put(url, detail)
+            if fetched:
+                self.cache.touch()
+            result.update(fetched)
+            self._count('fetched', len(fetched))
+            self._count('errors', len(crawler.errors))
+            for url in crawler.errors:
+                if url in stale:
+                    result[url] = stale[url]
+        if self.shared:
+            # 其他行程與這個行程的 get() 都從快取檔案讀取
+            return result
+        new = {url: detail for url, detail in result.items() if self.details.get(url) != detail}
+        if new:
+            # 整份替換，讀取端不需要鎖
+            self.details = {**self.details, **new}
+            self._version += 1
+        return result
+
+    def submit(self, urls):
+        """在背景執行 enrich(urls)；執行中又有新要求時只保留最新的一份。"""
+        with self._lock:
+            self._queued = list(urls)
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._drain, name='enricher', daemon=True)
+            self._thread.start()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                urls, self._queued = self._queued, None
+                if urls is None:
+                    self._thread = None
+                    return
+            try:
+                self.enrich(urls)
+            except Exception as e:
+                self._count('errors')
+                log.warning("補充書籍細節失敗: %s", e)
@@ -0,0 +1,141 @@
+"""以 SQLite 保存每次抓取的排行榜快照，用來查詢書籍排名的變化。"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+from book import Book
+from parsers import normalize_text
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    taken_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_url_time ON snapshots (url, taken_at);
+-- 以 (book_id, taken_at) 為主鍵叢集存放，查詢單本書的走勢只需一次範圍掃描
+CREATE TABLE IF NOT EXISTS rankings (
+    book_id INTEGER NOT NULL REFERENCES books (id),
+    taken_at REAL NOT NULL,
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    rank INTEGER NOT NULL,
+    discount INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    PRIMARY KEY (book_id, taken_at, snapshot_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rankings_snapshot_rank ON rankings (snapshot_id, rank);
+"""
+
+
+def identity(title, author):
+    """書籍的穩定識別字串：正規化後的書名與作者。"""
+    return normalize_text(title) + '\x1f' + normalize_text(author)
+
+
+def book_hash(title, author):
+    """正規化書名與作者的 64 位元雜湊（similar.py 的書籍 id、搜尋索引檔的查表鍵）。"""
+    digest = hashlib.blake2b(identity(title, author).encode('utf-8'), digest_size=8)
+    return int.from_bytes(digest.digest(), 'big')
+
+
+class HistoryStore:
+    """排行榜快照資料庫；可在多個執行緒間共用。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._book_ids = {}  # identity -> books.id
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, books, url, taken_at=None):
+        """在單一交易中寫入一份排行榜快照，回傳快照 id。"""
+        taken_at = time.time() if taken_at is None else taken_at
+        with self._lock:
+            try:
+                with self._conn:
+                    cur = self._conn.execute(
+                        'INSERT INTO snapshots (url, taken_at) VALUES (?, ?)',
+                        (url, taken_at))
+                    snapshot_id = cur.lastrowid
+                    rows = [(self._book_id(book), taken_at, snapshot_id,
+                             book.rank, book.discount, book.price)
+                            for book in books]
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO rankings '
+                        '(book_id, taken_at, snapshot_id, rank, discount, price) '
+                        'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            except Exception:
+                # 交易已回復，剛新增的 books.id 可能不存在
+                self._book_ids.clear()
+                raise
+        return snapshot_id
+
+    def _book_id(self, book):
+        # 呼叫端需持有 self._lock 並位於交易中
+        key = identity(book.title, book.author)
+        book_id = self._book_ids.get(key)
+        if book_id is None:
+            row = self._conn.execute(
+                'INSERT INTO books (key, title, author) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET title = excluded.title, '
+                'author = excluded.author RETURNING id',
+                (key, book.title, book.author)).fetchone()
+            book_id = self._book_ids[key] = row[0]
+        return book_id
+
+    def book_history(self, title, author, since=None, until=None):
+        """回傳某本書在期間內的 [(taken_at, url, rank, discount, price), ...]。"""
+        since = 0 if since is None else since
+        until = float('inf') if until is None else until
+        with self._lock:
+            return self._conn.execute(
+                'SELECT r.taken_at, s.url, r.rank, r.discount, r.price '
+                'FROM books b JOIN rankings r ON r.book_id = b.id '
+                'JOIN snapshots s ON s.id = r.snapshot_id '
+                'WHERE b.key = ? AND r.taken_at BETWEEN ? AND ? '
+                'ORDER BY r.taken_at',
+                (identity(title, author), since, until)).fetchall()
+
+    def snapshots(self, url, since=None, limit=100):
+        """回傳某網址最近的 [(snapshot_id, taken_at), ...]，新的在前。"""
+        since = 0 if since is None else since
+        with self._lock:
+            return self._conn.execute(
+                'SELECT id, taken_at FROM snapshots '
+                'WHERE url = ? AND taken_at >= ? ORDER BY taken_at DESC LIMIT ?',
+                (url, since, limit)).fetchall()
+
+    def snapshot_books(self, snapshot_id, limit=None):
+        """依排名回傳某份快照的 Book 列表。"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT r.rank, b.title, b.author, r.discount, r.price '
+                'FROM rankings r JOIN books b ON b.id = r.book_id '
+                'WHERE r.snapshot_id = ? ORDER BY r.rank LIMIT ?',
+                (snapshot_id, -1 if limit is None else limit)).fetchall()
+        return [Book(*row) for row in rows]
+
+    def latest_books(self):
+        """回傳每本曾出現過的書最後一次被記錄時的 Book。"""
+        with self._lock:
+            # SQLite 搭配 MAX() 時，其他欄位取自最大值所在的那一列
+            rows = self._conn.execute(
+                'SELECT r.rank, b.title, b.author, r.discount, r.price, '
+                'MAX(r.taken_at) FROM rankings r JOIN books b ON b.id = r.book_id '
+                'GROUP BY r.book_id').fetchall()
+        return [Book(*row[:5]) for row in rows]
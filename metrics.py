@@ -0,0 +1,134 @@
+"""輕量的階段計時：延遲直方圖、Server-Timing 標頭與 Prometheus 文字格式輸出。
+
+    with metrics.timer('parse'):
+        ...
+
+把 ENABLED 設為 False（或呼叫 set_enabled(False)）後，timer() 回傳不做任何事的
+context manager，完全不計時。
+"""
+
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+ENABLED = True
+
+# 秒
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+
+
+def set_enabled(flag):
+    """開啟或關閉所有計時。"""
+    global ENABLED
+    ENABLED = bool(flag)
+
+
+class Histogram:
+    """依單一標籤分組的延遲直方圖。"""
+
+    def __init__(self, name, help, label, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # 標籤值 -> [各區間次數..., 超出最大區間次數]、總和
+
+    def observe(self, value, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(value)
+            if series is None:
+                series = self._series[value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += seconds
+
+    def render(self):
+        """輸出 Prometheus 文字格式的各行。"""
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {k: (list(v[0]), v[1]) for k, v in self._series.items()}
+        for value, (counts, total) in sorted(series.items()):
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('books_stage_seconds',
+                          'Time spent in each processing stage.', 'stage')
+REQUEST_SECONDS = Histogram('books_request_seconds',
+                            'HTTP request latency by endpoint.', 'endpoint')
+
+# 目前請求中各階段的 (名稱, 秒數)，供 Server-Timing 標頭使用
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+_collectors = []
+
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(self.stage, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((self.stage, elapsed))
+
+
+_NOOP = contextlib.nullcontext()
+
+
+def timer(stage):
+    """量測一個階段；停用時回傳不做事的 context manager。"""
+    if not ENABLED:
+        return _NOOP
+    return _Timer(stage)
+
+
+def begin_request():
+    """開始收集目前請求的階段時間，回傳 reset 用的 token。"""
+    return _request_timings.set([])
+
+
+def end_request(token):
+    """結束收集並回傳 Server-Timing 標頭值（沒有資料時為 None）。"""
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    if not timings:
+        return None
+    return ', '.join(f'{stage};dur={elapsed * 1000:.3f}' for stage, elapsed in timings)
+
+
+def register_collector(collect):
+    """登記一個回傳 Prometheus 文字各行的函式，在 render() 時呼叫。"""
+    _collectors.append(collect)
+
+
+def counter_lines(name, help, value, kind='counter'):
+    """產生單一計數器或量表的 Prometheus 文字各行。"""
+    return [f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {value}']
+
+
+def render():
+    """輸出所有指標的 Prometheus 文字格式。"""
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render()
+    for collect in _collectors:
+        lines.extend(collect())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,57 @@
+"""首頁 HTML 的模板與渲染；同步（Flask）與非同步（aiohttp）入口共用。"""
+
+import hashlib
+
+import jinja2
+
+import metrics
+from formulas import FORMULAS
+
+HTML_TEMPLATE = """
+<!doctype html>
+<title>Book Recommendations</title>
+<h1>Top Book Recommendations</h1>
+<form action="" method="get">
+  <label for="num">Number of recommendations:</label>
+  <input type="number" id="num" name="num" value="{{ num }}" min="1" max="20">
+  <select name="formula">
+  {% for name in formulas %}
+    <option value="{{ name }}"{% if name == formula %} selected{% endif %}>{{ name }}</option>
+  {% endfor %}
+  </select>
+  <input type="submit" value="Get Recommendations">
+</form>
+<ul>
+{% for b in books %}
+  <li>{{ loop.index }}. {{ b.title }} ({{ b.author }}) - Rank {{ b.rank }} | {{ b.discount }}折 {{ b.price }}元</li>
+{% endfor %}
+</ul>
+"""
+
+# 模板在匯入時編譯一次；與 Flask 對字串模板的設定相同，會自動跳脫 HTML
+TEMPLATE = jinja2.Environment(autoescape=True).from_string(HTML_TEMPLATE)
+# 表單允許的最大推薦數量；1..MAX_NUM 的頁面每份快照只渲染一次
+MAX_NUM = 20
+
+
+def render_page(snapshot, num, formula):
+    """渲染某份快照的推薦頁面，回傳 (HTML 位元組, ETag)。"""
+    books = snapshot.recommend(num, formula=formula)
+    with metrics.timer("render"):
+        html = TEMPLATE.render(books=books, num=num, formula=formula,
+                               formulas=FORMULAS)
+    body = html.encode("utf-8")
+    return body, hashlib.sha1(body).hexdigest()
+
+
+def cached_page(snapshot, num, formula):
+    if not 1 <= num <= MAX_NUM:
+        return render_page(snapshot, num, formula)
+    return snapshot.cached(("page", num, formula),
+                           lambda: render_page(snapshot, num, formula))
+
+
+def prerender(snapshot):
+    """在新快照上線前先渲染預設公式的所有頁面。"""
+    for num in range(1, MAX_NUM + 1):
+        cached_page(snapshot, num, "default")
@@ -0,0 +1,176 @@
+"""排行榜 HTML 的解析後端。
+
+每個後端都接收整頁 HTML，回傳與 `recommend.fetch_books()` 相同格式的 Book 列表：
+
+- `soup`：原本的 BeautifulSoup + CSS 選擇器實作，最寬鬆，作為備援。
+- `scan`：以正規表示式直接掃描 `li.item` 區塊，不建立 DOM，速度快上許多。
+"""
+
+import html as htmllib
+import re
+import unicodedata
+from urllib.parse import urlsplit, urlunsplit
+
+from bs4 import BeautifulSoup
+
+from book import Book
+
+PRICE_RE = re.compile(r'(\d+)\D*折(\d+)')
+
+
+def product_url(href):
+    """商品頁連結去掉查詢字串（例如 ?loc=P_0002_001）與錨點，作為書籍網址。"""
+    if not href:
+        return None
+    parts = urlsplit(href.strip())
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+
+def make_book(rank_text, title_text, author_text, price_text, href=None):
+    """把各欄位的文字轉成 Book，所有後端共用以確保結果一致。"""
+    rank = int(rank_text.strip())
+    title = title_text.strip()
+    author = author_text.strip().replace('作者：', '').strip()
+    # price_text like "優惠價：79折474元"
+    m = PRICE_RE.search(price_text)
+    if m:
+        discount = int(m.group(1))
+        price = int(m.group(2))
+    else:
+        discount = 100
+        price = 0
+    return Book(rank, title, author, discount, price, url=product_url(href))
+
+
+def normalize_text(text):
+    """正規化字串（全形半形、大小寫、空白），用於比對同一本書。"""
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+
+def book_key(book):
+    """以正規化後的書名與作者作為書籍的識別鍵。"""
+    return normalize_text(book.title), normalize_text(book.author)
+
+
+def parse_soup(html):
+    """以 BeautifulSoup 解析排行榜頁面。"""
+    soup = BeautifulSoup(html, "html.parser")
+    items = []
+    for li in soup.select('li.item:has(div.type02_bd-a)'):
+        rank_tag = li.select_one('p.no_list strong.no')
+        title_tag = li.select_one('div.type02_bd-a h4 a')
+        author_tag = li.select_one('ul.msg li')
+        price_text = li.select_one('li.price_a')
+        if not (rank_tag and title_tag and author_tag and price_text):
+            continue
+        items.append(make_book(rank_tag.text, title_tag.text,
+                               author_tag.text, price_text.text, title_tag.get('href')))
+    return items
+
+
+def _open_tag(tag, cls):
+    """產生比對 `<tag class="... cls ...">` 開頭標籤的正規表示式。"""
+    return (rf'<{tag}\b[^>]*?\bclass\s*=\s*["\']?(?:[^"\'>]*\s)?'
+            rf'{re.escape(cls)}(?=[\s"\'>])[^>]*>')
+
+
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.S)
+_TAG_RE = re.compile(r'<[^>]*>')
+_LI_RE = re.compile(r'<(/?)li\b[^>]*>', re.I)
+_ITEM_RE = re.compile(_open_tag('li', 'item'), re.I)
+_BD_RE = re.compile(_open_tag('div', 'type02_bd-a'), re.I)
+_RANK_RE = re.compile(_open_tag('p', 'no_list') + r'.*?' +
+                      _open_tag('strong', 'no') + r'(.*?)</strong>', re.I | re.S)
+_TITLE_RE = re.compile(r'<h4\b[^>]*>.*?<a\b([^>]*)>(.*?)</a>', re.I | re.S)
+_HREF_RE = re.compile(r'\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.I)
+_AUTHOR_RE = re.compile(_open_tag('ul', 'msg') + r'.*?<li\b[^>]*>(.*?)</li>',
+                        re.I | re.S)
+_PRICE_RE = re.compile(_open_tag('li', 'price_a') + r'(.*?)</li>', re.I | re.S)
+
+
+def _text(fragment):
+    return htmllib.unescape(_TAG_RE.sub('', fragment))
+
+
+def iter_item_blocks(html, pos=0):
+    """依序產生每個 `li.item` 的內部 HTML（不含外層標籤）與結束位置。"""
+    while True:
+        start = _ITEM_RE.search(html, pos)
+        if start is None:
+            return
+        depth = 1
+        for tag in _LI_RE.finditer(html, start.end()):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                break
+        else:
+            # 區塊尚未結束（頁面被截斷或仍在下載中）
+            return
+        yield html[start.end():tag.start()], tag.end()
+        pos = tag.end()
+
+
+def parse_item_block(block):
+    """解析單一 `li.item` 區塊；缺少必要欄位時回傳 None。"""
+    bd = _BD_RE.search(block)
+    if bd is None:
+        return None
+    rank = _RANK_RE.search(block)
+    title = _TITLE_RE.search(block, bd.end())
+    author = _AUTHOR_RE.search(block)
+    price = _PRICE_RE.search(block)
+    if not (rank and title and author and price):
+        return None
+    href = _HREF_RE.search(title.group(1))
+    if href is not None:
+        href = htmllib.unescape(next(g for g in href.groups() if g is not None))
+    return make_book(_text(rank.group(1)), _text(title.group(2)),
+                     _text(author.group(1)), _text(price.group(1)), href)
+
+
+def parse_scan(html):
+    """以正規表示式掃描 `li.item` 區塊解析排行榜頁面。"""
+    html = _COMMENT_RE.sub('', html)
+    items = []
+    for block, _ in iter_item_blocks(html):
+        book = parse_item_block(block)
+        if book is not None:
+            items.append(book)
+    return items
+
+
+class StreamScanner:
+    """逐段餵入 HTML，每當一個 `li.item` 結束就立即解析出書籍。
+
+    只保留尚未解析完的區塊，不需要在記憶體中保存整頁 HTML。
+    """
+
+    def __init__(self):
+        self._buf = ''
+
+    def feed(self, text):
+        """加入一段 HTML，回傳這段資料中已完整出現的書籍列表。"""
+        buf = _COMMENT_RE.sub('', self._buf + text)
+        # 註解尚未結束時，只掃描註解之前的部分
+        cut = buf.find('<!--')
+        scan = buf if cut < 0 else buf[:cut]
+        items = []
+        pos = 0
+        for block, end in iter_item_blocks(scan):
+            pos = end
+            book = parse_item_block(block)
+            if book is not None:
+                items.append(book)
+        rest = buf[pos:]
+        if cut < 0 and _ITEM_RE.search(scan, pos) is None:
+            # 沒有進行中的區塊，只需保留可能被切斷的最後一個標籤
+            lt = rest.rfind('<')
+            rest = rest[lt:] if lt >= 0 else ''
+        self._buf = rest
+        return items
+
+
+BACKENDS = {
+    'scan': parse_scan,
+    'soup': parse_soup,
+}
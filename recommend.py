@@ -1,63 +1,413 @@
 """從 books.com.tw 抓取排行榜並依排名與折扣推薦書籍。"""
 
-import re
+import argparse
+import asyncio
+import codecs
+import collections
+import concurrent.futures
+import glob
+import gzip
+import heapq
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import sys
+from operator import attrgetter
+
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+import metrics
+import parsers
+from archive import DEFAULT_ROOT, PageArchive, page_digest
+from cache import TTLCache
+from formulas import FORMULAS, get_formula
+from history import HistoryStore
+from table import BookTable
+from upstream import ResilientFetcher, UpstreamError
+
+log = logging.getLogger(__name__)
 
 URL = "https://www.books.com.tw/web/sys_saletopb/books/"
+# 排行榜快取秒數，過期後先回傳舊資料並於背景更新
+CACHE_TTL = 300
+# (連線逾時, 讀取逾時) 秒，避免上游卡住時佔用 worker
+TIMEOUT = (3.05, 10)
+# 預設的 HTML 解析後端，見 parsers.BACKENDS
+PARSER = 'scan'
+# 排行榜歷史資料庫，每次抓取都會寫入一份快照；設為 None 則不記錄
+HISTORY_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.sqlite3')
+# 原始頁面歸檔目錄（gzip、以內容雜湊去重）；設為 None 則不保存
+ARCHIVE_DIR = DEFAULT_ROOT
+
+
+def make_session(pool_size=10):
+    """建立可重用連線（keep-alive）的 requests.Session。"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+session = make_session()
+# 每次抓取最多嘗試 3 次、合計 10 秒；上游連續失敗時斷路，改用最後一次成功的結果
+upstream = ResilientFetcher(session, timeout=TIMEOUT)
+# 因上游失敗而改用舊資料的次數
+_fallbacks = 0
+# 目前改用舊資料的網址；只在進入與離開這個狀態時記錄，避免每次請求都寫一行
+_falling_back = set()
+# url -> _Fetched，供條件式請求與內容雜湊比對使用
+_last_fetch = {}
+
+
+class _Fetched:
+    __slots__ = ('etag', 'last_modified', 'digest', 'items')
+
+    def __init__(self, etag, last_modified, digest, items):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.items = items
 
 
-def fetch_books(url=URL):
-    """抓取排行榜上的書籍資訊並回傳為字典列表。"""
-    resp = requests.get(url)
+_archive = None
+
+
+def get_archive():
+    """取得共用的原始頁面歸檔，第一次使用時才建立。"""
+    global _archive
+    if _archive is None:
+        _archive = PageArchive(ARCHIVE_DIR)
+    return _archive
+
+
+def fetch_books(url=None):
+    """抓取排行榜上的書籍資訊並回傳為 Book 列表。
+
+    若上游回應 304 Not Modified，或頁面內容與上次完全相同（sha256 相同），
+    直接回傳上次的解析結果而不重新解析。上游失敗或斷路中時回傳最後一次成功的結果。
+    """
+    return _fetch(url or URL)[0]
+
+
+def _fetch(url):
+    # 回傳 (書籍列表, 是否為上游這次的回應)
+    previous = _last_fetch.get(url)
+    try:
+        with metrics.timer('download'):
+            resp = upstream.get(url, conditional_headers(url))
+            body = resp.content
+    except UpstreamError as e:
+        return fallback_books(url, e), False
+    upstream_recovered(url)
+    if resp.status_code == 304 and previous:
+        return previous.items, True
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-    items = []
-    for li in soup.select('li.item:has(div.type02_bd-a)'):
-        rank_tag = li.select_one('p.no_list strong.no')
-        title_tag = li.select_one('div.type02_bd-a h4 a')
-        author_tag = li.select_one('ul.msg li')
-        price_text = li.select_one('li.price_a')
-        if not (rank_tag and title_tag and author_tag and price_text):
-            continue
-        # Extract numbers
-        rank = int(rank_tag.text.strip())
-        title = title_tag.text.strip()
-        author = author_tag.text.strip().replace('作者：', '').strip()
-        # price_text like "優惠價：79折474元"
-        m = re.search(r'(\d+)\D*折(\d+)', price_text.text)
-        if m:
-            discount = int(m.group(1))
-            price = int(m.group(2))
-        else:
-            discount = 100
-            price = 0
-        items.append({
-            'rank': rank,
-            'title': title,
-            'author': author,
-            'discount': discount,
-            'price': price,
-        })
+    items = accept_page(url, body, resp.encoding or resp.apparent_encoding,
+                        resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+    return items, True
+
+
+def conditional_headers(url):
+    """回傳條件式請求標頭（If-None-Match / If-Modified-Since），讓未變動的頁面回應 304。"""
+    headers = {}
+    previous = _last_fetch.get(url)
+    if previous:
+        if previous.etag:
+            headers['If-None-Match'] = previous.etag
+        if previous.last_modified:
+            headers['If-Modified-Since'] = previous.last_modified
+    return headers
+
+
+def accept_page(url, body, encoding, etag=None, last_modified=None):
+    """處理一次成功下載的頁面並回傳 Book 列表：歸檔、內容與上次相同時沿用上次的解析結果。
+
+    同步與非同步（async_app.py）的抓取共用，呼叫端只負責下載。
+    """
+    previous = _last_fetch.get(url)
+    if ARCHIVE_DIR:
+        digest = get_archive().put(url, body, encoding)
+    else:
+        digest = page_digest(body)
+    if previous and previous.digest == digest:
+        items = previous.items
+    else:
+        with metrics.timer('parse'):
+            items = parse_books(body.decode(encoding or 'utf-8', 'replace'))
+    _last_fetch[url] = _Fetched(etag, last_modified, digest, items)
+    return items
+
+
+def fallback_books(url, error):
+    """上游失敗時改用最後一次成功的結果；從來沒有成功過時重新拋出 error。"""
+    global _fallbacks
+    previous = _last_fetch.get(url)
+    items = previous.items if previous else _archived_books(url)
+    if items is None:
+        raise error
+    _fallbacks += 1
+    if url not in _falling_back:
+        _falling_back.add(url)
+        log.warning("上游無法使用，改用最後一次成功的排行榜: %s", error)
     return items
 
 
-def recommend(n=5):
-    """依排名與折扣計算分數並回傳前 n 名書籍。"""
-    books = fetch_books()
+def upstream_recovered(url):
+    """上游再次回應時呼叫；先前改用舊資料的網址記錄一次恢復。"""
+    if url in _falling_back:
+        _falling_back.discard(url)
+        log.warning("上游已恢復: %s", url)
+
+
+def _archived_books(url):
+    """重新啟動後還沒有成功抓取過時，以歸檔中該網址最新的頁面當作最後的成功結果。"""
+    if not ARCHIVE_DIR:
+        return None
+    archive = get_archive()
+    latest = None
+    for latest in archive.entries(url):
+        pass
+    if latest is None:
+        return None
+    body = archive.get(latest['sha256'])
+    items = parse_books(body.decode(latest['encoding'] or 'utf-8', 'replace'))
+    _last_fetch[url] = _Fetched(None, None, latest['sha256'], items)
+    return items
+
+
+def upstream_stats():
+    """回傳上游請求的計數器、斷路器狀態與改用舊資料的次數。"""
+    return dict(upstream.stats(), fallbacks=_fallbacks)
+
+
+def iter_books(url=None, chunk_size=16 * 1024):
+    """以串流方式下載排行榜，每個 `li.item` 結束就立即產生該書的 Book。
+
+    斷路器打開時不連線，直接產生最後一次成功抓取的結果。
+    """
+    url = url or URL
+    previous = _last_fetch.get(url)
+    if upstream.breaker.is_open and previous:
+        yield from previous.items
+        return
+    with session.get(url, stream=True, timeout=TIMEOUT) as resp:
+        resp.raise_for_status()
+        decoder = codecs.getincrementaldecoder(resp.encoding or 'utf-8')('replace')
+        scanner = parsers.StreamScanner()
+        for chunk in resp.iter_content(chunk_size):
+            yield from scanner.feed(decoder.decode(chunk))
+        yield from scanner.feed(decoder.decode(b'', final=True))
+
+
+def parse_books(html, backend=PARSER):
+    """從排行榜 HTML 解析書籍資訊並回傳為 Book 列表。
+
+    預設使用較快的 `scan` 後端；若它解析不出任何書籍（例如頁面改版），
+    改用 BeautifulSoup 後端重試。
+    """
+    items = parsers.BACKENDS[backend](html)
+    if not items and backend != 'soup':
+        items = parsers.parse_soup(html)
+    return items
+
+
+_history = None
+
+
+def get_history():
+    """取得共用的排行榜歷史資料庫，第一次使用時才開啟。"""
+    global _history
+    if _history is None:
+        _history = HistoryStore(HISTORY_DB)
+    return _history
+
+
+def record_history(books, url):
+    """把一次抓取的結果寫入歷史資料庫；失敗時不影響推薦。"""
+    if not HISTORY_DB:
+        return
+    try:
+        get_history().record(books, url)
+    except sqlite3.Error as e:
+        log.warning("無法寫入排行榜歷史: %s", e)
+
+
+def load_table(url=None):
+    """抓取排行榜、記錄歷史並轉成欄式的 BookTable。"""
+    url = url or URL
+    books, fresh = _fetch(url)
+    return make_table(books, url, fresh)
+
+
+def make_table(books, url, fresh=True):
+    """記錄歷史並把書籍轉成 BookTable；改用舊資料（fresh=False）時不算一次新的觀測。"""
+    if fresh:
+        record_history(books, url)
+    return BookTable.from_books(books)
+
+
+async def fetch_books_async(fetcher, url=None):
+    """fetch_books() 的非同步版本，回傳 (書籍列表, 是否為上游這次的回應)。
+
+    以 upstream.AsyncFetcher 下載，不佔用執行緒；歸檔與解析交給預設的執行緒池。
+    """
+    url = url or URL
+    loop = asyncio.get_running_loop()
+    previous = _last_fetch.get(url)
+    try:
+        with metrics.timer('download'):
+            resp = await fetcher.get(url, conditional_headers(url))
+    except UpstreamError as e:
+        return await loop.run_in_executor(None, fallback_books, url, e), False
+    upstream_recovered(url)
+    if resp.status == 304 and previous:
+        return previous.items, True
+    if resp.status >= 400:
+        raise UpstreamError(f'HTTP {resp.status} from {url}')
+    items = await loop.run_in_executor(
+        None, accept_page, url, resp.body, resp.encoding,
+        resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+    return items, True
+
+
+books_cache = TTLCache(load_table, ttl=CACHE_TTL)
+
+
+def get_table(url=None):
+    """透過快取取得排行榜的 BookTable，避免每次請求都重新抓取與解析。"""
+    url = url or URL
+    return books_cache.get(url)
+
+
+def score_books(books):
+    """逐一產生附上分數的 Book；不修改傳入的紀錄（可能是快取中的上次結果）。"""
     for book in books:
         # 分數 = (101 - 排名) * 折扣，數字越大代表越推薦
-        book['score'] = (101 - book['rank']) * book['discount']
-    books.sort(key=lambda b: b['score'], reverse=True)
-    return books[:n]
+        yield book.with_score((101 - book.rank) * book.discount)
+
+
+def recommend(n=5, stream=False, formula='default'):
+    """依評分公式計算分數並回傳前 n 名書籍。
+
+    formula 為 formulas.FORMULAS 中的名稱或公式字串，預設為
+    (101 - rank) * discount。stream=True 時不經過快取，邊下載邊以預設公式評分，
+    只保留目前的前 n 名；串流模式不支援其他公式。
+    """
+    if stream:
+        if FORMULAS.get(formula, formula) != FORMULAS['default']:
+            raise ValueError(f'stream=True only supports the default formula, not {formula!r}')
+        # nlargest 與 sorted(..., reverse=True)[:n] 一樣保持同分時的原始順序
+        return heapq.nlargest(n, score_books(iter_books()), key=attrgetter('score'))
+    table = get_table()
+    with metrics.timer('score'):
+        scores = get_formula(formula)(table)
+        top = table.top(n, scores)
+    return table.rows(top, scores)
+
+
+# 批次模式接受的已存檔頁面副檔名（.gz 為 archive.py 的歸檔格式）
+PAGE_SUFFIXES = ('.html', '.htm', '.html.gz')
+
+
+def expand_paths(patterns):
+    """把檔案、目錄（遞迴尋找頁面檔）與 glob 樣式展開成排序好的檔案路徑，逐一產生。"""
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(PAGE_SUFFIXES):
+                        yield os.path.join(root, name)
+        elif glob.has_magic(pattern):
+            yield from sorted(glob.glob(pattern, recursive=True))
+        else:
+            yield pattern
+
+
+def score_file(path, n=5, formula='default', backend=PARSER):
+    """解析一個已存檔的排行榜頁面，回傳一行 JSON：檔名、書籍數與前 n 名（n 為 0 時全部）。
+
+    失敗時回傳以 "error" 開頭的紀錄，單一檔案失敗不中斷整個批次。
+    """
+    try:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            html = f.read().decode('utf-8', 'replace')
+        table = BookTable.from_books(parse_books(html, backend))
+        scores = get_formula(formula)(table)
+        top = table.top(n or len(table), scores)
+        record = {'path': path, 'books': len(table),
+                  'top': [book.to_dict() for book in table.rows(top, scores)]}
+    except Exception as e:
+        record = {'error': f'{type(e).__name__}: {e}', 'path': path}
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _score_chunk(jobs):
+    # 在子行程中連 JSON 編碼一起完成，主行程只負責寫出
+    return [score_file(*job) for job in jobs]
+
+
+def score_files(paths, n=5, formula='default', backend=PARSER, workers=None,
+                chunksize=16):
+    """以行程池平行解析並評分多個頁面，依輸入順序逐一產生 JSON 行。
+
+    每個工作處理 chunksize 個檔案，同時最多送出 2 * workers 個工作，
+    前面的結果寫出後才送出新的工作，記憶體用量與檔案總數無關。
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = ((path, n, formula, backend) for path in paths)
+    chunks = iter(lambda: list(itertools.islice(jobs, chunksize)), [])
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        pending = collections.deque(pool.submit(_score_chunk, chunk)
+                                    for chunk in itertools.islice(chunks, 2 * workers))
+        while pending:
+            lines = pending.popleft().result()
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(pool.submit(_score_chunk, chunk))
+            yield from lines
+
+
+def run_batch(args):
+    """依命令列參數執行批次評分，輸出 JSON Lines。"""
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    count = errors = 0
+    try:
+        for line in score_files(expand_paths(args.paths), args.top, args.formula,
+                                args.backend, args.workers, args.chunksize):
+            out.write(line + '\n')
+            count += 1
+            errors += line.startswith('{"error"')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{count} pages scored, {errors} failed", file=sys.stderr)
 
 
-def main():
-    """以 CLI 方式列出推薦書單。"""
-    recs = recommend()
+def main(argv=None):
+    """以 CLI 方式列出推薦書單；指定頁面檔時改為離線批次評分並輸出 JSON Lines。"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('paths', nargs='*',
+                        help='已存檔的頁面檔、目錄或 glob 樣式（例如 "archive/**/*.html.gz"）')
+    parser.add_argument('-n', '--top', type=int, default=5, help='每頁輸出前幾名，0 為全部')
+    parser.add_argument('--formula', default='default')
+    parser.add_argument('--backend', default=PARSER, choices=sorted(parsers.BACKENDS))
+    parser.add_argument('-w', '--workers', type=int, default=None, help='預設為 CPU 核心數')
+    parser.add_argument('--chunksize', type=int, default=16)
+    parser.add_argument('-o', '--output', help='輸出檔案，預設為標準輸出')
+    args = parser.parse_args(argv)
+    if args.paths:
+        run_batch(args)
+        return
+    recs = recommend(args.top, formula=args.formula)
     print("Top recommendations from books.com.tw:")
     for idx, b in enumerate(recs, 1):
-        print(f"{idx}. {b['title']} ({b['author']}) - Rank {b['rank']} | {b['discount']}折 {b['price']}元")
+        print(f"{idx}. {b.title} ({b.author}) - Rank {b.rank} | {b.discount}折 {b.price}元")
 
 
 if __name__ == "__main__":
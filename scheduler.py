@@ -0,0 +1,219 @@
+"""在背景定期重新整理排行榜，預先算好排序並以原子方式替換快照。
+
+請求處理只讀取 `RefreshScheduler.current()` 回傳的現成快照，不會在請求中抓取或解析。
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+import metrics
+from cache import SingleFlight
+from changes import ChangeFeed, Diff
+from formulas import get_formula
+
+log = logging.getLogger(__name__)
+
+
+def rank(table, formula='default'):
+    """以公式評分整份表格，回傳 (分數, 排序後的列索引)。"""
+    with metrics.timer('score'):
+        scores = get_formula(formula)(table)
+        # 穩定排序，同分時保持原始順序，與 BookTable.top() 相同
+        return scores, np.argsort(-scores, kind='stable')
+
+
+class Snapshot:
+    """一次重新整理的結果：BookTable 與各公式預先排序好的列索引。"""
+
+    def __init__(self, table, version, url, refreshed_at=None, memo=None):
+        self.table = table
+        self.version = version
+        self.url = url
+        self.refreshed_at = time.time() if refreshed_at is None else refreshed_at
+        # memo 可帶入其他地方已算好的衍生資料，例如 ('ranked', 'default')
+        self._memo = dict(memo or {})
+        self._lock = threading.Lock()
+        # 相對於上一份快照的變動（changes.Diff.events）；第一份快照為 None
+        self.changes = None
+        # 預先算好常用的衍生資料，讓請求只需讀取
+        self.ranked('default')
+        self.digest
+
+    @classmethod
+    def after(cls, previous, table, version, url, refreshed_at=None, memo=None):
+        """由上一份快照建立新快照：只重新評分有變動的書，並修補已排好的順序。"""
+        with metrics.timer('diff'):
+            diff = Diff(previous.table, table)
+        with previous._lock:
+            derived = dict(previous._memo)
+        if diff.identical:
+            # 內容完全相同，排序與渲染好的頁面都可以沿用
+            patched = derived
+        else:
+            patched = {}
+            with metrics.timer('score'):
+                for key, ranked in derived.items():
+                    if isinstance(key, tuple) and key[0] == 'ranked':
+                        result = diff.patch_ranking(ranked, table, key[1])
+                        if result is not None:
+                            patched[key] = result
+        patched.update(memo or {})
+        snapshot = cls(table, version, url, refreshed_at, patched)
+        snapshot.changes = diff.events
+        return snapshot
+
+    def cached(self, key, build):
+        """依 key 保存由這份快照算出的衍生資料（排序、渲染好的頁面等）。"""
+        value = self._memo.get(key)
+        if value is None:
+            value = build()
+            with self._lock:
+                value = self._memo.setdefault(key, value)
+        return value
+
+    @property
+    def digest(self):
+        """快照內容的版本識別，用於 ETag 與分頁游標。"""
+        return self.cached('digest', self.table.digest)
+
+    def ranked(self, formula='default'):
+        """回傳 (分數, 排序後的列索引)；每個公式在每份快照只計算一次。"""
+        return self.cached(('ranked', formula), lambda: self._rank(formula))
+
+    def _rank(self, formula):
+        return rank(self.table, formula)
+
+    def recommend(self, n=5, formula='default'):
+        """回傳前 n 名的 Book，只需取出預先排好的前 n 列。"""
+        scores, order = self.ranked(formula)
+        return self.table.rows(order[:max(n, 0)], scores)
+
+
+class RefreshScheduler:
+    """以固定間隔（加上隨機抖動）在背景執行緒重新整理排行榜。"""
+
+    def __init__(self, loader, url=None, interval=300, jitter=0.1, on_refresh=None):
+        # 以 loader(url) 載入 BookTable；url 為 None 時由 loader 決定預設網址
+        self.loader = loader
+        # 新快照替換上線前呼叫 on_refresh(snapshot)，可用來預先渲染頁面
+        self.on_refresh = on_refresh
+        self.url = url
+        self.interval = interval
+        self.jitter = jitter
+        self._snapshot = None
+        self._version = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._errors = 0
+        self._coalesced = 0
+        self._flight = SingleFlight()
+        self.changes = ChangeFeed()
+
+    def current(self):
+        """回傳目前的快照；尚未完成第一次整理時為 None。"""
+        return self._snapshot
+
+    def stats(self):
+        """回傳目前快照版本、更新時間、失敗次數與被合併的重新整理次數。"""
+        snapshot = self._snapshot
+        return {
+            'running': self.running,
+            'version': snapshot.version if snapshot else 0,
+            'refreshed_at': snapshot.refreshed_at if snapshot else None,
+            'rows': len(snapshot.table) if snapshot else 0,
+            'errors': self._errors,
+            'coalesced': self._coalesced,
+        }
+
+    def refresh(self):
+        """立即重新整理一次並替換快照，回傳新的快照。
+
+        同時有多個呼叫時（例如冷啟動時同時到達的請求）只向上游抓取一次，其餘等待同一份結果。
+        """
+        snapshot, shared = self._flight.do('refresh', self._refresh)
+        if shared:
+            with self._lock:
+                self._coalesced += 1
+        return snapshot
+
+    def _refresh(self):
+        table = self.loader(self.url)
+        with self._lock:
+            self._version += 1
+            version = self._version
+        snapshot = self._build(table, version)
+        self._install(snapshot)
+        return snapshot
+
+    def _build(self, table, version, refreshed_at=None, memo=None):
+        previous = self._snapshot
+        if previous is None:
+            return Snapshot(table, version, self.url, refreshed_at, memo)
+        return Snapshot.after(previous, table, version, self.url, refreshed_at, memo)
+
+    def _install(self, snapshot):
+        if self.on_refresh is not None:
+            self.on_refresh(snapshot)
+        previous = self._snapshot
+        # 單一屬性指派是原子的，讀取端不會看到半成品
+        self._snapshot = snapshot
+        self.changes.publish(snapshot, previous)
+
+    def start(self, wait=True):
+        """啟動背景執行緒；wait=True 時先同步完成第一次整理。"""
+        with self._start_lock:
+            if self.running:
+                return
+            self._stop.clear()
+            if wait and self._snapshot is None:
+                # 上游無法使用時照樣啟動，之後的請求或下一輪再試
+                self._safe_refresh()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(not wait,),
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """停止背景執行緒並等待它結束。"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and \
+                thread is not threading.current_thread():
+            thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self):
+        # fork 後子行程不會繼承執行緒，需要重新啟動
+        return (self._thread is not None and self._pid == os.getpid()
+                and self._thread.is_alive())
+
+    def ensure_running(self):
+        """尚未啟動（或在 fork 出的 worker 中）時啟動排程器。"""
+        if not self.running:
+            self.start()
+
+    def _next_delay(self):
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _run(self, refresh_first):
+        if refresh_first:
+            self._safe_refresh()
+        while not self._stop.wait(self._next_delay()):
+            self._safe_refresh()
+
+    def _safe_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # 保留舊快照，下一輪再試
+            self._errors += 1
+            log.warning("排行榜更新失敗: %s", e)
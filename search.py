@@ -0,0 +1,377 @@
+"""書名與作者的字元 n-gram 倒排索引，不需斷詞即可搜尋中文。
+
+每本書（以 parsers.book_key 識別）只建立一次索引：正規化後書名與作者中的每個單字元與相鄰兩字元
+（gram）都對應到一段遞增的書籍編號。索引由數個不可變的區段組成，每個區段以排序好的 gram 代碼、
+起點與書籍編號三個 NumPy 陣列存放；新快照只把沒看過的書建成新區段，大小相近的區段再合併，
+區段數維持在 O(log n)。查詢時以二分搜尋求各 gram 編號的交集，向量化地取出前幾名，
+最後才確認書名或作者真的包含整個查詢字串。
+
+多 worker 部署（shared.py）時只有發布快照的 worker 以 publish_index 把新書加入上一版的索引檔，
+沿用原本的區段、只為新書建立新區段；其他 worker 以 MappedSearchIndex 唯讀 mmap 開啟，
+倒排表與書籍資料都不複製到各 worker。
+"""
+
+import threading
+from array import array
+
+import numpy as np
+
+from book import Book
+from history import book_hash
+from parsers import book_key, normalize_text
+from shared import TextColumn, map_sections, section, text_sections, write_sections
+
+# 未知排名（例如從歷史資料庫載入、尚未出現在目前排行榜的書）排在最後
+UNRANKED = 1 << 30
+MAGIC = b'BOOKSRH1'
+_BIGRAM = 1 << 42
+_EMPTY = np.empty(0, dtype=np.uint32)
+
+
+def gram_codes(text):
+    """回傳字串所有單字元與相鄰兩字元的整數代碼。"""
+    codes = {ord(c) for c in text}
+    codes.update(_BIGRAM | ord(a) << 21 | ord(b) for a, b in zip(text, text[1:]))
+    return codes
+
+
+def query_codes(text):
+    """查詢用的代碼：兩個字以上只需 bigram，一個字用單字元。"""
+    if len(text) < 2:
+        return [ord(text)] if text else []
+    return list({_BIGRAM | ord(a) << 21 | ord(b) for a, b in zip(text, text[1:])})
+
+
+def _sort_key(rank, key):
+    return rank << 16 | min(len(key[0]), 0xffff)
+
+
+def _intersect(lists):
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        if not len(result):
+            break
+        i = np.searchsorted(other, result)
+        i[i == len(other)] = 0
+        result = result[other[i] == result]
+    return result
+
+
+class _Postings:
+    """CSR 形式的倒排表：排序好的 gram 代碼、每個代碼的起點與書籍編號。"""
+
+    __slots__ = ('codes', 'offsets', 'docs')
+
+    def __init__(self, codes, docs):
+        # 穩定排序讓同一個 gram 的書籍編號維持遞增
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        self.docs = docs[order].astype(np.uint32)
+        self.codes, starts = np.unique(codes, return_index=True)
+        self.offsets = np.append(starts, len(codes))
+
+    @classmethod
+    def from_arrays(cls, codes, offsets, docs):
+        """直接使用已排序好的陣列（例如索引檔的 mmap），不重新排序。"""
+        postings = cls.__new__(cls)
+        postings.codes, postings.offsets, postings.docs = codes, offsets, docs
+        return postings
+
+    def get(self, code):
+        i = np.searchsorted(self.codes, code)
+        if i < len(self.codes) and self.codes[i] == code:
+            return self.docs[self.offsets[i]:self.offsets[i + 1]]
+        return _EMPTY
+
+    def pairs(self):
+        return np.repeat(self.codes, np.diff(self.offsets)), self.docs
+
+    @classmethod
+    def merge(cls, postings):
+        # 依區段先後串接，較舊區段的編號都比較小
+        codes, docs = zip(*(p.pairs() for p in postings))
+        return cls(np.concatenate(codes), np.concatenate(docs))
+
+
+class _Segment:
+    __slots__ = ('size', 'title', 'author')
+
+    def __init__(self, size, title, author):
+        self.size = size
+        self.title = title
+        self.author = author
+
+    @classmethod
+    def build(cls, docs):
+        """由 [(編號, (書名, 作者)), ...] 建立區段。"""
+        columns = [(array('q'), array('q')), (array('q'), array('q'))]
+        for doc, texts in docs:
+            for text, (codes, ids) in zip(texts, columns):
+                found = gram_codes(text)
+                codes.extend(found)
+                ids.extend([doc] * len(found))
+        title, author = (_Postings(np.frombuffer(codes, np.int64),
+                                   np.frombuffer(ids, np.int64))
+                         for codes, ids in columns)
+        return cls(len(docs), title, author)
+
+    def postings(self, tier):
+        return self.author if tier else self.title
+
+    @classmethod
+    def merge(cls, segments):
+        return cls(sum(s.size for s in segments),
+                   _Postings.merge([s.title for s in segments]),
+                   _Postings.merge([s.author for s in segments]))
+
+
+class SearchIndex:
+    """可增量更新的書名／作者倒排索引；寫入需互斥，讀取不需鎖。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}        # book_key -> 書籍編號
+        self._books = []      # 編號 -> Book（最新一次看到的資料）
+        self._texts = []      # 編號 -> (正規化書名, 正規化作者)
+        # 編號 -> 排序鍵（排名 << 16 | 書名長度），越小越前面
+        self._keys = np.empty(0, dtype=np.int64)
+        self._segments = ()
+
+    def __len__(self):
+        return len(self._books)
+
+    def stats(self):
+        """回傳書籍數、區段數與倒排表大小。"""
+        segments = self._segments
+        return {
+            'books': len(self),
+            'segments': len(segments),
+            'postings': sum(len(s.title.docs) + len(s.author.docs) for s in segments),
+            'bytes': sum(a.nbytes for s in segments for p in (s.title, s.author)
+                         for a in (p.codes, p.offsets, p.docs)),
+        }
+
+    def add_books(self, books):
+        """加入一批書籍：新書建立索引，已知的書只更新資料與排名。回傳新增的數量。"""
+        with self._lock:
+            new, known = [], []
+            for book in books:
+                key = book_key(book)
+                rank = UNRANKED if book.rank is None else book.rank
+                doc = self._ids.get(key)
+                if doc is None:
+                    doc = self._ids[key] = len(self._books)
+                    self._books.append(book)
+                    self._texts.append(key)
+                    new.append((doc, key, rank))
+                else:
+                    self._books[doc] = book
+                    known.append((doc, key, rank))
+            self._grow(new + known)
+            if new:
+                segment = _Segment.build([(doc, key) for doc, key, _ in new])
+                self._segments = self._compact(self._segments + (segment,))
+        return len(new)
+
+    def add_table(self, table):
+        """加入一份 BookTable（例如新的快照）的所有書籍。"""
+        return self.add_books(table.rows(range(len(table))))
+
+    def _grow(self, changed):
+        keys = self._keys
+        if len(keys) < len(self._books):
+            # 先建好更大的陣列再替換，讀取端拿到的舊陣列仍然完整
+            keys = np.resize(keys, max(len(self._books), 2 * len(keys), 1024))
+        for doc, key, rank in changed:
+            keys[doc] = _sort_key(rank, key)
+        self._keys = keys
+
+    @staticmethod
+    def _compact(segments):
+        # 新區段不小於前一個的一半時合併，如同二進位進位
+        segments = list(segments)
+        while len(segments) > 1 and 2 * segments[-1].size >= segments[-2].size:
+            segments[-2:] = [_Segment.merge(segments[-2:])]
+        return tuple(segments)
+
+    def search(self, query, limit=20):
+        """回傳最相關的 Book 列表。
+
+        書名相符優先於只有作者相符，其次是排名較好、書名較短的書。
+        """
+        q = normalize_text(query)
+        codes = query_codes(q)
+        if not codes or limit < 1:
+            return []
+        segments, keys = self._segments, self._keys
+        results, seen = [], set()
+        for tier in (0, 1):
+            parts = [_intersect([s.postings(tier).get(code) for code in codes])
+                     for s in segments]
+            docs = np.concatenate(parts) if parts else _EMPTY
+            if len(docs):
+                self._select(q, tier, docs, keys[docs], limit, results, seen)
+            if len(results) >= limit:
+                break
+        return results
+
+    def _select(self, q, tier, docs, keys, limit, results, seen):
+        # 先取前 2 * limit 個候選確認；被排除太多時才逐步擴大
+        want = 2 * (limit - len(results))
+        done = 0
+        while True:
+            if want < len(keys):
+                picked = np.argpartition(keys, want)[:want]
+            else:
+                picked = np.arange(len(keys))
+            picked = picked[np.lexsort((docs[picked], keys[picked]))]
+            # 兩個 bigram 都出現不代表它們相連，最後以子字串確認
+            for doc in docs[picked[done:]].tolist():
+                if doc in seen or q not in self._text(doc, tier):
+                    continue
+                seen.add(doc)
+                results.append(self._book(doc))
+                if len(results) == limit:
+                    return
+            if want >= len(keys):
+                return
+            done = want
+            want *= 4
+
+    def _text(self, doc, tier):
+        return self._texts[doc][tier]
+
+    def _book(self, doc):
+        return self._books[doc]
+
+
+class MappedSearchIndex(SearchIndex):
+    """以唯讀 mmap 開啟 publish_index 寫出的索引檔；不能再加入書籍。"""
+
+    def __init__(self, path):
+        mm, header = map_sections(path, MAGIC)
+        self.path = path
+        self._keys = section(mm, header, 'keys')
+        self.hashes = section(mm, header, 'hashes')
+        self.rank, self.discount, self.price = (section(mm, header, name)
+                                                for name in ('rank', 'discount', 'price'))
+        self.title, self.author, self.ntitle, self.nauthor = (
+            TextColumn.open(mm, header, name) for name in ('title', 'author', 'ntitle', 'nauthor'))
+        tiers = [[section(mm, header, f'gram_{tier}_{name}')
+                  for name in ('codes', 'offsets', 'docs')] for tier in ('title', 'author')]
+        # 每個區段一列：[書籍數, 書名代碼起點, 書名編號起點, 作者代碼起點, 作者編號起點]
+        bounds = section(mm, header, 'segments').reshape(-1, 5).tolist()
+        ends = bounds[1:] + [[0] + [len(a) for codes, _, docs in tiers for a in (codes, docs)]]
+        segments = []
+        for i, (start, end) in enumerate(zip(bounds, ends)):
+            postings = []
+            for tier, (codes, offsets, docs) in enumerate(tiers):
+                c0, d0 = start[1 + 2 * tier:3 + 2 * tier]
+                c1, d1 = end[1 + 2 * tier:3 + 2 * tier]
+                # 每個區段的起點表比代碼多一個元素
+                postings.append(_Postings.from_arrays(codes[c0:c1], offsets[c0 + i:c1 + i + 1],
+                                                      docs[d0:d1]))
+            segments.append(_Segment(start[0], *postings))
+        self._segments = tuple(segments)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add_books(self, books):
+        raise TypeError('MappedSearchIndex is read-only, use publish_index()')
+
+    def _text(self, doc, tier):
+        return (self.nauthor if tier else self.ntitle)[doc]
+
+    def _book(self, doc):
+        rank = int(self.rank[doc])
+        return Book(None if rank < 0 else rank, self.title[doc], self.author[doc],
+                    int(self.discount[doc]), int(self.price[doc]))
+
+
+def _concat(parts, dtype):
+    return np.concatenate(parts).astype(dtype, copy=False) if parts else np.empty(0, dtype)
+
+
+def _extend_text(name, column, strings):
+    """在 column（TextColumn，可為 None）後面接上 strings，回傳 text_sections 格式的兩個區段。"""
+    (_, offsets), (_, blob) = text_sections(name, strings)
+    if column is not None:
+        offsets = np.concatenate((column.offsets, column.offsets[-1] + offsets[1:]))
+        blob = np.concatenate((column.blob, blob))
+    return [(f'{name}_offsets', offsets), (f'{name}_blob', blob)]
+
+
+def publish_index(path, books, previous=None):
+    """把 previous（MappedSearchIndex，沒有時為 None）加上 books 寫成新的索引檔，回傳新增的書數。
+
+    已知的書只更新排名、折扣與價格，書名與作者沿用第一次看到的寫法。previous 的區段原樣沿用，
+    只為新書建立一個區段，再與大小相近的區段合併。
+    """
+    books = list(books)
+    count = len(previous) if previous is not None else 0
+    known = previous.hashes if previous is not None else np.empty(0, dtype=np.uint64)
+    keys = [book_key(book) for book in books]
+    hashes = np.array([book_hash(book.title, book.author) for book in books], dtype=np.uint64)
+    # 以排序好的雜湊查出已知的書
+    sorter = np.argsort(known, kind='stable')
+    pos = np.minimum(np.searchsorted(known[sorter], hashes), max(len(known) - 1, 0))
+    found = known[sorter][pos] == hashes if len(known) else np.zeros(len(books), dtype=bool)
+    docs, new, latest = {}, [], {}
+    for i, h in enumerate(hashes.tolist()):
+        doc = docs.get(h)
+        if doc is None:
+            if found[i]:
+                doc = int(sorter[pos[i]])
+            else:
+                doc = count + len(new)
+                new.append((h, keys[i], books[i]))
+            docs[h] = doc
+        latest[doc] = (keys[i], books[i])
+
+    total = count + len(new)
+    columns = {}
+    for name in ('keys', 'rank', 'discount', 'price'):
+        column = np.empty(total, dtype=np.int64)
+        if previous is not None:
+            column[:count] = previous._keys if name == 'keys' else getattr(previous, name)
+        columns[name] = column
+    for doc, (key, book) in latest.items():
+        columns['rank'][doc] = -1 if book.rank is None else book.rank
+        columns['discount'][doc] = book.discount
+        columns['price'][doc] = book.price
+        columns['keys'][doc] = _sort_key(UNRANKED if book.rank is None else book.rank, key)
+
+    segments = list(previous._segments) if previous is not None else []
+    if new:
+        segments.append(_Segment.build([(count + i, key) for i, (_, key, _) in enumerate(new)]))
+    segments = SearchIndex._compact(segments)
+    bounds, parts = [], {}
+    sizes = {'title': [0, 0], 'author': [0, 0]}
+    for segment in segments:
+        row = [segment.size]
+        for tier, name in enumerate(('title', 'author')):
+            postings = segment.postings(tier)
+            for part in ('codes', 'offsets', 'docs'):
+                parts.setdefault(f'gram_{name}_{part}', []).append(getattr(postings, part))
+            row += sizes[name]
+            sizes[name] = [sizes[name][0] + len(postings.codes),
+                           sizes[name][1] + len(postings.docs)]
+        bounds.append(row)
+
+    sections = [(name, columns[name]) for name in ('keys', 'rank', 'discount', 'price')]
+    sections.append(('hashes', np.concatenate((known, np.array([h for h, _, _ in new],
+                                                                 dtype=np.uint64)))))
+    sections.append(('segments', np.array(bounds, dtype=np.int64).reshape(-1)))
+    for name in ('title', 'author'):
+        sections += [(f'gram_{name}_{part}', _concat(parts.get(f'gram_{name}_{part}'), dtype))
+                     for part, dtype in (('codes', np.int64), ('offsets', np.int64),
+                                         ('docs', np.uint32))]
+    for tier, name in enumerate(('title', 'author')):
+        sections += _extend_text(name, getattr(previous, name, None),
+                                 [getattr(book, name) for _, _, book in new])
+        sections += _extend_text(f'n{name}', getattr(previous, f'n{name}', None),
+                                 [key[tier] for _, key, _ in new])
+    write_sections(path, MAGIC, {'books': total}, sections)
+    return len(new)
@@ -0,0 +1,315 @@
+"""多行程部署用的共用快照：排行榜寫成二進位檔，各 worker 以唯讀 mmap 讀取。
+
+目錄結構：
+
+- `snapshot.version`：8 位元組的版本計數器，各 worker 的背景執行緒以 mmap 定期讀取這 8 位元組。
+- `snapshot-<版本>.bin`：快照內容。開頭為 magic、JSON 標頭長度與 JSON 標頭，
+  其後是 8 位元組對齊的各區段：數值欄位、預設公式的分數與排序、每列的 row_key、
+  文字欄位的位移表與 UTF-8 內容。worker 比對相鄰兩份快照時只讀數值區段，不解碼文字。
+- `refresh.lock`：只有取得這個檔案鎖的 worker 會向上游抓取並寫入新快照。
+- `<名稱>-<版本>.bin`：on_publish 為同一版本寫出的其他檔案（例如搜尋索引），與快照一起清除。
+
+數值欄位以 np.frombuffer 直接對應到 mmap，所有 worker 共用同一份 page cache，
+記憶體用量不隨 worker 數增加；上游在每個更新週期只會被抓取一次。
+"""
+
+import fcntl
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from scheduler import RefreshScheduler, rank
+from table import FIELDS, NUMERIC_FIELDS, TEXT_FIELDS, BookTable
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'BOOKSNP1'
+_VERSION = struct.Struct('<Q')
+_PREFIX = struct.Struct('<8sI')
+# 只保留最近幾個版本的快照檔；已 mmap 舊檔的 worker 在刪除後仍可讀取
+KEEP_FILES = 3
+# 背景執行緒檢查版本計數器的間隔（秒）
+POLL_INTERVAL = 1.0
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def text_sections(name, strings):
+    """把字串列表編成位移表與 UTF-8 內容兩個區段，由 TextColumn 讀回。"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return [(f'{name}_offsets', offsets),
+            (f'{name}_blob', np.frombuffer(b''.join(encoded), dtype=np.uint8))]
+
+
+def write_sections(path, magic, header, sections):
+    """把 JSON 標頭與各 NumPy 區段寫成 8 位元組對齊的檔案（先寫暫存檔再改名）。
+
+    header['sections'] 會填入每個區段的 [位移, dtype, 長度]。
+    """
+    header['sections'] = {}
+    # 標頭長度固定補到 4096 位元組以內，各區段的位移才能先算好
+    header_size = 4096
+    offset = _align(_PREFIX.size + header_size)
+    for name, array in sections:
+        header['sections'][name] = [offset, array.dtype.str, len(array)]
+        offset = _align(offset + array.nbytes)
+    raw = json.dumps(header).encode('utf-8')
+    if len(raw) > header_size:
+        raise ValueError('header too large')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_PREFIX.pack(magic, len(raw)))
+        f.write(raw)
+        for name, array in sections:
+            f.seek(header['sections'][name][0])
+            f.write(array.tobytes())
+        f.truncate(offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def map_sections(path, magic):
+    """以唯讀 mmap 開啟 write_sections 寫出的檔案，回傳 (mmap, 標頭)。"""
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    found, size = _PREFIX.unpack_from(mm, 0)
+    if found != magic:
+        raise ValueError(f'unexpected file format: {path}')
+    return mm, json.loads(mm[_PREFIX.size:_PREFIX.size + size])
+
+
+def section(mm, header, name):
+    """回傳直接對應到 mmap 的區段陣列，不複製。"""
+    offset, dtype, count = header['sections'][name]
+    return np.frombuffer(mm, dtype=dtype, count=count, offset=offset)
+
+
+def write_snapshot(path, table, scores, order, version, refreshed_at, digest=None):
+    """把 BookTable 與預先算好的分數、排序寫成快照檔。"""
+    sections = [(name, table.column(name)) for name in NUMERIC_FIELDS]
+    sections += [('score', np.ascontiguousarray(scores)),
+                 ('order', np.asarray(order, dtype=np.int64)),
+                 ('key', table.row_keys())]
+    for name in TEXT_FIELDS:
+        sections += text_sections(name, table.column(name))
+    header = {
+        'version': version,
+        'refreshed_at': refreshed_at,
+        'rows': len(table),
+        'digest': digest or table.digest(),
+    }
+    write_sections(path, MAGIC, header, sections)
+
+
+class TextColumn:
+    """mmap 中的文字欄位，只在取用某一列時才解碼。"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    @classmethod
+    def open(cls, mm, header, name):
+        """讀取 text_sections(name, ...) 寫出的兩個區段。"""
+        return cls(section(mm, header, f'{name}_offsets'), section(mm, header, f'{name}_blob'))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class MappedTable(BookTable):
+    """直接對應到快照檔 mmap 的 BookTable；數值欄位不複製。"""
+
+    def __init__(self, mm, header):
+        self._mm = mm
+        self._digest = header['digest']
+        self._text_arrays = {}
+        for name in NUMERIC_FIELDS:
+            setattr(self, name, section(mm, header, name))
+        for name in TEXT_FIELDS:
+            if f'{name}_offsets' in header['sections']:
+                setattr(self, name, TextColumn.open(mm, header, name))
+            else:
+                # 較舊版本寫出的快照檔沒有這個欄位
+                setattr(self, name, [''] * header['rows'])
+        self.scores = section(mm, header, 'score')
+        self.order = section(mm, header, 'order')
+        if 'key' in header['sections']:
+            self._row_keys = section(mm, header, 'key')
+
+    def columns(self, names=FIELDS):
+        # 文字欄位只在公式用到時才轉成陣列，並保留在這個 worker
+        columns = super().columns(names)
+        for name in TEXT_FIELDS:
+            if name not in columns:
+                continue
+            if name not in self._text_arrays:
+                array = np.empty(len(self), dtype=object)
+                array[:] = list(columns[name])
+                self._text_arrays[name] = array
+            columns[name] = self._text_arrays[name]
+        return columns
+
+    def take(self, indices):
+        # 文字欄位只解碼選取的列
+        rows = np.asarray(indices, dtype=np.intp)
+        return BookTable(*(self.column(name)[rows] if name in NUMERIC_FIELDS
+                           else [self.column(name)[i] for i in rows.tolist()]
+                           for name in FIELDS))
+
+    def digest(self):
+        return self._digest
+
+
+def open_snapshot(path):
+    """以唯讀 mmap 開啟快照檔，回傳 (MappedTable, 標頭)。"""
+    mm, header = map_sections(path, MAGIC)
+    return MappedTable(mm, header), header
+
+
+class SharedSnapshotScheduler(RefreshScheduler):
+    """讓多個 worker 共用同一份快照檔的排程器。
+
+    每個 worker 都有背景執行緒，但只有取得 refresh.lock 且發現快照已過期的 worker
+    會向上游抓取；背景執行緒每 poll_interval 秒比對一次版本計數器，發現新版本就在背景
+    載入新檔並與上一份比較，請求只讀取已載入的快照（還沒有任何快照時才同步載入）。
+    on_publish(table, version) 只在發布的 worker 中、寫好快照檔後發布前呼叫，
+    適合只需做一次的工作（例如以 file_path() 寫出同一版本的搜尋索引）。
+    """
+
+    def __init__(self, directory, loader, url=None, interval=300, jitter=0.1,
+                 on_refresh=None, on_publish=None, poll_interval=POLL_INTERVAL):
+        super().__init__(loader, url, interval, jitter, on_refresh)
+        self.on_publish = on_publish
+        self.poll_interval = poll_interval
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._version_path = os.path.join(directory, 'snapshot.version')
+        self._lock_path = os.path.join(directory, 'refresh.lock')
+        fd = os.open(self._version_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < _VERSION.size:
+                os.ftruncate(fd, _VERSION.size)
+            self._counter = mmap.mmap(fd, _VERSION.size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+
+    def file_path(self, name, version):
+        return os.path.join(self.directory, f'{name}-{version}.bin')
+
+    def snapshot_path(self, version):
+        return self.file_path('snapshot', version)
+
+    def published_version(self):
+        """目前發布的快照版本；尚未有快照時為 0。"""
+        return _VERSION.unpack_from(self._counter, 0)[0]
+
+    def current(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            # 剛啟動的 worker 沒有可用的快照，只有這時在請求中載入
+            snapshot = self.sync()
+        return snapshot
+
+    def sync(self):
+        """有比目前新的已發布版本時載入它，回傳目前的快照；由背景執行緒定期呼叫。"""
+        version = self.published_version()
+        snapshot = self._snapshot
+        if version and (snapshot is None or snapshot.version != version):
+            snapshot = self._load(version)
+        return snapshot
+
+    def _run(self, refresh_first):
+        if refresh_first:
+            self._safe_refresh()
+        next_refresh = time.monotonic() + self._next_delay()
+        while not self._stop.wait(min(self.poll_interval,
+                                      max(next_refresh - time.monotonic(), 0))):
+            if time.monotonic() >= next_refresh:
+                self._safe_refresh()
+                next_refresh = time.monotonic() + self._next_delay()
+            else:
+                self._safe_sync()
+
+    def _safe_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            # 保留目前的快照，下一次檢查再試
+            self._errors += 1
+            log.warning("載入共用快照失敗: %s", e)
+
+    def _load(self, version):
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+            table, header = open_snapshot(self.snapshot_path(version))
+            # 各 worker 與自己上一次載入的快照比較，變動紀錄在各 worker 內維護
+            snapshot = self._build(table, version, header['refreshed_at'], memo={
+                ('ranked', 'default'): (table.scores, table.order),
+                'digest': header['digest'],
+            })
+            self._install(snapshot)
+            return snapshot
+
+    def _refresh(self):
+        # 取得檔案鎖；若快照已過期才向上游抓取並發布新版本
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                version = self.published_version()
+                current = self.sync()
+                # 其他 worker 剛更新過就直接沿用
+                if current is not None and \
+                        time.time() - current.refreshed_at < self.interval / 2:
+                    return current
+                table = self.loader(self.url)
+                # 只評分並寫檔；與上一份快照的比對留給 _load，和其他 worker 一樣只做一次
+                scores, order = rank(table)
+                write_snapshot(self.snapshot_path(version + 1), table, scores, order,
+                               version + 1, time.time())
+                if self.on_publish is not None:
+                    try:
+                        self.on_publish(table, version + 1)
+                    except Exception as e:
+                        # 附屬檔案失敗不影響快照本身的發布
+                        log.warning("發布附屬檔案失敗: %s", e)
+                self._publish(version + 1)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return self.sync()
+
+    def _publish(self, version):
+        fd = os.open(self._version_path, os.O_RDWR)
+        try:
+            os.pwrite(fd, _VERSION.pack(version), 0)
+        finally:
+            os.close(fd)
+        for path in glob.glob(self.file_path('*', version - KEEP_FILES)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        return dict(super().stats(), shared=True,
+                    published_version=self.published_version())
@@ -0,0 +1,224 @@
+"""「看過這本的人也看」：以書名與作者的 TF-IDF 向量預先算好每本書最相似的 k 本書。
+
+離線建立索引（讀取歷史資料庫中看過的所有書，--crawl 另外抓取所有分類的排行榜）：
+
+    python3 similar.py [-k 20] [--crawl] [-o similar.bin]
+
+特徵為正規化書名的 2、3 字元 n-gram 與每位作者，以 TF-IDF 加權並正規化成單位向量；
+出現在太多書中的特徵視為停用詞，不參與比對。相似度只在有共同特徵的書之間以倒排表計算，
+分批向量化地累加並取出前 k 名，不需要兩兩比較。
+
+索引檔沿用 shared.py 的格式：依書籍 id 排序的 id 陣列、每本書 k 個鄰居的列號與相似度，
+以及書名、作者文字欄位。app.py 以唯讀 mmap 開啟，查詢只做一次二分搜尋並讀出 k 筆。
+"""
+
+import argparse
+import collections
+import math
+import os
+import re
+import time
+from array import array
+
+import numpy as np
+
+import recommend
+from crawler import crawl_books
+from history import HistoryStore, book_hash
+from parsers import normalize_text
+from shared import TextColumn, map_sections, section, text_sections, write_sections
+
+MAGIC = b'BOOKSIM1'
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'similar.bin')
+DEFAULT_K = 20
+# 出現在超過這個比例書籍中的特徵視為停用詞；常見字的 n-gram 權重很低，
+# 去掉後前 10 名約 99% 不變，配對數卻少了三分之二
+MAX_DF = 0.01
+# 作者特徵相對於書名 n-gram 的權重
+AUTHOR_WEIGHT = 2.0
+# 每批累加的 (書, 候選書) 配對數上限，決定建立索引時的記憶體用量
+BATCH_PAIRS = 4_000_000
+
+_AUTHORS_RE = re.compile(r'\s*[,、/;]\s*')
+
+
+def book_id(title, author):
+    """書籍的穩定 id（16 位十六進位字串），重新建立索引後不變。"""
+    return format(book_hash(title, author), '016x')
+
+
+def features(title, author):
+    """回傳 {特徵: 次數}：書名加上邊界符號後的 2、3 字元 n-gram，以及每位作者。"""
+    text = '\x02' + normalize_text(title) + '\x03'
+    counts = collections.Counter(text[i:i + n] for n in (2, 3)
+                                 for i in range(len(text) - n + 1))
+    for name in _AUTHORS_RE.split(normalize_text(author)):
+        if name:
+            counts['\x00' + name] += 1
+    return counts
+
+
+def vectorize(docs, max_df=MAX_DF, author_weight=AUTHOR_WEIGHT):
+    """把 (書名, 作者) 列表轉成 CSR 形式的 TF-IDF 矩陣，回傳 (indptr, terms, weights, df)。
+
+    向量以所有特徵正規化成單位長度，再移除停用詞與只出現在一本書的特徵（不影響相似度）。
+    """
+    vocab = {}
+    terms, tfs, indptr = array('q'), array('d'), array('q', [0])
+    for title, author in docs:
+        for feature, count in features(title, author).items():
+            terms.append(vocab.setdefault(feature, len(vocab)))
+            tf = 1 + math.log(count)
+            tfs.append(tf * author_weight if feature[0] == '\x00' else tf)
+        indptr.append(len(terms))
+    indptr = np.frombuffer(indptr, dtype=np.int64)
+    terms = np.frombuffer(terms, dtype=np.int64)
+    n = len(indptr) - 1
+    df = np.bincount(terms, minlength=len(vocab))
+    weights = np.frombuffer(tfs, dtype=np.float64) * (np.log((1 + n) / (1 + df)) + 1)[terms]
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n))
+    weights = weights / norms[rows]
+    keep = (df[terms] >= 2) & (df[terms] <= max(2, max_df * n))
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows[keep], minlength=n))))
+    return indptr, terms[keep], weights[keep], df
+
+
+def top_neighbors(indptr, terms, weights, k=DEFAULT_K, batch_pairs=BATCH_PAIRS):
+    """回傳每本書餘弦相似度最高的 k 本書：(鄰居列號 int32[n, k], 相似度 float32[n, k])。
+
+    不足 k 本時以 -1 補齊。同分時列號小的在前，結果與批次大小無關。
+    """
+    n = len(indptr) - 1
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    # 倒排表：依特徵排序的 (書, 權重)
+    order = np.argsort(terms, kind='stable')
+    post_docs, post_weights = rows[order], weights[order]
+    post_start = np.searchsorted(terms[order], np.arange(terms.max(initial=-1) + 2))
+    post_len = np.diff(post_start)
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    # 依每本書會產生的配對數切成批次
+    pairs = np.concatenate(([0], np.cumsum(post_len[terms])))
+    doc_pairs = pairs[indptr]
+    start = 0
+    while start < n:
+        stop = max(start + 1, int(np.searchsorted(doc_pairs, doc_pairs[start] + batch_pairs,
+                                                  'right')) - 1)
+        stop = min(stop, n)
+        entries = np.arange(indptr[start], indptr[stop])
+        counts = post_len[terms[entries]]
+        which = np.repeat(entries, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pos = post_start[terms[which]] + offsets
+        query, candidate = rows[which], post_docs[pos]
+        mask = query != candidate
+        keys = (query[mask] - start) * n + candidate[mask]
+        products = weights[which[mask]] * post_weights[pos[mask]]
+        order = np.argsort(keys)
+        keys = keys[order]
+        first = np.flatnonzero(np.diff(keys, prepend=-1))
+        sums = np.add.reduceat(products[order], first) if len(first) else products[:0]
+        keys = keys[first]
+        # 依 (書, 相似度由高到低) 排序；相似度量化成 32 位元，
+        # keys 已依列號排序，穩定排序讓同分時列號小的在前
+        rank = np.round((1 - np.clip(sums, 0, 1)) * 0xffffffff).astype(np.int64)
+        order = np.argsort(keys // n << 32 | rank, kind='stable')
+        query, candidate, sums = keys[order] // n + start, keys[order] % n, sums[order]
+        place = np.arange(len(query)) - np.searchsorted(query, query)
+        top = place < k
+        neighbors[query[top], place[top]] = candidate[top]
+        scores[query[top], place[top]] = sums[top]
+        start = stop
+    return neighbors, scores
+
+
+def build_index(books, path, k=DEFAULT_K, max_df=MAX_DF):
+    """以書籍（具 title、author 屬性）建立相似書索引檔，回傳書籍數。同一本書只保留一筆。"""
+    unique = {}
+    for book in books:
+        unique.setdefault(book_hash(book.title, book.author), (book.title, book.author))
+    ids = np.array(sorted(unique), dtype=np.uint64)
+    docs = [unique[int(i)] for i in ids]
+    indptr, terms, weights, _ = vectorize(docs, max_df)
+    neighbors, scores = top_neighbors(indptr, terms, weights, k)
+    sections = [('ids', ids), ('neighbors', neighbors.ravel()),
+                # 相似度只用來顯示與排序，半精度已足夠
+                ('scores', scores.astype(np.float16).ravel())]
+    sections += text_sections('title', [title for title, _ in docs])
+    sections += text_sections('author', [author for _, author in docs])
+    header = {'rows': len(docs), 'k': k, 'max_df': max_df, 'built_at': time.time()}
+    write_sections(path, MAGIC, header, sections)
+    return len(docs)
+
+
+class SimilarIndex:
+    """以唯讀 mmap 開啟的相似書索引；多個 worker 共用同一份 page cache。"""
+
+    def __init__(self, path):
+        mm, header = map_sections(path, MAGIC)
+        self.path = path
+        self.k = header['k']
+        self.built_at = header['built_at']
+        self.ids = section(mm, header, 'ids')
+        self.neighbors = section(mm, header, 'neighbors').reshape(-1, self.k)
+        self.scores = section(mm, header, 'scores').reshape(-1, self.k)
+        self.title = TextColumn.open(mm, header, 'title')
+        self.author = TextColumn.open(mm, header, 'author')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def stats(self):
+        return {'books': len(self), 'k': self.k, 'built_at': self.built_at}
+
+    def find(self, id):
+        """回傳書籍 id 所在的列號；不在索引中時為 None。"""
+        try:
+            key = np.uint64(int(id, 16))
+        except (ValueError, OverflowError):
+            return None
+        row = int(np.searchsorted(self.ids, key))
+        return row if row < len(self.ids) and self.ids[row] == key else None
+
+    def book(self, row):
+        return {'id': format(int(self.ids[row]), '016x'),
+                'title': self.title[row], 'author': self.author[row]}
+
+    def similar(self, id, limit=None):
+        """回傳 {'book': 書籍, 'similar': 最多 limit 本相似書（附 score）}；id 不存在時為 None。"""
+        row = self.find(id)
+        if row is None:
+            return None
+        similar = []
+        for other, score in zip(self.neighbors[row, :limit], self.scores[row, :limit]):
+            if other < 0:
+                break
+            similar.append(dict(self.book(other), score=round(float(score), 4)))
+        return {'book': self.book(row), 'similar': similar}
+
+
+def main(argv=None):
+    """從歷史資料庫（與 --crawl 抓取的排行榜）建立相似書索引。"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('-o', '--output', default=DEFAULT_PATH)
+    parser.add_argument('-k', type=int, default=DEFAULT_K, help='每本書保留的相似書數量')
+    parser.add_argument('--history', default=recommend.HISTORY_DB)
+    parser.add_argument('--crawl', action='store_true', help='另外抓取所有分類與期間的排行榜')
+    parser.add_argument('--max-df', type=float, default=MAX_DF)
+    args = parser.parse_args(argv)
+    books = []
+    if args.history and os.path.exists(args.history):
+        books += HistoryStore(args.history).latest_books()
+    if args.crawl:
+        crawled, errors = crawl_books()
+        books += crawled
+        for url, error in errors.items():
+            print(f"{url}: {error}")
+    start = time.perf_counter()
+    count = build_index(books, args.output, args.k, args.max_df)
+    print(f"{count} books indexed in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
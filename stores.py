@@ -0,0 +1,253 @@
+"""合併多家書店的暢銷榜：每家書店是一個 Store（網址清單加上 extractor），並行抓取後以雜湊索引去除重複。
+
+    entries, errors = aggregate(['books', 'mystore'])
+    register(Store('mystore', ['https://mystore.example/top'], parse_jsonld))
+
+內建的 'books' 書店沒有固定網址，每次抓取時才讀取 recommend.URL，執行中更換網址也會生效。
+
+extractor 接收整頁 HTML、回傳 Book 列表（rank 為該書店的名次），使用行程池解析時必須能被 pickle。
+有 schema.org ItemList（JSON-LD）標記的書店可直接使用 parse_jsonld。
+
+合併時每本書以 ISBN（統一成 ISBN-13）或正規化後的書名與作者查表，兩種鍵都登記在索引中，
+所以只有部分書店提供 ISBN、或書名寫法不同但 ISBN 相同時都能合併；整個過程只走過一次所有書。
+"""
+
+import asyncio
+import json
+import logging
+import re
+
+import recommend
+from book import Book
+from crawler import Crawler
+from parsers import book_key
+from recommend import parse_books, record_history
+from table import BookTable
+from upstream import UpstreamError
+
+log = logging.getLogger(__name__)
+
+_JSONLD_RE = re.compile(
+    r'<script\b[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.I | re.S)
+
+
+class Store:
+    """一家書店的暢銷榜來源：名稱、排行榜網址與 extract(html) -> Book 列表。
+
+    urls 為 None 時使用抓取當下的 recommend.URL。
+    """
+
+    def __init__(self, name, urls, extract):
+        self.name = name
+        self.urls = None if urls is None else list(urls)
+        self.extract = extract
+
+    def page_urls(self):
+        return [recommend.URL] if self.urls is None else self.urls
+
+    def __repr__(self):
+        return f'Store({self.name!r}, {len(self.page_urls())} urls)'
+
+
+# 已註冊的書店，以名稱選用
+STORES = {}
+
+
+def register(store):
+    """註冊書店；同名時取代原本的設定。"""
+    STORES[store.name] = store
+    return store
+
+
+register(Store('books', None, parse_books))
+
+
+def normalize_isbn(isbn):
+    """去掉連字號與空白並統一成 ISBN-13；不是合法長度時回傳 None。"""
+    if not isbn:
+        return None
+    digits = re.sub(r'[^0-9Xx]', '', str(isbn)).upper()
+    if len(digits) == 10:
+        body = '978' + digits[:9]
+        check = -sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body)) % 10
+        return body + str(check)
+    return digits if len(digits) == 13 and digits.isdigit() else None
+
+
+def _name(value):
+    if isinstance(value, list):
+        return '、'.join(filter(None, (_name(v) for v in value)))
+    if isinstance(value, dict):
+        return value.get('name') or ''
+    return value or ''
+
+
+def _price(offers):
+    """回傳 (折扣, 售價)；有 ListPrice 時以售價 / 定價計算折扣，沒有則視為不打折。"""
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    try:
+        price = round(float(offers.get('price') or 0))
+    except (TypeError, ValueError):
+        return 100, 0
+    specs = offers.get('priceSpecification') or []
+    for spec in specs if isinstance(specs, list) else [specs]:
+        if 'ListPrice' in str(spec.get('priceType', '')):
+            try:
+                list_price = float(spec['price'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if list_price > 0 and price:
+                return min(100, round(price * 100 / list_price)), price
+    return 100, price
+
+
+def _list_items(data):
+    if isinstance(data, list):
+        for value in data:
+            yield from _list_items(value)
+    elif isinstance(data, dict):
+        if data.get('@type') == 'ItemList':
+            yield from data.get('itemListElement') or []
+        for value in data.get('@graph') or []:
+            yield from _list_items(value)
+
+
+def parse_jsonld(html):
+    """從頁面中 schema.org ItemList 的 JSON-LD 解析出 Book 列表；名次取 position，沒有時依順序。"""
+    books = []
+    for block in _JSONLD_RE.findall(html):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        for i, element in enumerate(_list_items(data), len(books) + 1):
+            item = element.get('item', element) if isinstance(element, dict) else None
+            if not isinstance(item, dict) or not item.get('name'):
+                continue
+            discount, price = _price(item.get('offers') or {})
+            books.append(Book(int(element.get('position') or i), item['name'].strip(),
+                              _name(item.get('author')).strip(), discount, price,
+                              url=item.get('url'), isbn=normalize_isbn(item.get('isbn'))))
+    return books
+
+
+class Entry:
+    """合併後的一本書：book 為名次最好的一筆，ranks 為 {書店: 名次}。"""
+
+    __slots__ = ('book', 'isbn', 'ranks')
+
+    def __init__(self, book, store):
+        self.book = book
+        self.isbn = normalize_isbn(book.isbn)
+        self.ranks = {store: book.rank}
+
+    def add(self, book, store):
+        if book.rank < self.ranks.get(store, book.rank + 1):
+            self.ranks[store] = book.rank
+        if book.rank < self.book.rank:
+            self.book = book
+        self.isbn = self.isbn or normalize_isbn(book.isbn)
+
+    def to_book(self):
+        """名次最好的一筆，ISBN 換成合併後的 ISBN。"""
+        book = self.book
+        return Book(book.rank, book.title, book.author, book.discount, book.price,
+                    url=book.url, isbn=self.isbn)
+
+    def to_dict(self):
+        return dict(self.book.to_dict(), isbn=self.isbn, stores=self.ranks)
+
+
+def merge_listings(listings):
+    """以雜湊索引合併 (書店名稱, Book 列表) 序列，依第一次出現的順序回傳 Entry 列表。"""
+    by_isbn, by_name, entries = {}, {}, []
+    for store, books in listings:
+        for book in books:
+            isbn = normalize_isbn(book.isbn)
+            name = book_key(book)
+            entry = (by_isbn.get(isbn) if isbn else None) or by_name.get(name)
+            if entry is None:
+                entry = Entry(book, store)
+                entries.append(entry)
+            else:
+                entry.add(book, store)
+            # 兩種鍵都指向同一筆，之後只有其中一種鍵相符的書也能合併
+            if isbn:
+                by_isbn.setdefault(isbn, entry)
+            by_name.setdefault(name, entry)
+    return entries
+
+
+def resolve(stores=None):
+    """把書店名稱換成已註冊的 Store；預設為所有已註冊的書店。"""
+    resolved = []
+    for store in stores or list(STORES):
+        if isinstance(store, str):
+            if store not in STORES:
+                raise ValueError(f'unknown store: {store} (registered: {", ".join(STORES)})')
+            store = STORES[store]
+        resolved.append(store)
+    return resolved
+
+
+async def _crawl_stores(stores, kwargs):
+    """回傳 ([(書店名稱, 網址, Book 列表或 None), ...], {url: 錯誤})；抓取失敗的頁面為 None。"""
+    crawlers = [Crawler(parse=store.extract, **kwargs) for store in stores]
+    urls = [store.page_urls() for store in stores]
+    results = await asyncio.gather(*(crawler.crawl(page_urls)
+                                     for crawler, page_urls in zip(crawlers, urls)))
+    listings, errors = [], {}
+    for store, crawler, page_urls, pages in zip(stores, crawlers, urls, results):
+        # 依網址順序合併，結果與抓取完成的先後無關
+        listings += [(store.name, url, pages.get(url)) for url in page_urls]
+        errors.update(crawler.errors)
+    return listings, errors
+
+
+def aggregate(stores=None, **kwargs):
+    """同時抓取多家書店並合併，回傳 (Entry 列表, {url: 錯誤})。
+
+    stores 為書店名稱或 Store 的列表，預設為所有已註冊的書店；其餘參數傳給 crawler.Crawler。
+    """
+    listings, errors = asyncio.run(_crawl_stores(resolve(stores), kwargs))
+    return merge_listings((name, books) for name, _, books in listings
+                          if books is not None), errors
+
+
+def table_loader(stores=None, **kwargs):
+    """回傳給 RefreshScheduler 使用的 loader(url)：每次呼叫都重新抓取並合併這些書店。
+
+    成功的頁面與單一書店模式一樣寫入歷史資料庫；失敗的頁面沿用該頁最後一次成功的結果，
+    全部失敗且沒有任何舊結果時拋出 UpstreamError。表格帶有合併後的 ISBN 與各書店的名次。
+    """
+    stores = resolve(stores)
+    # 網址 -> 最後一次成功的 Book 列表；失敗中的網址只在開始失敗與恢復時各記錄一次
+    last, failing = {}, set()
+
+    def load(url=None):
+        pages, errors = asyncio.run(_crawl_stores(stores, kwargs))
+        listings = []
+        for name, page_url, books in pages:
+            if books is not None:
+                if page_url in failing:
+                    failing.discard(page_url)
+                    log.warning("已恢復: %s", page_url)
+                last[page_url] = books
+                record_history(books, page_url)
+            else:
+                if page_url not in failing:
+                    failing.add(page_url)
+                    log.warning("無法抓取 %s，改用最後一次成功的結果: %s",
+                                page_url, errors.get(page_url))
+                books = last.get(page_url)
+                if books is None:
+                    continue
+            listings.append((name, books))
+        if not listings:
+            raise UpstreamError(f'all {len(pages)} store pages failed')
+        entries = merge_listings(listings)
+        return BookTable.from_books([entry.to_book() for entry in entries],
+                                    stores=[entry.ranks for entry in entries])
+    return load
@@ -0,0 +1,130 @@
+"""以欄為單位保存書籍資料，分數以 NumPy 向量運算，前 n 名以部分選取取得。"""
+
+import hashlib
+import json
+
+import numpy as np
+
+from book import Book
+
+NUMERIC_FIELDS = ('rank', 'discount', 'price')
+# url 是商品頁網址、isbn 為 ISBN-13、stores 為合併多家書店時各店名次的 JSON（沒有時皆為空字串），
+# 只隨表格保存，不提供給評分公式
+TEXT_FIELDS = ('title', 'author', 'url', 'isbn', 'stores')
+FIELDS = ('rank', 'title', 'author', 'discount', 'price')
+
+
+def row_key(title, author):
+    """原始書名與作者的 64 位元雜湊，用來比對兩份表格中的同一列；在不同行程中也相同。"""
+    digest = hashlib.blake2b(f'{title}\x1f{author}'.encode('utf-8'), digest_size=8)
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def _text_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class BookTable:
+    """書籍的欄式表格：數值欄位為整數陣列，文字欄位為 object 陣列。"""
+
+    def __init__(self, rank, title, author, discount, price, url=None, isbn=None, stores=None):
+        self.rank = np.asarray(rank, dtype=np.int64)
+        self.title = _text_array(title)
+        self.author = _text_array(author)
+        self.discount = np.asarray(discount, dtype=np.int64)
+        self.price = np.asarray(price, dtype=np.int64)
+        empty = [''] * len(self.title)
+        self.url = _text_array(empty if url is None else url)
+        self.isbn = _text_array(empty if isbn is None else isbn)
+        self.stores = _text_array(empty if stores is None else stores)
+
+    @classmethod
+    def from_books(cls, books, stores=None):
+        """由 Book 列表建立表格；stores 為每本書的 {書店: 名次}（合併多家書店時）。"""
+        books = list(books)
+        return cls(
+            [b.rank for b in books],
+            [b.title for b in books],
+            [b.author for b in books],
+            [b.discount for b in books],
+            [b.price for b in books],
+            [b.url or '' for b in books],
+            [b.isbn or '' for b in books],
+            None if stores is None else
+            [json.dumps(ranks, ensure_ascii=False, separators=(',', ':')) if ranks else ''
+             for ranks in stores],
+        )
+
+    def __len__(self):
+        return len(self.title)
+
+    def column(self, name):
+        return getattr(self, name)
+
+    def columns(self, names=FIELDS):
+        """回傳 {欄位名稱: 陣列}，供評分公式使用；names 可只取公式用到的欄位。"""
+        return {name: self.column(name) for name in names}
+
+    def row_keys(self, compute=True):
+        """每一列的 row_key（uint64 陣列）；同一份表格只計算一次，compute=False 時沒算過就回傳 None。"""
+        keys = getattr(self, '_row_keys', None)
+        if keys is None and compute:
+            keys = np.fromiter((row_key(title, author)
+                                for title, author in zip(self.title, self.author)),
+                               dtype=np.uint64, count=len(self))
+            self._row_keys = keys
+        return keys
+
+    def score(self):
+        """分數 = (101 - 排名) * 折扣，數字越大代表越推薦。"""
+        return (101 - self.rank) * self.discount
+
+    def top(self, n, scores=None):
+        """回傳分數前 n 名的列索引，同分時保持原始順序（與穩定排序相同）。"""
+        if scores is None:
+            scores = self.score()
+        size = len(scores)
+        n = max(0, min(n, size))
+        if n == 0:
+            return np.empty(0, dtype=np.intp)
+        if n < size:
+            # 第 n 大的分數；大於它的全部入選，等於它的依原始順序補滿
+            kth = np.partition(scores, size - n)[size - n]
+            above = np.flatnonzero(scores > kth)
+            ties = np.flatnonzero(scores == kth)[:n - len(above)]
+            idx = np.sort(np.concatenate([above, ties]))
+        else:
+            idx = np.arange(size)
+        return idx[np.argsort(-scores[idx], kind='stable')]
+
+    def take(self, indices):
+        """回傳只含指定列的新表格。"""
+        return BookTable(*(self.column(name)[indices] for name in FIELDS))
+
+    def rows(self, indices, scores=None):
+        """把指定列轉回 Book；給定 scores 時附上分數。"""
+        return [Book(int(self.rank[i]), self.title[i], self.author[i],
+                     int(self.discount[i]), int(self.price[i]),
+                     None if scores is None else scores[i].item(), self.url[i] or None,
+                     self.isbn[i] or None)
+                for i in indices]
+
+    def store_ranks(self, i):
+        """第 i 列在各書店的名次 {書店: 名次}；不是合併多家書店的表格時為 None。"""
+        ranks = self.stores[i]
+        return json.loads(ranks) if ranks else None
+
+    def digest(self):
+        """以表格內容計算的雜湊，內容相同的表格（即使在不同行程）得到相同的值。"""
+        h = hashlib.sha1()
+        for name in NUMERIC_FIELDS:
+            h.update(self.column(name).tobytes())
+        for name in TEXT_FIELDS:
+            h.update('\x1f'.join(self.column(name)).encode('utf-8'))
+        return h.hexdigest()
+
+    def to_books(self):
+        """轉回 Book 列表。"""
+        return self.rows(range(len(self)))
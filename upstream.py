@@ -0,0 +1,326 @@
+"""對上游（books.com.tw）的容錯請求：每次嘗試的期限、抖動退避重試、對沖請求與斷路器。
+
+    fetcher = ResilientFetcher(session)
+    resp = fetcher.get(url, headers)   # 失敗時拋出 UpstreamError
+
+- 每次嘗試在背景執行緒送出，呼叫端最多等待 attempt_deadline 秒；所有重試合計不超過 deadline 秒。
+- 連線錯誤、逾時、5xx 與 429 會以 full jitter 指數退避重試，其他 4xx 直接回傳給呼叫端。
+- 最近成功請求的延遲超過 hedge_percentile 百分位（最多 attempt_deadline 的一半）仍未回應時，
+  再送出一個相同的請求，先完成者勝出；超過 attempt_deadline 才完成的請求不列入延遲統計。
+- 連續失敗 failure_threshold 次後斷路器打開，reset_timeout 秒內直接拋出 CircuitOpenError，
+  之後只放行一個試探請求，成功才恢復。
+
+AsyncFetcher 是給事件迴圈（async_app.py）用的 aiohttp 版本，期限、重試與斷路器的規則相同，
+但不送對沖請求。
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import random
+import threading
+import time
+
+import aiohttp
+import requests
+
+
+class UpstreamError(Exception):
+    """上游在期限內沒有成功回應。"""
+
+
+class CircuitOpenError(UpstreamError):
+    """斷路器打開中，沒有送出請求。"""
+
+
+class CircuitBreaker:
+    """連續失敗達門檻即打開的斷路器；冷卻後以單一試探請求決定是否恢復。"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = 'closed'
+        self.opened = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """斷路器打開且尚未到可以試探的時間。"""
+        return self.state == 'open' and \
+            self.clock() - self._opened_at < self.reset_timeout
+
+    def allow(self):
+        """回傳現在能否送出請求；半開狀態同時只放行一個試探請求。"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == 'half_open' or (self.state == 'closed' and
+                                             self._failures >= self.failure_threshold):
+                self.state = 'open'
+                self._opened_at = self.clock()
+                self.opened += 1
+
+
+class LatencyWindow:
+    """保留最近幾次成功請求的延遲，用來決定何時送出對沖請求。"""
+
+    def __init__(self, size=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = collections.deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, p):
+        """回傳第 p（0..1）百分位的延遲；樣本不足時為 None。"""
+        samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+class ResilientFetcher:
+    """以 requests.Session 送出帶期限、重試、對沖與斷路器的 GET。"""
+
+    def __init__(self, session, timeout=(3.05, 10), attempts=3, attempt_deadline=4.0,
+                 deadline=10.0, backoff=0.2, hedge_percentile=0.95, hedge_min_delay=0.05,
+                 breaker=None, max_workers=8):
+        self.session = session
+        # 傳給 requests 的 (連線, 讀取) 逾時；attempt_deadline 則限制整個回應的等待時間
+        self.timeout = timeout
+        self.attempts = attempts
+        self.attempt_deadline = attempt_deadline
+        self.deadline = deadline
+        self.backoff = backoff
+        # 設為 None 停用對沖請求
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix='upstream')
+        self._lock = threading.Lock()
+        self._counters = {
+            'requests': 0,
+            'retries': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'rejected': 0,
+        }
+
+    def stats(self):
+        """回傳各計數器、斷路器狀態與目前的對沖延遲。"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['circuit'] = self.breaker.state
+        stats['circuit_opened'] = self.breaker.opened
+        stats['hedge_delay'] = self._hedge_delay()
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, url, headers=None):
+        """送出 GET 並回傳已讀完內容的 Response；期限內無法成功時拋出 UpstreamError。"""
+        deadline = time.monotonic() + self.deadline
+        error = None
+        for attempt in range(self.attempts):
+            if attempt:
+                # full jitter：在 [0, backoff * 2^(attempt-1)] 之間隨機等待
+                delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+                if time.monotonic() + delay >= deadline:
+                    break
+                self._count('retries')
+                time.sleep(delay)
+            if not self.breaker.allow():
+                self._count('rejected')
+                raise CircuitOpenError(f'circuit open for {url}') from error
+            budget = deadline - time.monotonic()
+            if budget <= 0:
+                break
+            try:
+                resp = self._attempt(url, headers, min(self.attempt_deadline, budget))
+            except (UpstreamError, requests.RequestException) as e:
+                self.breaker.record_failure()
+                self._count('failures')
+                error = e
+                continue
+            self.breaker.record_success()
+            return resp
+        raise UpstreamError(f'{url}: {error or "deadline exceeded"}') from error
+
+    def _hedge_delay(self):
+        if self.hedge_percentile is None:
+            return None
+        delay = self.latency.percentile(self.hedge_percentile)
+        if delay is None:
+            return None
+        # 延遲分布被拉長時仍要在期限內留下對沖請求的時間
+        return max(min(delay, self.attempt_deadline / 2), self.hedge_min_delay)
+
+    def _attempt(self, url, headers, budget):
+        start = time.monotonic()
+        self._count('requests')
+        first = self._pool.submit(self._send, url, headers)
+        pending = {first}
+        hedge = self._hedge_delay()
+        hedged = False
+        error = None
+        while pending:
+            remaining = budget - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            wait = remaining
+            if not hedged and hedge is not None:
+                wait = min(wait, max(hedge - (time.monotonic() - start), 0))
+            done, pending = concurrent.futures.wait(
+                pending, wait, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    resp = future.result()
+                except (UpstreamError, requests.RequestException) as e:
+                    error = error or e
+                    continue
+                if future is not first:
+                    self._count('hedge_wins')
+                return resp
+            if not hedged and hedge is not None and not done and \
+                    time.monotonic() - start >= hedge:
+                # 第一個請求比平常慢，再送一個相同的請求，先完成者勝出
+                hedged = True
+                self._count('hedges')
+                pending.add(self._pool.submit(self._send, url, headers))
+        if error is not None and not pending:
+            raise error
+        # 未完成的請求留在背景，由 requests 的逾時結束
+        self._count('timeouts')
+        raise UpstreamError(f'no response within {budget:.2f}s')
+
+    def _send(self, url, headers):
+        start = time.monotonic()
+        resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        # 在這個執行緒讀完內容，呼叫端的期限涵蓋整個下載
+        resp.content
+        if resp.status_code >= 500 or resp.status_code == 429:
+            raise UpstreamError(f'HTTP {resp.status_code} from {url}')
+        elapsed = time.monotonic() - start
+        # 呼叫端已放棄等待的回應不列入，否則停滯期間的延遲會把對沖時間越推越晚
+        if elapsed <= self.attempt_deadline:
+            self.latency.add(elapsed)
+        return resp
+
+
+class FetchResult:
+    """AsyncFetcher 讀完內容的回應。"""
+
+    __slots__ = ('status', 'headers', 'body', 'encoding')
+
+    def __init__(self, status, headers, body, encoding):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.encoding = encoding
+
+
+class AsyncFetcher:
+    """以 aiohttp 送出帶期限、重試與斷路器的 GET；必須在同一個事件迴圈中使用與關閉。"""
+
+    def __init__(self, timeout=(3.05, 10), attempts=3, attempt_deadline=4.0, deadline=10.0,
+                 backoff=0.2, breaker=None, connections=10):
+        self.timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        self.attempts = attempts
+        self.attempt_deadline = attempt_deadline
+        self.deadline = deadline
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.connections = connections
+        self._session = None
+        self._counters = {
+            'requests': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'failures': 0,
+            'rejected': 0,
+        }
+
+    def stats(self):
+        stats = dict(self._counters)
+        stats['circuit'] = self.breaker.state
+        stats['circuit_opened'] = self.breaker.opened
+        return stats
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get(self, url, headers=None):
+        """送出 GET 並回傳 FetchResult；期限內無法成功時拋出 UpstreamError。"""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=self.timeout, connector=aiohttp.TCPConnector(limit=self.connections))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        error = None
+        for attempt in range(self.attempts):
+            if attempt:
+                delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+                if loop.time() + delay >= deadline:
+                    break
+                self._counters['retries'] += 1
+                await asyncio.sleep(delay)
+            if not self.breaker.allow():
+                self._counters['rejected'] += 1
+                raise CircuitOpenError(f'circuit open for {url}') from error
+            budget = deadline - loop.time()
+            if budget <= 0:
+                break
+            self._counters['requests'] += 1
+            try:
+                async with asyncio.timeout(min(self.attempt_deadline, budget)):
+                    result = await self._send(url, headers)
+            except TimeoutError as e:
+                self._counters['timeouts'] += 1
+                error = e
+            except (UpstreamError, aiohttp.ClientError) as e:
+                error = e
+            else:
+                self.breaker.record_success()
+                return result
+            self.breaker.record_failure()
+            self._counters['failures'] += 1
+        raise UpstreamError(f'{url}: {error or "deadline exceeded"}') from error
+
+    async def _send(self, url, headers):
+        async with self._session.get(url, headers=headers) as resp:
+            body = await resp.read()
+            if resp.status >= 500 or resp.status == 429:
+                raise UpstreamError(f'HTTP {resp.status} from {url}')
+            return FetchResult(resp.status, resp.headers, body, resp.charset)